@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UploadedImage, DetectionResult
+from .models import UploadedImage, DetectionResult, FilterPreset
 
 
 @admin.register(UploadedImage)
@@ -26,4 +26,11 @@ class DetectionResultAdmin(admin.ModelAdmin):
     
     def onnx_detections_count(self, obj):
         return len(obj.onnx_detections)
-    onnx_detections_count.short_description = 'ONNX Detections' 
\ No newline at end of file
+    onnx_detections_count.short_description = 'ONNX Detections' 
+
+
+@admin.register(FilterPreset)
+class FilterPresetAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'camera', 'created_at']
+    search_fields = ['name', 'camera']
+    readonly_fields = ['created_at']
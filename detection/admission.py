@@ -0,0 +1,165 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Lower rank is served first when a slot frees up
+PRIORITIES = {'interactive': 0, 'bulk': 1, 'stream': 2}
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of queued for inference"""
+
+    def __init__(self, priority, retry_after, reason):
+        super().__init__(f"Inference is overloaded ({reason}), retry in {retry_after}s")
+        self.priority = priority
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ('rank', 'seq', 'event', 'granted')
+
+    def __init__(self, rank, seq):
+        self.rank = rank
+        self.seq = seq
+        self.event = threading.Event()
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class AdmissionController:
+    """Concurrency limiter with bounded per-priority wait queues
+
+    At most max_concurrent requests run inference at once. Others wait in a
+    priority queue; when a class's queue is full, or a waiter times out, the
+    request is shed with a Retry-After estimated from the current service rate.
+    """
+
+    def __init__(self, max_concurrent=None, queue_limits=None, queue_timeouts=None):
+        self.max_concurrent = max_concurrent or settings.INFERENCE_MAX_CONCURRENCY
+        self.queue_limits = queue_limits or settings.INFERENCE_QUEUE_LIMITS
+        self.queue_timeouts = queue_timeouts or settings.INFERENCE_QUEUE_TIMEOUTS
+        self._lock = threading.Lock()
+        self._waiters = []  # heap of _Waiter
+        self._queued = {priority: 0 for priority in PRIORITIES}
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._service_seconds = None  # EWMA of time spent holding a slot
+        self._counters = {
+            priority: {'admitted': 0, 'queued': 0, 'shed': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+            for priority in PRIORITIES
+        }
+
+    def retry_after(self, queue_depth=None):
+        """Seconds until a new request would likely get a slot"""
+        if queue_depth is None:
+            queue_depth = len(self._waiters)
+        service_seconds = self._service_seconds or 1.0
+        rate = self.max_concurrent / service_seconds  # requests per second
+        return max(1, min(60, math.ceil((queue_depth + 1) / rate)))
+
+    def _shed(self, priority, reason):
+        self._counters[priority]['shed'] += 1
+        return Overloaded(priority, self.retry_after(), reason)
+
+    def acquire(self, priority='bulk', timeout=None):
+        """Block until a slot is free, or raise Overloaded
+
+        timeout (e.g. what is left of a request deadline) shortens the
+        priority's queue timeout.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        started = time.monotonic()
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._waiters:
+                self._in_flight += 1
+                self._counters[priority]['admitted'] += 1
+                return
+            if self._queued[priority] >= self.queue_limits[priority]:
+                raise self._shed(priority, 'queue full')
+            waiter = _Waiter(PRIORITIES[priority], next(self._seq))
+            heapq.heappush(self._waiters, waiter)
+            self._queued[priority] += 1
+            self._counters[priority]['queued'] += 1
+
+        queue_timeout = self.queue_timeouts[priority]
+        waiter.event.wait(queue_timeout if timeout is None else min(queue_timeout, timeout))
+
+        with self._lock:
+            waited = time.monotonic() - started
+            counters = self._counters[priority]
+            counters['wait_seconds'] += waited
+            counters['max_wait_seconds'] = max(counters['max_wait_seconds'], waited)
+            if not waiter.granted:
+                # Timed out before a slot was handed over
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._queued[priority] -= 1
+                raise self._shed(priority, 'queue timeout')
+            counters['admitted'] += 1
+
+    def release(self, service_seconds=None):
+        """Free a slot, handing it straight to the highest priority waiter"""
+        with self._lock:
+            if service_seconds is not None:
+                if self._service_seconds is None:
+                    self._service_seconds = service_seconds
+                else:
+                    self._service_seconds = 0.8 * self._service_seconds + 0.2 * service_seconds
+            if self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                self._queued[self._priority_name(waiter.rank)] -= 1
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self._in_flight -= 1
+
+    @staticmethod
+    def _priority_name(rank):
+        for name, value in PRIORITIES.items():
+            if value == rank:
+                return name
+
+    @contextmanager
+    def admit(self, priority='bulk', timeout=None):
+        """Hold an inference slot for the duration of the block"""
+        self.acquire(priority, timeout)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self):
+        """Current load plus per-priority admitted, shed and queue-wait counters"""
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self._in_flight,
+                'queued': dict(self._queued),
+                'service_seconds': self._service_seconds,
+                'retry_after': self.retry_after(),
+                'classes': {priority: dict(counters) for priority, counters in self._counters.items()},
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Return the process-wide admission controller"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
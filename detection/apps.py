@@ -3,4 +3,9 @@ from django.apps import AppConfig
 
 class DetectionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'detection' 
\ No newline at end of file
+    name = 'detection'
+    
+    def ready(self):
+        from django.core.signals import request_finished
+        from .memory import recycle_if_requested
+        request_finished.connect(recycle_if_requested, dispatch_uid='detection.recycle_if_requested')
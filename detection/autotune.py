@@ -0,0 +1,233 @@
+import functools
+import hashlib
+import json
+import os
+import platform
+import threading
+import time
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .export import has_embedded_nms
+from .parity import collect_corpus
+from .services import import_backend, load_image
+
+_profiles = None
+_lock = threading.RLock()
+
+
+@functools.lru_cache(maxsize=None)
+def host_fingerprint():
+    """Short hash of this machine's CPU, core count and inference runtime versions, plus its inputs"""
+    cpu = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpu = next((line.split(':', 1)[1].strip() for line in f if line.startswith('model name')), cpu)
+    except OSError:
+        pass
+    details = {
+        'machine': platform.machine(),
+        'cpu': cpu,
+        'cores': os.cpu_count(),
+        'python': platform.python_version(),
+    }
+    # Package versions come from metadata, so nothing heavy is imported here
+    for package in ('onnxruntime', 'onnxruntime-gpu', 'torch'):
+        try:
+            details[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    digest = hashlib.sha1(json.dumps(details, sort_keys=True).encode()).hexdigest()[:16]
+    return digest, details
+
+
+def _load_profiles():
+    global _profiles
+    if _profiles is None:
+        path = Path(settings.AUTOTUNE_PROFILE_PATH)
+        _profiles = json.loads(path.read_text()) if path.exists() else {}
+    return _profiles
+
+
+def get_profile(model_name, backend):
+    """The saved winning configuration of a backend for this host and model, or None"""
+    if settings.AUTOTUNE == 'off':
+        return None
+    with _lock:
+        fingerprint, _ = host_fingerprint()
+        return _load_profiles().get(f'{fingerprint}:{model_name}', {}).get(backend)
+
+
+def save_profile(model_name, backend, profile):
+    """Store a backend's profile for this host and model, keeping other hosts' profiles"""
+    with _lock:
+        fingerprint, details = host_fingerprint()
+        profiles = _load_profiles()
+        entry = profiles.setdefault(f'{fingerprint}:{model_name}', {'host': details})
+        entry[backend] = dict(profile, tuned_at=datetime.now().isoformat(timespec='seconds'))
+        path = Path(settings.AUTOTUNE_PROFILE_PATH)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(profiles, indent=2))
+        os.replace(tmp, path)
+
+
+def calibration_image():
+    """AUTOTUNE_CALIBRATION_IMAGE, else the first upload, else a synthetic 640x480 frame"""
+    candidates = [settings.AUTOTUNE_CALIBRATION_IMAGE] if settings.AUTOTUNE_CALIBRATION_IMAGE else []
+    uploads = Path(settings.MEDIA_ROOT) / 'uploads'
+    if uploads.is_dir():
+        candidates += collect_corpus(uploads)[:1]
+    for path in candidates:
+        try:
+            return load_image(path)
+        except ValueError:
+            continue
+    return np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+
+
+def onnx_session_config(ort, profile=None):
+    """Execution providers and SessionOptions for a profile (or the defaults)"""
+    options = ort.SessionOptions()
+    available = ort.get_available_providers()
+    if profile is None or profile['provider'] not in available:
+        providers = ['CPUExecutionProvider']
+        if 'CUDAExecutionProvider' in available:
+            providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+        return providers, options
+    options.intra_op_num_threads = profile['intra_op_num_threads']
+    options.inter_op_num_threads = profile['inter_op_num_threads']
+    options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if profile['execution_mode'] == 'parallel'
+                              else ort.ExecutionMode.ORT_SEQUENTIAL)
+    providers = [profile['provider']]
+    if profile['provider'] != 'CPUExecutionProvider':
+        providers.append('CPUExecutionProvider')
+    return providers, options
+
+
+def _thread_counts():
+    cores = os.cpu_count() or 1
+    return sorted({1, max(1, cores // 2), cores})
+
+
+def _time_runs(run, runs):
+    run()  # warm-up: first runs pay for allocation and kernel selection
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+
+def _feeds(session, tensor):
+    feeds = {session.get_inputs()[0].name: tensor}
+    if has_embedded_nms(session):
+        feeds.update(
+            conf_threshold=np.array([settings.DETECTION_CONFIDENCE_THRESHOLD], dtype=np.float32),
+            iou_threshold=np.array([settings.DETECTION_NMS_IOU_THRESHOLD], dtype=np.float32),
+            max_detections=np.array([settings.DETECTION_MAX_DETECTIONS], dtype=np.int64),
+            class_mask=np.ones(next(i.shape[0] for i in session.get_inputs() if i.name == 'class_mask'),
+                               dtype=np.float32),
+        )
+    return feeds
+
+
+def tune_onnx(service, image=None, runs=None, batch_sizes=None, log=print):
+    """Benchmark ORT providers, thread counts, execution modes and batch sizes
+
+    The session configuration is chosen by single-image latency; the batch
+    size is then chosen by per-image time with that configuration.
+    """
+    ort = import_backend('onnx', 'onnxruntime')
+    if not service.onnx_path.exists():
+        service.convert_to_onnx()
+    runs = runs or settings.AUTOTUNE_RUNS
+    tensor, _ = service.preprocess_onnx(image if image is not None else calibration_image())
+
+    candidates = []
+    providers = [p for p in ort.get_available_providers() if p not in ('AzureExecutionProvider', 'TensorrtExecutionProvider')]
+    for provider in providers:
+        for threads in _thread_counts() if provider == 'CPUExecutionProvider' else [0]:
+            for mode in ('sequential', 'parallel'):
+                candidates.append({
+                    'provider': provider,
+                    'intra_op_num_threads': threads,
+                    'inter_op_num_threads': 2 if mode == 'parallel' else 1,
+                    'execution_mode': mode,
+                })
+
+    results = []
+    best = None
+    for candidate in candidates:
+        session_providers, options = onnx_session_config(ort, candidate)
+        try:
+            session = ort.InferenceSession(str(service.onnx_path), options, providers=session_providers)
+        except Exception as e:
+            log(f"  skipped {candidate}: {e}")
+            continue
+        feeds = _feeds(session, tensor)
+        seconds = _time_runs(lambda: session.run(None, feeds), runs)
+        results.append(dict(candidate, ms_per_image=seconds * 1000))
+        log(f"  {candidate['provider']} threads={candidate['intra_op_num_threads']} "
+            f"{candidate['execution_mode']}: {seconds * 1000:.1f} ms")
+        if best is None or seconds < best[1]:
+            best = (candidate, seconds, session)
+    if best is None:
+        raise RuntimeError('No ONNX Runtime configuration could be benchmarked')
+
+    candidate, latency, session = best
+    model_input = session.get_inputs()[0]
+    batch_size, per_image = 1, latency
+    if not isinstance(model_input.shape[0], int):
+        for size in batch_sizes or settings.AUTOTUNE_BATCH_SIZES:
+            if size <= 1:
+                continue
+            feeds = _feeds(session, np.concatenate([tensor] * size))
+            seconds = _time_runs(lambda: session.run(None, feeds), runs) / size
+            log(f"  batch {size}: {seconds * 1000:.1f} ms per image")
+            if seconds < per_image:
+                batch_size, per_image = size, seconds
+
+    profile = dict(candidate, ms_per_image=latency * 1000, batch_size=batch_size,
+                   batch_ms_per_image=per_image * 1000, candidates=results)
+    save_profile(service.name, 'onnx', profile)
+    return profile
+
+
+def tune_pytorch(service, image=None, runs=None, log=print):
+    """Benchmark torch intra-op thread counts on the calibration image"""
+    torch = import_backend('pytorch', 'torch')
+    runs = runs or settings.AUTOTUNE_RUNS
+    image = image if image is not None else calibration_image()
+    service.load_pytorch_model()
+    original = torch.get_num_threads()
+    results = []
+    try:
+        for threads in _thread_counts():
+            torch.set_num_threads(threads)
+            # Bypass the tensor cache, or every timed run after the warm-up would be a hit
+            seconds = _time_runs(lambda: service.run_pytorch_inference(image, cache=False), runs)
+            results.append({'num_threads': threads, 'ms_per_image': seconds * 1000})
+            log(f"  torch threads={threads}: {seconds * 1000:.1f} ms")
+    finally:
+        torch.set_num_threads(original)
+    best = min(results, key=lambda result: result['ms_per_image'])
+    profile = dict(best, candidates=results)
+    save_profile(service.name, 'pytorch', profile)
+    return profile
+
+
+def onnx_profile_for(service):
+    """Profile to open a session with; in AUTOTUNE=auto mode, tune first if there is none"""
+    profile = get_profile(service.name, 'onnx')
+    if profile is None and settings.AUTOTUNE == 'auto':
+        with _lock:
+            profile = get_profile(service.name, 'onnx')
+            if profile is None:
+                print(f"Autotuning ONNX Runtime for {service.name} on this host...")
+                profile = tune_onnx(service)
+    return profile
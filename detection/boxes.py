@@ -0,0 +1,79 @@
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of two [N, 4] and [M, 4] xyxy arrays as an [N, M] matrix"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).clip(0).prod(axis=1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).clip(0).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+def greedy_match(iou, threshold):
+    """Pair rows and columns of an IoU matrix greedily by decreasing IoU
+
+    Returns a list of (row, column) pairs whose IoU is at least threshold.
+    """
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols], kind='stable')
+    used_rows = np.zeros(iou.shape[0], dtype=bool)
+    used_cols = np.zeros(iou.shape[1], dtype=bool)
+    pairs = []
+    for r, c in zip(rows[order], cols[order]):
+        if not used_rows[r] and not used_cols[c]:
+            used_rows[r] = used_cols[c] = True
+            pairs.append((int(r), int(c)))
+    return pairs
+
+
+def xyxy_to_cxcywh(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    wh = boxes[:, 2:] - boxes[:, :2]
+    return np.concatenate([boxes[:, :2] + wh / 2, wh], axis=1)
+
+
+def cxcywh_to_xyxy(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    half = boxes[:, 2:] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+
+def nms(boxes, scores, iou_threshold):
+    """Indices of the boxes kept by greedy non-maximum suppression, best first"""
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        iou = box_iou(boxes[best:best + 1], boxes[order[1:]])[0]
+        order = order[1:][iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, class_ids, iou_threshold):
+    """Per-class NMS in one pass by offsetting each class into its own region"""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Boxes are unclipped here and may be negative, so offset by the full coordinate span
+    span = float(boxes.max()) - float(boxes.min()) + 1.0
+    offsets = class_ids.astype(np.float64)[:, None] * span
+    return nms(boxes + offsets, scores, iou_threshold)
+
+
+def points_in_polygon(points, polygon):
+    """Vectorized even-odd test of [N, 2] points against one [K, 2] polygon"""
+    polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_intersect = (x2 - x1) * (y - y1) / (y2 - y1) + x1
+    return np.logical_and(crosses, x < x_intersect).sum(axis=1) % 2 == 1
@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from .parity import match_detections
+from .registry import get_registry
+
+
+class ModelCascade:
+    """Runs a cheap model first and escalates to larger ones only when unsure
+
+    An image escalates to the next stage when at least CASCADE_MIN_UNCERTAIN
+    detections have a confidence inside CASCADE_UNCERTAIN_BAND, or when it
+    has CASCADE_DENSE_COUNT or more detections (crowded scenes are where
+    small models miss most). The last stage's answer is final.
+
+    Escalated images have both answers, so their agreement is free to
+    measure; a CASCADE_AUDIT_RATE fraction of accepted images is also run
+    on the last stage to estimate the accuracy given up by not escalating.
+    """
+
+    def __init__(self, stages=None, uncertain_band=None, min_uncertain=None, dense_count=None, audit_rate=None):
+        registry = get_registry()
+        self.stages = [registry.resolve(name) for name in (stages or settings.CASCADE_STAGES)]
+        self.uncertain_band = tuple(uncertain_band or settings.CASCADE_UNCERTAIN_BAND)
+        self.min_uncertain = min_uncertain or settings.CASCADE_MIN_UNCERTAIN
+        self.dense_count = dense_count or settings.CASCADE_DENSE_COUNT
+        self.audit_rate = audit_rate if audit_rate is not None else settings.CASCADE_AUDIT_RATE
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'escalations': 0,
+            'reasons': {},
+            'final_stage': {name: 0 for name in self.stages},
+            'seconds': 0.0,
+            # Last-stage time of requests that ran it anyway (escalated, or a one-stage cascade)
+            'measured_last_stage_seconds': 0.0,
+            'measured_last_stage_runs': 0,
+            # Last-stage time of audited accepted requests, a uniform sample of the rest
+            'audit_last_stage_seconds': 0.0,
+            'audits': 0,
+            'escalated_agreement': [],
+            'audited_agreement': [],
+        }
+
+    def escalation_reason(self, detections):
+        """'uncertain' or 'dense' when an answer should go to the next stage, else None"""
+        low, high = self.uncertain_band
+        if sum(1 for d in detections if low <= d['confidence'] < high) >= self.min_uncertain:
+            return 'uncertain'
+        if len(detections) >= self.dense_count:
+            return 'dense'
+        return None
+
+    @staticmethod
+    def _run_stage(name, backend, image, filters, deadline=None):
+        service = get_registry().get(name)
+        started = time.perf_counter()
+        if deadline is not None:
+            deadline.check(name)
+        if backend == 'pytorch':
+            detections = service.run_pytorch_inference(image, filters=filters)
+        else:
+            detections = service.run_onnx_inference(image, filters=filters, deadline=deadline)
+        return detections, time.perf_counter() - started
+
+    def run(self, image, backend='onnx', filters=None, deadline=None):
+        """Return (detections, report) for one decoded image
+
+        With a Deadline, no further stage (or audit) starts once it has passed.
+        """
+        stages = []
+        first = None
+        started = time.perf_counter()
+        for index, name in enumerate(self.stages):
+            detections, seconds = self._run_stage(name, backend, image, filters, deadline)
+            first = detections if first is None else first
+            reason = self.escalation_reason(detections) if index < len(self.stages) - 1 else None
+            stages.append({'model': name, 'detections': len(detections), 'seconds': seconds,
+                           'escalation_reason': reason})
+            if reason is None:
+                break
+        seconds = time.perf_counter() - started
+        escalated = len(stages) > 1
+
+        report = {'model': stages[-1]['model'], 'escalated': escalated, 'stages': stages, 'seconds': seconds}
+        last_stage_seconds = stages[-1]['seconds'] if escalated or len(self.stages) == 1 else None
+        audit_seconds = None
+        # Recall of the first stage against the last: free on escalations, and
+        # measured on a sample of accepted images by running the last stage anyway
+        if escalated:
+            report['first_stage_recall'] = match_detections(detections, first)['recall']
+        elif (self.audit_rate and len(self.stages) > 1 and random.random() < self.audit_rate
+              and not (deadline is not None and deadline.expired)):
+            reference, audit_seconds = self._run_stage(self.stages[-1], backend, image, filters)
+            report['audit_recall'] = match_detections(reference, detections)['recall']
+        self._record(report, last_stage_seconds, audit_seconds)
+        return detections, report
+
+    def _record(self, report, last_stage_seconds, audit_seconds):
+        with self._lock:
+            stats = self._stats
+            stats['requests'] += 1
+            stats['seconds'] += report['seconds']
+            stats['final_stage'][report['model']] += 1
+            if last_stage_seconds is not None:
+                stats['measured_last_stage_seconds'] += last_stage_seconds
+                stats['measured_last_stage_runs'] += 1
+            if audit_seconds is not None:
+                stats['audit_last_stage_seconds'] += audit_seconds
+                stats['audits'] += 1
+            if report['escalated']:
+                stats['escalations'] += 1
+                reason = report['stages'][0]['escalation_reason']
+                stats['reasons'][reason] = stats['reasons'].get(reason, 0) + 1
+            if 'first_stage_recall' in report:
+                stats['escalated_agreement'].append(report['first_stage_recall'])
+            if 'audit_recall' in report:
+                stats['audited_agreement'].append(report['audit_recall'])
+            # Keep the agreement windows bounded
+            del stats['escalated_agreement'][:-1000]
+            del stats['audited_agreement'][:-1000]
+
+    def stats(self):
+        """Escalation rate, mean latency against running the last stage on everything, agreement
+
+        Escalated requests are the slow, hard ones, so their last-stage time
+        alone would overstate the savings. The last-stage mean therefore adds
+        the accepted requests at the audited mean, and is None until an
+        accepted request has been audited.
+        """
+        with self._lock:
+            stats = self._stats
+            requests = stats['requests']
+            unmeasured = requests - stats['measured_last_stage_runs']
+            if unmeasured and stats['audits']:
+                audit_mean = stats['audit_last_stage_seconds'] / stats['audits']
+                last_stage_mean = (stats['measured_last_stage_seconds'] + unmeasured * audit_mean) / requests
+            elif requests and not unmeasured:
+                last_stage_mean = stats['measured_last_stage_seconds'] / requests
+            else:
+                last_stage_mean = None
+            mean = stats['seconds'] / requests if requests else None
+            escalated = stats['escalated_agreement']
+            audited = stats['audited_agreement']
+            return {
+                'stages': self.stages,
+                'uncertain_band': list(self.uncertain_band),
+                'dense_count': self.dense_count,
+                'requests': requests,
+                'escalations': stats['escalations'],
+                'escalation_rate': stats['escalations'] / requests if requests else 0.0,
+                'reasons': dict(stats['reasons']),
+                'final_stage': dict(stats['final_stage']),
+                'mean_seconds': mean,
+                'last_stage_mean_seconds': last_stage_mean,
+                'audits': stats['audits'],
+                'estimated_speedup': last_stage_mean / mean if mean and last_stage_mean else None,
+                'escalated_first_stage_recall': sum(escalated) / len(escalated) if escalated else None,
+                'audited_first_stage_recall': sum(audited) / len(audited) if audited else None,
+            }
+
+
+_cascade = None
+_cascade_lock = threading.Lock()
+
+
+def get_cascade():
+    """Return the process-wide ModelCascade built from settings.CASCADE_STAGES"""
+    global _cascade
+    if _cascade is None:
+        with _cascade_lock:
+            if _cascade is None:
+                _cascade = ModelCascade()
+    return _cascade
@@ -0,0 +1,222 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passes before its work is finished"""
+
+    def __init__(self, stage, terminated=False):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+        self.terminated = terminated
+
+
+class _Watchdog:
+    """One thread that sets RunOptions.terminate on ONNX runs whose deadline has passed
+
+    ONNX Runtime checks the flag between graph nodes, so an in-flight run
+    stops within one operator instead of finishing the whole model.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._heap = []  # (expires_at, seq, run_options)
+        self._active = set()
+        self._seq = itertools.count()
+        self._thread = None
+
+    def watch(self, expires_at, run_options):
+        with self._condition:
+            seq = next(self._seq)
+            heapq.heappush(self._heap, (expires_at, seq, run_options))
+            self._active.add(seq)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='deadline-watchdog', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return seq
+
+    def unwatch(self, seq):
+        with self._condition:
+            self._active.discard(seq)
+
+    def _run(self):
+        with self._condition:
+            while True:
+                # Drop runs that finished in time
+                while self._heap and self._heap[0][1] not in self._active:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                expires_at, seq, run_options = self._heap[0]
+                delay = expires_at - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                self._active.discard(seq)
+                run_options.terminate = True
+
+
+class DeadlineStats:
+    """Per-stage timings and what cancelling late requests saved
+
+    Each stage's duration is tracked as an EWMA. When a request is cancelled,
+    the expected time of the stages it skipped (and the unfinished part of a
+    terminated one) is counted as saved, and the time it had already used as
+    spent on a result nobody received.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stage_seconds = {}
+        self._counters = {
+            'requests': 0,
+            'cancelled': 0,
+            'onnx_runs_terminated': 0,
+            'seconds_saved': 0.0,
+            'seconds_spent_on_cancelled': 0.0,
+        }
+        self._cancelled_at = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            previous = self._stage_seconds.get(stage)
+            self._stage_seconds[stage] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+    def estimate(self, stage):
+        with self._lock:
+            return self._stage_seconds.get(stage, 0.0)
+
+    def record_request(self):
+        with self._lock:
+            self._counters['requests'] += 1
+
+    def record_cancellation(self, stage, saved, spent, terminated):
+        with self._lock:
+            self._counters['cancelled'] += 1
+            self._counters['seconds_saved'] += saved
+            self._counters['seconds_spent_on_cancelled'] += spent
+            if terminated:
+                self._counters['onnx_runs_terminated'] += 1
+            self._cancelled_at[stage] = self._cancelled_at.get(stage, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._counters,
+                default_timeout=settings.DETECTION_DEFAULT_TIMEOUT,
+                cancelled_at=dict(self._cancelled_at),
+                stage_seconds=dict(self._stage_seconds),
+            )
+
+
+class Deadline:
+    """Time budget of one request, checked between pipeline stages
+
+    plan lists the stage names the request still expects to run, so a
+    cancellation can estimate the work it skipped. seconds=None never expires.
+    """
+
+    def __init__(self, seconds=None, plan=(), started=None):
+        self.started = started if started is not None else time.monotonic()
+        self.seconds = seconds
+        self.expires_at = self.started + seconds if seconds else None
+        self.plan = list(plan)
+        self.cancelled = None
+
+    def remaining(self):
+        """Seconds left, or None without a deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, stage):
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+    def cancel(self, stage, elapsed_in_stage=0.0, terminated=False):
+        """Record the cancellation (once) and return the exception to raise"""
+        if self.cancelled is None:
+            self.cancelled = stage
+            stats = get_deadline_stats()
+            later = self.plan[self.plan.index(stage) + 1:] if stage in self.plan else self.plan
+            saved = sum(stats.estimate(name) for name in later)
+            if stage in self.plan:
+                saved += max(0.0, stats.estimate(stage) - elapsed_in_stage)
+            stats.record_cancellation(stage, saved, time.monotonic() - self.started, terminated)
+        return DeadlineExceeded(stage, terminated)
+
+    @contextmanager
+    def stage(self, name):
+        """Run a stage if there is time left, timing it or recording its cancellation"""
+        started = time.monotonic()
+        try:
+            self.check(name)
+            yield
+        except DeadlineExceeded as e:
+            raise self.cancel(name, time.monotonic() - started, e.terminated) from None
+        get_deadline_stats().observe(name, time.monotonic() - started)
+
+    @contextmanager
+    def onnx_run_options(self, ort):
+        """RunOptions for session.run that are terminated when the deadline passes"""
+        if self.expires_at is None:
+            yield None
+            return
+        self.check('onnx')
+        run_options = ort.RunOptions()
+        seq = _watchdog.watch(self.expires_at, run_options)
+        try:
+            yield run_options
+        except Exception as e:
+            if run_options.terminate:
+                raise DeadlineExceeded('onnx', terminated=True) from e
+            raise
+        finally:
+            _watchdog.unwatch(seq)
+
+
+def deadline_from_request(request, plan=()):
+    """Deadline from the X-Request-Timeout header or ?timeout= (seconds), else the default
+
+    Raises ValueError for a malformed, negative or non-finite value. 0 asks for no deadline, which
+    DETECTION_MAX_TIMEOUT (when set) still caps like any other timeout.
+    """
+    value = request.headers.get(DEADLINE_HEADER) or request.GET.get('timeout')
+    seconds = float(value) if value else settings.DETECTION_DEFAULT_TIMEOUT
+    # nan and inf would slip past the cap below (min(nan, x) is nan) and never expire
+    if not math.isfinite(seconds) or seconds < 0:
+        raise ValueError('timeout must be a finite, non-negative number of seconds')
+    if settings.DETECTION_MAX_TIMEOUT:
+        seconds = min(seconds or settings.DETECTION_MAX_TIMEOUT, settings.DETECTION_MAX_TIMEOUT)
+    get_deadline_stats().record_request()
+    return Deadline(seconds or None, plan)
+
+
+_watchdog = _Watchdog()
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_deadline_stats():
+    """Return the process-wide DeadlineStats"""
+    global _stats
+    if _stats is None:
+        with _stats_lock:
+            if _stats is None:
+                _stats = DeadlineStats()
+    return _stats
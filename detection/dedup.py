@@ -0,0 +1,167 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+
+def dhash(image):
+    """64-bit difference hash of a BGR image: the sign of horizontal gradients on a 9x8 thumbnail"""
+    import cv2
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def thumbnail(image, size=32):
+    """Small grayscale float thumbnail for a cheap pixel-level recheck"""
+    import cv2
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes under Hamming distance
+
+    Each child edge is labelled with its distance to the parent, so a search
+    within radius r only descends into edges labelled d - r .. d + r
+    (triangle inequality) instead of comparing against every hash.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, hash_value, key):
+        node = [hash_value, key, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, hash_value, radius):
+        """Return (distance, key) for every stored hash within radius"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            stored, key, children = stack.pop()
+            distance = hamming(hash_value, stored)
+            if distance <= radius:
+                found.append((distance, key))
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+class NearDuplicateIndex:
+    """Recent frames indexed by dHash, for reusing detections of near-identical images
+
+    Entries expire after DEDUP_TTL_SECONDS and the oldest are evicted beyond
+    DEDUP_MAX_ENTRIES. BK-trees do not support deletion, so removed entries
+    are skipped on lookup and the tree is rebuilt once they outnumber the
+    live ones. Results are only shared between frames with the same key
+    (model, backends and filters).
+    """
+
+    def __init__(self, max_distance=None, recheck_threshold=None, max_entries=None, ttl=None):
+        self.max_distance = max_distance if max_distance is not None else settings.DEDUP_MAX_DISTANCE
+        self.recheck_threshold = (recheck_threshold if recheck_threshold is not None
+                                  else settings.DEDUP_RECHECK_THRESHOLD)
+        self.max_entries = max_entries or settings.DEDUP_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else settings.DEDUP_TTL_SECONDS
+        self.entries = OrderedDict()  # id -> (key, hash, thumbnail, payload, added_at)
+        self.tree = BKTree()
+        self.lookups = 0
+        self.hits = 0
+        self.saved_inferences = 0
+        self.rechecks_failed = 0
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self.entries:
+            entry_id, entry = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_entries and now - entry[4] <= self.ttl:
+                break
+            del self.entries[entry_id]
+        if self.tree.size > 2 * len(self.entries) + 16:
+            self.tree = BKTree()
+            for entry_id, entry in self.entries.items():
+                self.tree.add(entry[1], entry_id)
+
+    def lookup(self, key, image, inferences=1):
+        """Find the closest recent near-duplicate of an image under the same key
+
+        Returns (match, fingerprint): match is (payload, distance) or None, and
+        the fingerprint can be passed to add() so it is not computed twice.
+        A hit counts as `inferences` saved backend runs.
+        """
+        hash_value, thumb = dhash(image), thumbnail(image)
+        with self._lock:
+            self.lookups += 1
+            self._expire(time.monotonic())
+            candidates = sorted(
+                (distance, entry_id) for distance, entry_id in self.tree.search(hash_value, self.max_distance)
+                if entry_id in self.entries and self.entries[entry_id][0] == key
+            )
+            for distance, entry_id in candidates:
+                stored_thumb, payload = self.entries[entry_id][2], self.entries[entry_id][3]
+                if self.recheck_threshold and float(np.abs(thumb - stored_thumb).mean()) > self.recheck_threshold:
+                    self.rechecks_failed += 1
+                    continue
+                self.hits += 1
+                self.saved_inferences += inferences
+                return (payload, distance), (hash_value, thumb)
+        return None, (hash_value, thumb)
+
+    def add(self, key, fingerprint, payload):
+        hash_value, thumb = fingerprint
+        with self._lock:
+            entry_id = next(self._ids)
+            self.entries[entry_id] = (key, hash_value, thumb, payload, time.monotonic())
+            self.tree.add(hash_value, entry_id)
+            self._expire(time.monotonic())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self.entries),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'saved_inferences': self.saved_inferences,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'rechecks_failed': self.rechecks_failed,
+                'max_distance': self.max_distance,
+                'recheck_threshold': self.recheck_threshold,
+                'ttl_seconds': self.ttl,
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_dedup_index():
+    """Return the process-wide NearDuplicateIndex"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = NearDuplicateIndex()
+    return _index
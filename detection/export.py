@@ -0,0 +1,109 @@
+from pathlib import Path
+
+import numpy as np
+
+# Names of the outputs and runtime inputs appended by embed_nms
+NMS_OUTPUTS = ['det_boxes', 'det_scores', 'det_classes', 'det_batch']
+NMS_INPUTS = ['conf_threshold', 'iou_threshold', 'max_detections', 'class_mask']
+
+
+def has_embedded_nms(session):
+    """Whether an ONNX Runtime session's graph already decodes and suppresses boxes"""
+    return {output.name for output in session.get_outputs()} >= set(NMS_OUTPUTS)
+
+
+def embed_nms(model_path, output_path=None):
+    """Append YOLOv8/11 decoding and NonMaxSuppression to an exported ONNX graph
+
+    The raw [batch, 4 + num_classes, candidates] output becomes:
+      det_boxes [K, 4] float x1, y1, x2, y2 in model input pixels
+      det_scores [K] float, det_classes [K] int64, det_batch [K] int64
+    Confidence and IoU thresholds, the per-class box limit and a class
+    whitelist are runtime inputs (conf_threshold, iou_threshold: float [1];
+    max_detections: int64 [1]; class_mask: float [num_classes] of 0/1). Each
+    candidate keeps only its best class, and is dropped when that class is not
+    whitelisted, before NMS, like the Python decoder.
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    model_path = Path(model_path)
+    output_path = Path(output_path or model_path)
+    model = onnx.load(str(model_path))
+    graph = model.graph
+    if {output.name for output in graph.output} >= set(NMS_OUTPUTS):
+        return output_path
+    raw = graph.output[0].name
+    num_classes = graph.output[0].type.tensor_type.shape.dim[1].dim_value - 4
+    if num_classes <= 0:
+        raise ValueError('embed_nms needs a static class dimension in the model output')
+
+    def const(name, values, dtype=np.int64):
+        graph.initializer.append(numpy_helper.from_array(np.array(values, dtype=dtype), name))
+        return name
+
+    def node(op, inputs, outputs, **attrs):
+        graph.node.append(helper.make_node(op, inputs, outputs, **attrs))
+        return outputs[0]
+
+    # [B, 4 + nc, N] -> boxes [B, N, 4] (cx, cy, w, h) and scores [B, nc, N]
+    pred = node('Transpose', [raw], ['nms_pred'], perm=[0, 2, 1])
+    boxes = node('Slice', [pred, const('nms_box_start', [0]), const('nms_box_end', [4]), const('nms_last_axis', [2])],
+                 ['nms_cxcywh'])
+    scores = node('Slice', [raw, const('nms_cls_start', [4]), const('nms_cls_end', [np.iinfo(np.int64).max]),
+                            const('nms_cls_axis', [1])], ['nms_scores_all'])
+
+    # Keep each candidate's best class only, then zero out candidates whose best
+    # class is not whitelisted (ReduceMax takes axes as an input from opset 18)
+    opset = max(o.version for o in model.opset_import if o.domain in ('', 'ai.onnx'))
+    if opset >= 18:
+        best = node('ReduceMax', [scores, const('nms_class_axis', [1])], ['nms_best'], keepdims=1)
+    else:
+        best = node('ReduceMax', [scores], ['nms_best'], axes=[1], keepdims=1)
+    is_best = node('Cast', [node('Equal', [scores, best], ['nms_is_best'])], ['nms_is_best_f'], to=TensorProto.FLOAT)
+    mask = node('Reshape', ['class_mask', const('nms_mask_shape', [1, num_classes, 1])], ['nms_mask'])
+    scores = node('Mul', [node('Mul', [scores, is_best], ['nms_scores_best']), mask], ['nms_scores'])
+
+    graph.input.extend([
+        helper.make_tensor_value_info('conf_threshold', TensorProto.FLOAT, [1]),
+        helper.make_tensor_value_info('iou_threshold', TensorProto.FLOAT, [1]),
+        helper.make_tensor_value_info('max_detections', TensorProto.INT64, [1]),
+        helper.make_tensor_value_info('class_mask', TensorProto.FLOAT, [num_classes]),
+    ])
+    selected = node('NonMaxSuppression', [boxes, scores, 'max_detections', 'iou_threshold', 'conf_threshold'],
+                    ['nms_selected'], center_point_box=1)
+
+    # selected is [K, 3] = batch, class, box index
+    batch_idx = node('Gather', [selected, const('nms_col0', 0)], ['nms_batch_idx'], axis=1)
+    class_idx = node('Gather', [selected, const('nms_col1', 1)], ['nms_class_idx'], axis=1)
+    batch_box = node('Gather', [selected, const('nms_cols02', [0, 2])], ['nms_batch_box'], axis=1)
+    cxcywh = node('GatherND', [boxes, batch_box], ['nms_sel_cxcywh'])
+    node('GatherND', [scores, selected], ['det_scores'])
+
+    # cx, cy, w, h -> x1, y1, x2, y2
+    centers = node('Slice', [cxcywh, const('nms_c0', [0]), const('nms_c2', [2]), const('nms_axis1', [1])],
+                   ['nms_centers'])
+    sizes = node('Slice', [cxcywh, const('nms_s2', [2]), const('nms_s4', [4]), 'nms_axis1'], ['nms_sizes'])
+    half = node('Mul', [sizes, const('nms_half', 0.5, np.float32)], ['nms_half_sizes'])
+    node('Concat', [node('Sub', [centers, half], ['nms_xy1']), node('Add', [centers, half], ['nms_xy2'])],
+         ['det_boxes'], axis=1)
+    node('Identity', [class_idx], ['det_classes'])
+    node('Identity', [batch_idx], ['det_batch'])
+
+    del graph.output[:]
+    graph.output.extend([
+        helper.make_tensor_value_info('det_boxes', TensorProto.FLOAT, ['detections', 4]),
+        helper.make_tensor_value_info('det_scores', TensorProto.FLOAT, ['detections']),
+        helper.make_tensor_value_info('det_classes', TensorProto.INT64, ['detections']),
+        helper.make_tensor_value_info('det_batch', TensorProto.INT64, ['detections']),
+    ])
+    # NonMaxSuppression and GatherND need opset 11+
+    for entry in model.opset_import:
+        if entry.domain in ('', 'ai.onnx') and entry.version < 11:
+            entry.version = 11
+    metadata = {entry.key: entry.value for entry in model.metadata_props}
+    metadata['embedded_nms'] = '1'
+    helper.set_model_props(model, metadata)
+    onnx.checker.check_model(model)
+    onnx.save(model, str(output_path))
+    return output_path
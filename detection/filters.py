@@ -0,0 +1,144 @@
+import json
+
+import numpy as np
+from django.conf import settings
+
+from .boxes import points_in_polygon
+
+
+class InvalidFilter(ValueError):
+    """Raised for malformed class, threshold or ROI filter parameters"""
+
+
+class DetectionFilter:
+    """Class whitelist, per-class confidence thresholds and ROI polygons
+
+    The decoders apply these to the raw candidates before NMS, so filtered
+    detections are never suppressed against, stored or serialized. ROI
+    polygons use coordinates normalized to the image size (0-1), and a
+    detection is kept when its box center lies inside any of them.
+    """
+
+    def __init__(self, classes=None, class_thresholds=None, rois=None, confidence=None):
+        if class_thresholds is not None and not isinstance(class_thresholds, dict):
+            raise InvalidFilter('class_thresholds must be an object of class id to threshold')
+        self.classes = sorted({int(c) for c in classes}) if classes else None
+        self.class_thresholds = {int(k): float(v) for k, v in (class_thresholds or {}).items()}
+        self.rois = [np.asarray(polygon, dtype=np.float64).reshape(-1, 2) for polygon in rois or []]
+        self.confidence = float(confidence) if confidence is not None else settings.DETECTION_CONFIDENCE_THRESHOLD
+        # A negative id would index the class masks from the end
+        if any(c < 0 for c in [*(self.classes or []), *self.class_thresholds]):
+            raise InvalidFilter('class ids must be non-negative')
+        for polygon in self.rois:
+            if len(polygon) < 3:
+                raise InvalidFilter('ROI polygons need at least 3 points')
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a filter from stored or submitted JSON-compatible data"""
+        try:
+            return cls(
+                classes=data.get('classes'),
+                class_thresholds=data.get('class_thresholds'),
+                rois=data.get('rois'),
+                confidence=data.get('confidence'),
+            )
+        except InvalidFilter:
+            raise
+        except (TypeError, ValueError) as e:
+            raise InvalidFilter(f'Invalid filter: {e}')
+
+    def to_dict(self):
+        return {
+            'classes': self.classes,
+            'class_thresholds': {str(k): v for k, v in self.class_thresholds.items()},
+            'rois': [polygon.tolist() for polygon in self.rois],
+            'confidence': self.confidence,
+        }
+
+    def merged(self, overrides):
+        """A copy with the non-empty fields of another filter dict applied"""
+        data = self.to_dict()
+        data.update({key: value for key, value in overrides.items() if value is not None})
+        return DetectionFilter.from_dict(data)
+
+    @property
+    def min_confidence(self):
+        """Lowest threshold any class can pass, usable as a backend's conf= argument"""
+        return min([self.confidence, *self.class_thresholds.values()])
+
+    def class_mask(self, num_classes):
+        """Boolean [num_classes] mask of allowed classes, or None for all"""
+        if self.classes is None:
+            return None
+        mask = np.zeros(num_classes, dtype=bool)
+        mask[[c for c in self.classes if c < num_classes]] = True
+        return mask
+
+    def thresholds(self, num_classes):
+        """Per-class confidence thresholds as a [num_classes] array"""
+        thresholds = np.full(num_classes, self.confidence, dtype=np.float32)
+        for class_id, threshold in self.class_thresholds.items():
+            if class_id < num_classes:
+                thresholds[class_id] = threshold
+        return thresholds
+
+    def roi_mask(self, boxes, width, height):
+        """Boolean mask of xyxy pixel boxes whose center is inside an ROI"""
+        if not self.rois:
+            return np.ones(len(boxes), dtype=bool)
+        centers = np.stack([
+            (boxes[:, 0] + boxes[:, 2]) / (2 * width),
+            (boxes[:, 1] + boxes[:, 3]) / (2 * height),
+        ], axis=1)
+        inside = np.zeros(len(boxes), dtype=bool)
+        for polygon in self.rois:
+            inside |= points_in_polygon(centers, polygon)
+        return inside
+
+    def keep_mask(self, boxes, scores, class_ids, width, height, num_classes):
+        """Combined class, threshold and ROI mask over candidate arrays"""
+        keep = scores >= self.thresholds(num_classes)[class_ids]
+        allowed = self.class_mask(num_classes)
+        if allowed is not None:
+            keep &= allowed[class_ids]
+        if self.rois and keep.any():
+            keep[keep] = self.roi_mask(boxes[keep], width, height)
+        return keep
+
+
+def filter_from_request(request):
+    """Read filter parameters (and an optional saved preset) from a request
+
+    Accepts preset=<id>, classes=0,2,7, conf=<float>, class_conf=<JSON object
+    of class id to threshold> and roi=<JSON list of polygons>. Explicit
+    parameters override the preset. Returns None when nothing was given.
+    """
+    from .models import FilterPreset
+
+    # POST fields first, then the query string, like the other api_detect parameters
+    params = {name: request.POST.get(name) or request.GET.get(name)
+              for name in ('preset', 'classes', 'conf', 'class_conf', 'roi')}
+    try:
+        overrides = {
+            'classes': [int(c) for c in params['classes'].split(',') if c.strip()] if params['classes'] else None,
+            'confidence': float(params['conf']) if params['conf'] else None,
+            'class_thresholds': json.loads(params['class_conf']) if params['class_conf'] else None,
+            'rois': json.loads(params['roi']) if params['roi'] else None,
+        }
+        if overrides['class_thresholds'] is not None and not isinstance(overrides['class_thresholds'], dict):
+            raise ValueError('class_conf must be a JSON object of class id to threshold')
+    except ValueError as e:
+        raise InvalidFilter(f'Invalid filter parameter: {e}')
+
+    preset_id = params['preset']
+    if preset_id:
+        try:
+            preset = FilterPreset.objects.get(pk=preset_id)
+        except (FilterPreset.DoesNotExist, ValueError):
+            raise InvalidFilter(f'Unknown filter preset: {preset_id}')
+        return preset.get_filter().merged(overrides)
+
+    if all(value is None for value in overrides.values()):
+        return None
+    return DetectionFilter.from_dict(overrides)
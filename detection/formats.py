@@ -0,0 +1,175 @@
+import json
+import struct
+
+import numpy as np
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+# format name -> content type
+FORMATS = {
+    'json': 'application/json',
+    'columnar': 'application/vnd.yolo.columnar+json',
+    'msgpack': 'application/x-msgpack',
+    'binary': 'application/vnd.yolo.detections',
+}
+_ACCEPT_ALIASES = {
+    'application/msgpack': 'msgpack',
+    'application/octet-stream': 'binary',
+}
+
+BINARY_MAGIC = b'YDET'
+BINARY_VERSION = 1
+
+
+class UnsupportedFormat(ValueError):
+    """Raised for unknown formats or ones whose optional dependency is missing"""
+
+
+def negotiate_format(request):
+    """Pick a response format from format= or the Accept header"""
+    requested = request.POST.get('format') or request.GET.get('format')
+    if requested:
+        if requested not in FORMATS:
+            raise UnsupportedFormat(f"Unknown format '{requested}', expected one of {', '.join(FORMATS)}")
+        return _check_available(requested)
+    accept = request.headers.get('Accept', '')
+    for media_range in accept.split(','):
+        media_type = media_range.split(';')[0].strip().lower()
+        for name, content_type in FORMATS.items():
+            if media_type == content_type:
+                return _check_available(name)
+        if media_type in _ACCEPT_ALIASES:
+            return _check_available(_ACCEPT_ALIASES[media_type])
+    return 'json'
+
+
+def _check_available(response_format):
+    if response_format == 'msgpack' and msgpack is None:
+        raise UnsupportedFormat('The msgpack format requires the msgpack package')
+    return response_format
+
+
+def to_columnar(detections, precision=None, score_precision=None):
+    """Convert a list of detection dicts into parallel arrays
+
+    The same layout is compact enough to store in a JSONField and is turned
+    back into detection dicts with from_columnar.
+    """
+    if precision is None:
+        precision = settings.COLUMNAR_BOX_PRECISION
+    if score_precision is None:
+        score_precision = settings.COLUMNAR_SCORE_PRECISION
+    boxes, scores, class_ids, names = _as_arrays(detections)
+    boxes = np.round(boxes, precision)
+    if precision <= 0:
+        boxes = boxes.astype(np.int64)
+    return {
+        'count': len(scores),
+        'boxes': boxes.ravel().tolist(),  # x1, y1, x2, y2 per detection
+        'scores': np.round(scores, score_precision).tolist(),
+        'class_ids': class_ids.tolist(),
+        'names': {str(class_id): name for class_id, name in names.items()},
+    }
+
+
+def from_columnar(columnar):
+    """Convert parallel arrays back into a list of detection dicts"""
+    boxes = np.asarray(columnar['boxes'], dtype=np.float64).reshape(-1, 4).tolist()
+    names = columnar.get('names', {})
+    return [
+        {
+            'bbox': bbox,
+            'confidence': score,
+            'class_id': class_id,
+            'class_name': names.get(str(class_id), f'class_{class_id}'),
+        }
+        for bbox, score, class_id in zip(boxes, columnar['scores'], columnar['class_ids'])
+    ]
+
+
+def _as_arrays(detections):
+    count = len(detections)
+    boxes = np.array([d['bbox'] for d in detections], dtype=np.float64).reshape(count, 4)
+    scores = np.array([d['confidence'] for d in detections], dtype=np.float64)
+    class_ids = np.array([d['class_id'] for d in detections], dtype=np.int32)
+    names = {d['class_id']: d['class_name'] for d in detections}
+    return boxes, scores, class_ids, names
+
+
+def pack_binary(blocks):
+    """Pack named detection lists as little-endian arrays
+
+    Layout: b'YDET', u16 version, u16 block count, then per block a u8 name
+    length, the UTF-8 name, a u32 count, float32[count, 4] boxes,
+    float32[count] scores and int32[count] class ids.
+    """
+    parts = [BINARY_MAGIC, struct.pack('<HH', BINARY_VERSION, len(blocks))]
+    for name, detections in blocks.items():
+        encoded_name = name.encode('utf-8')
+        boxes, scores, class_ids, _ = _as_arrays(detections)
+        parts.append(struct.pack('<B', len(encoded_name)))
+        parts.append(encoded_name)
+        parts.append(struct.pack('<I', len(scores)))
+        parts.append(boxes.astype('<f4').tobytes())
+        parts.append(scores.astype('<f4').tobytes())
+        parts.append(class_ids.astype('<i4').tobytes())
+    return b''.join(parts)
+
+
+def unpack_binary(data):
+    """Inverse of pack_binary, returning name -> columnar arrays"""
+    if data[:4] != BINARY_MAGIC:
+        raise ValueError('Not a packed detections payload')
+    version, block_count = struct.unpack_from('<HH', data, 4)
+    if version != BINARY_VERSION:
+        raise ValueError(f'Unsupported detections payload version {version}')
+    offset = 8
+    blocks = {}
+    for _ in range(block_count):
+        name_length = data[offset]
+        name = data[offset + 1:offset + 1 + name_length].decode('utf-8')
+        offset += 1 + name_length
+        count = struct.unpack_from('<I', data, offset)[0]
+        offset += 4
+        boxes = np.frombuffer(data, dtype='<f4', count=count * 4, offset=offset).reshape(count, 4)
+        offset += count * 16
+        scores = np.frombuffer(data, dtype='<f4', count=count, offset=offset)
+        offset += count * 4
+        class_ids = np.frombuffer(data, dtype='<i4', count=count, offset=offset)
+        offset += count * 4
+        blocks[name] = {'boxes': boxes, 'scores': scores, 'class_ids': class_ids}
+    return blocks
+
+
+def detection_response(response_data, detection_fields, response_format, precision=None):
+    """Render an API payload in the negotiated format
+
+    detection_fields names the keys of response_data holding detection lists;
+    every other key is metadata.
+    """
+    if response_format == 'json':
+        response = JsonResponse(response_data)
+    elif response_format == 'binary':
+        blocks = {field: response_data[field] for field in detection_fields}
+        response = HttpResponse(pack_binary(blocks), content_type=FORMATS['binary'])
+        # Metadata travels in headers since the body is only arrays; non-string values as compact JSON
+        for key, value in response_data.items():
+            if key not in detection_fields and value is not None:
+                header = value if isinstance(value, str) else json.dumps(value, separators=(',', ':'))
+                response['X-Detection-' + key.replace('_', '-').title()] = header
+    else:
+        payload = dict(response_data)
+        for field in detection_fields:
+            payload[field] = to_columnar(payload[field], precision)
+        if response_format == 'msgpack':
+            response = HttpResponse(msgpack.packb(payload), content_type=FORMATS['msgpack'])
+        else:
+            body = json.dumps(payload, separators=(',', ':'))
+            response = HttpResponse(body, content_type=FORMATS['columnar'])
+    response['Vary'] = 'Accept'
+    return response
@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from .models import UploadedImage
 
 
@@ -16,16 +17,28 @@ class ImageUploadForm(forms.ModelForm):
             })
         }
     
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Files refused by the upload handler never reach request.FILES, so
+        # report the handler's reason instead of "This field is required."
+        if upload_errors and 'image' in upload_errors:
+            self.fields['image'].error_messages['required'] = upload_errors['image'].message
+    
     def clean_image(self):
         image = self.cleaned_data.get('image')
         if image:
             # Check file size (10MB limit)
-            if image.size > 10 * 1024 * 1024:
+            if image.size > settings.UPLOAD_MAX_BYTES:
                 raise forms.ValidationError("Image file size must be under 10MB.")
             
-            # Check file type
-            allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif']
-            if image.content_type not in allowed_types:
-                raise forms.ValidationError("Please upload a valid image file (JPEG, PNG, GIF).")
+            # Check file type, preferring the format sniffed from the file header
+            image_format = getattr(image, 'image_format', None)
+            if image_format is not None:
+                if image_format not in settings.UPLOAD_ALLOWED_FORMATS:
+                    raise forms.ValidationError("Please upload a valid image file (JPEG, PNG, GIF).")
+            else:
+                allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif']
+                if image.content_type not in allowed_types:
+                    raise forms.ValidationError("Please upload a valid image file (JPEG, PNG, GIF).")
         
         return image 
\ No newline at end of file
@@ -0,0 +1,350 @@
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .autotune import get_profile
+from .models import DetectionResult, UploadedImage
+from .parity import IMAGE_EXTENSIONS
+from .registry import get_registry
+from .services import load_image
+
+_DONE = object()
+
+
+class PipelineError(RuntimeError):
+    """Raised by Pipeline.run when a stage thread died instead of finishing"""
+
+
+def iter_images(folder):
+    """Yield (relative path, path) of every image under a folder in a stable order
+
+    Walks lazily, so archives with millions of files never sit in one list.
+    """
+    folder = Path(folder)
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                path = Path(root) / name
+                yield path.relative_to(folder).as_posix(), path
+
+
+class Checkpoint:
+    """Append-only JSON-lines log of images that are finished
+
+    A line is written only after the batch containing the image has been
+    committed to the database, so a resumed run skips exactly those.
+    """
+
+    def __init__(self, path, retry_errors=False):
+        self.path = Path(path)
+        self.done = set()
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        if entry['status'] == 'ok' or not retry_errors:
+                            self.done.add(entry['path'])
+        self._file = None
+
+    def record(self, items):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        for item in items:
+            self._file.write(json.dumps({'path': item['rel'], 'status': 'error' if item.get('error') else 'ok'}) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class Pipeline:
+    """Decode, preprocess, batched inference, postprocess and bulk insert as threaded stages
+
+    Stages are connected by bounded queues, so a slow stage applies
+    backpressure instead of buffering the archive in memory. Decoding,
+    resizing and ONNX Runtime release the GIL, so the CPU-bound stages run
+    in parallel; inference and the database writer are single threads.
+    """
+
+    def __init__(self, folder, backend='onnx', model=None, filters=None, batch_size=None, workers=None,
+                 queue_size=64, commit_every=256, batch_timeout=0.05, checkpoint=None, progress=None):
+        self.folder = Path(folder)
+        self.backend = backend
+        self.service = get_registry().get(model)
+        self.filters = filters
+        if batch_size is None:
+            # The autotuned batch size for this host, if there is one
+            profile = get_profile(self.service.name, backend) or {}
+            batch_size = profile.get('batch_size', 8)
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.commit_every = commit_every
+        self.batch_timeout = batch_timeout
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.stop = threading.Event()
+        self.failed = threading.Event()
+        self.failure = None
+        self.counts = {'images': 0, 'errors': 0, 'detections': 0, 'skipped': 0}
+        self.busy = {}
+        self._busy_lock = threading.Lock()
+        # Folders that share a basename (/a/photos, /b/photos) must not share a directory
+        folder_hash = hashlib.sha1(str(self.folder.resolve()).encode()).hexdigest()[:8]
+        self.backfill_dir = Path(settings.MEDIA_ROOT) / 'uploads' / 'backfill' / f'{self.folder.name}-{folder_hash}'
+
+    def run(self):
+        """Process the folder and return counts, per-stage busy seconds and images/sec"""
+        if self.backend == 'pytorch':
+            self.service.load_pytorch_model()
+        else:
+            self.service.load_onnx_model()
+
+        queues = [queue.Queue(self.queue_size) for _ in range(5)]
+        threads = [self._thread('walk', self._walk, queues[0])]
+        threads += self._stage('decode', self._decode, queues[0], queues[1], self.workers)
+        threads += self._stage('preprocess', self._preprocess, queues[1], queues[2], self.workers)
+        threads.append(self._thread('inference', self._infer, queues[2], queues[3]))
+        threads += self._stage('postprocess', self._postprocess, queues[3], queues[4], self.workers)
+        writer = self._thread('write', self._write, queues[4])
+        threads.append(writer)
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while writer.is_alive() and not self.failed.is_set():
+                writer.join(timeout=0.5)
+        except KeyboardInterrupt:
+            # Stop reading new files and let everything already in flight be committed
+            self.stop.set()
+            while writer.is_alive() and not self.failed.is_set():
+                writer.join(timeout=0.5)
+        if self.failed.is_set():
+            # The other stages give up on their next get or put; drop what they had queued
+            for thread in threads:
+                thread.join(timeout=1.0)
+            for stage_queue in queues:
+                while not stage_queue.empty():
+                    stage_queue.get_nowait()
+            stage, error = self.failure
+            raise PipelineError(f'{stage} stage failed: {error}') from error
+        elapsed = time.perf_counter() - started
+        return dict(
+            self.counts,
+            seconds=elapsed,
+            images_per_second=self.counts['images'] / elapsed if elapsed else 0.0,
+            interrupted=self.stop.is_set(),
+            busy_seconds=dict(self.busy),
+        )
+
+    def _timed(self, stage, started):
+        with self._busy_lock:
+            self.busy[stage] = self.busy.get(stage, 0.0) + time.perf_counter() - started
+
+    def _thread(self, stage, target, *args):
+        """A stage thread that records its exception and fails the pipeline instead of dying silently"""
+        def run():
+            try:
+                target(*args)
+            except Exception as e:
+                if self.failure is None:
+                    self.failure = (stage, e)
+                self.stop.set()
+                self.failed.set()
+
+        return threading.Thread(target=run, name=f'ingest-{stage}')
+
+    def _get(self, inbox, timeout=None):
+        """Queue.get that returns _DONE once the pipeline has failed, so no stage waits forever"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.failed.is_set():
+            wait = 0.1 if deadline is None else max(0.0, min(0.1, deadline - time.monotonic()))
+            try:
+                return inbox.get(timeout=wait)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+        return _DONE
+
+    def _put(self, outbox, item):
+        """Queue.put that gives up once the pipeline has failed, so no stage blocks on a full queue"""
+        while not self.failed.is_set():
+            try:
+                outbox.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _walk(self, outbox):
+        done = self.checkpoint.done if self.checkpoint else set()
+        for rel, path in iter_images(self.folder):
+            if self.stop.is_set():
+                break
+            if rel in done:
+                self.counts['skipped'] += 1
+                continue
+            self._put(outbox, {'rel': rel, 'path': path})
+        self._put(outbox, _DONE)
+
+    def _stage(self, name, fn, inbox, outbox, workers):
+        """Start worker threads applying fn to items; the last one to finish forwards _DONE"""
+        remaining = [workers]
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    # Let sibling workers see the end too
+                    self._put(inbox, _DONE)
+                    with lock:
+                        remaining[0] -= 1
+                        if remaining[0] == 0:
+                            self._put(outbox, _DONE)
+                    return
+                if not item.get('error'):
+                    started = time.perf_counter()
+                    try:
+                        fn(item)
+                    except Exception as e:
+                        item['error'] = f'{name}: {e}'
+                    self._timed(name, started)
+                self._put(outbox, item)
+
+        return [self._thread(name, worker) for _ in range(workers)]
+
+    def _decode(self, item):
+        item['image'] = load_image(item['path'])
+
+    def _preprocess(self, item):
+        height, width = item['image'].shape[:2]
+        item['size'] = (width, height)
+        if self.backend == 'onnx':
+            item['tensor'], _ = self.service.preprocess_onnx(item.pop('image'))
+
+    def _infer(self, inbox, outbox):
+        finished = False
+        while not finished:
+            batch = []
+            # Block for the first item, then top the batch up for at most batch_timeout
+            deadline = None
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._get(inbox, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                if item.get('error'):
+                    self._put(outbox, item)
+                    continue
+                batch.append(item)
+                deadline = deadline or time.monotonic() + self.batch_timeout
+            if batch:
+                started = time.perf_counter()
+                try:
+                    self._infer_batch(batch)
+                except Exception as e:
+                    for item in batch:
+                        item['error'] = f'inference: {e}'
+                self._timed('inference', started)
+                for item in batch:
+                    self._put(outbox, item)
+        self._put(outbox, _DONE)
+
+    def _infer_batch(self, batch):
+        if self.backend == 'pytorch':
+            # Every archive image is seen once, so caching would only evict interactive entries
+            results = self.service.run_pytorch_inference([item.pop('image') for item in batch], filters=self.filters,
+                                                         cache=False)
+            for item, detections in zip(batch, results):
+                item['detections'] = detections
+        else:
+            outputs = self.service.run_onnx_batch([item.pop('tensor') for item in batch], filters=self.filters)
+            for item, raw in zip(batch, outputs):
+                item['raw'] = raw
+
+    def _postprocess(self, item):
+        if 'raw' in item:
+            width, height = item['size']
+            item['detections'] = self.service._process_onnx_outputs(
+                item.pop('raw'), width, height, input_size=self.service.onnx_input_size, filters=self.filters,
+            )
+        item['name'] = self._media_name(item)
+
+    def _media_name(self, item):
+        """Name of the image relative to MEDIA_ROOT, hard-linking (or copying) it in if needed"""
+        path = item['path'].resolve()
+        media_root = Path(settings.MEDIA_ROOT).resolve()
+        if media_root in path.parents:
+            return path.relative_to(media_root).as_posix()
+        target = self.backfill_dir / item['rel']
+        if target.exists() and not self._same_file(path, target):
+            # The source changed since an earlier run: link the current version instead
+            target.unlink()
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)
+        return target.relative_to(settings.MEDIA_ROOT).as_posix()
+
+    @staticmethod
+    def _same_file(source, target):
+        """Whether target is a hard link to, or a same-size copy of, source"""
+        source_stat, target_stat = source.stat(), target.stat()
+        if (source_stat.st_dev, source_stat.st_ino) == (target_stat.st_dev, target_stat.st_ino):
+            return True
+        return source_stat.st_size == target_stat.st_size and source_stat.st_mtime_ns == target_stat.st_mtime_ns
+
+    def _write(self, inbox):
+        pending = []
+        try:
+            while True:
+                item = self._get(inbox)
+                if self.failed.is_set():
+                    return
+                if item is not _DONE:
+                    pending.append(item)
+                if pending and (item is _DONE or len(pending) >= self.commit_every):
+                    started = time.perf_counter()
+                    self._commit(pending)
+                    self._timed('write', started)
+                    pending = []
+                if item is _DONE:
+                    return
+        finally:
+            close_old_connections()
+
+    def _commit(self, items):
+        ok = [item for item in items if not item.get('error')]
+        detection_field = f'{self.backend}_detections'
+        with transaction.atomic():
+            images = UploadedImage.objects.bulk_create([UploadedImage(image=item['name']) for item in ok])
+            DetectionResult.objects.bulk_create([
+                DetectionResult(uploaded_image=image, **{detection_field: item['detections']})
+                for image, item in zip(images, ok)
+            ])
+        if self.checkpoint:
+            self.checkpoint.record(items)
+        self.counts['images'] += len(ok)
+        self.counts['errors'] += len(items) - len(ok)
+        self.counts['detections'] += sum(len(item['detections']) for item in ok)
+        if self.progress:
+            self.progress(self.counts, [item for item in items if item.get('error')])
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.autotune import get_profile, host_fingerprint, tune_onnx, tune_pytorch
+from detection.registry import UnknownModelError, get_registry
+from detection.services import BackendUnavailable, load_image
+
+
+class Command(BaseCommand):
+    help = 'Benchmark inference configurations on this host and save the fastest as its profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help='Registered model name (default: the default model)')
+        parser.add_argument('--backend', choices=['onnx', 'pytorch', 'all'], default='all')
+        parser.add_argument('--image', default=None, help='Calibration image (default: AUTOTUNE_CALIBRATION_IMAGE)')
+        parser.add_argument('--runs', type=int, default=None, help='Timed runs per configuration')
+        parser.add_argument('--show', action='store_true', help='Only print the saved profile of this host')
+
+    def handle(self, *args, **options):
+        try:
+            service = get_registry().get(options['model'])
+            image = load_image(options['image']) if options['image'] else None
+        except (UnknownModelError, ValueError) as e:
+            raise CommandError(str(e))
+        backends = ['onnx', 'pytorch'] if options['backend'] == 'all' else [options['backend']]
+        fingerprint, details = host_fingerprint()
+        self.stdout.write(f"Host {fingerprint}: {details['cpu']}, {details['cores']} cores")
+
+        if options['show']:
+            profiles = {backend: get_profile(service.name, backend) for backend in backends}
+            self.stdout.write(json.dumps(profiles, indent=2))
+            return
+
+        tuners = {'onnx': tune_onnx, 'pytorch': tune_pytorch}
+        for backend in backends:
+            self.stdout.write(f"Tuning {backend} for {service.name}...")
+            try:
+                profile = tuners[backend](service, image=image, runs=options['runs'], log=self.stdout.write)
+            except BackendUnavailable as e:
+                self.stdout.write(self.style.WARNING(f"  {e}"))
+                continue
+            # Reload with the new profile on next use
+            service.unload()
+            chosen = {key: value for key, value in profile.items() if key != 'candidates'}
+            self.stdout.write(self.style.SUCCESS(f"  {backend} profile: {chosen}"))
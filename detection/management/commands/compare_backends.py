@@ -0,0 +1,68 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.parity import collect_corpus, parse_config, run_parity
+
+
+class Command(BaseCommand):
+    help = 'Compare detections of two backend configurations over an image corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reference', default='pytorch',
+                            help="Reference configuration as 'backend[:model]' (default: pytorch)")
+        parser.add_argument('--candidate', default='onnx',
+                            help="Candidate configuration as 'backend[:model]' (default: onnx)")
+        parser.add_argument('--corpus', default=str(settings.MEDIA_ROOT / 'uploads'),
+                            help='Image file or directory to compare on')
+        parser.add_argument('--iou', type=float, default=0.5,
+                            help='IoU threshold for matching detections')
+        parser.add_argument('--class-agnostic', action='store_true',
+                            help='Match boxes regardless of class id')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of images compared in parallel')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Only compare the first N images')
+        parser.add_argument('--output', default=None,
+                            help='Write the full per-image report as JSON to this path')
+
+    def handle(self, *args, **options):
+        try:
+            reference = parse_config(options['reference'])
+            candidate = parse_config(options['candidate'])
+        except (ValueError, KeyError) as e:
+            raise CommandError(str(e))
+
+        paths = collect_corpus(options['corpus'])[:options['limit']]
+        if not paths:
+            raise CommandError(f"No images found in {options['corpus']}")
+
+        self.stdout.write(f"Comparing {reference['spec']} (reference) against "
+                          f"{candidate['spec']} on {len(paths)} images...")
+        report = run_parity(
+            paths, reference, candidate,
+            iou_threshold=options['iou'],
+            class_aware=not options['class_agnostic'],
+            workers=options['workers'],
+        )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Full report written to {options['output']}")
+
+        for image in report['images']:
+            self.stdout.write(
+                f"  {image['image']}: P={image['precision']:.2f} R={image['recall']:.2f} "
+                f"({image['matched']}/{image['reference_count']} ref, {image['candidate_count']} cand) "
+                f"speed x{image['speed_ratio'] or 0:.2f}"
+            )
+
+        summary = report['summary']
+        box_error = summary['mean_box_error']
+        self.stdout.write(self.style.SUCCESS(
+            f"Precision {summary['precision']:.3f}  Recall {summary['recall']:.3f}  "
+            f"Box error {box_error if box_error is None else round(box_error, 2)} px  "
+            f"Speed ratio x{summary['speed_ratio'] or 0:.2f}"
+        ))
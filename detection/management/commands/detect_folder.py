@@ -0,0 +1,84 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.filters import DetectionFilter, InvalidFilter
+from detection.ingest import Checkpoint, Pipeline, PipelineError
+from detection.parity import parse_config
+
+
+class Command(BaseCommand):
+    help = 'Backfill detections for every image under a folder with a pipelined, resumable run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('folder', help='Folder of images (searched recursively)')
+        parser.add_argument('--config', default='onnx',
+                            help="Detector configuration as 'backend[:model]' (default: onnx)")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Images per inference call (default: the autotuned size, else 8)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Threads per decode/preprocess/postprocess stage (default: CPU count)')
+        parser.add_argument('--queue-size', type=int, default=64, help='Bound of each inter-stage queue')
+        parser.add_argument('--commit-every', type=int, default=256, help='Images per bulk insert and checkpoint')
+        parser.add_argument('--checkpoint', default=None,
+                            help='Checkpoint file (default: .detect_folder.<config>.jsonl in the folder)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--retry-errors', action='store_true', help='Retry images that failed last time')
+        parser.add_argument('--filters', default=None,
+                            help='Detection filter as JSON, e.g. \'{"classes": [0, 2], "confidence": 0.4}\'')
+
+    def handle(self, *args, **options):
+        folder = Path(options['folder'])
+        if not folder.is_dir():
+            raise CommandError(f'{folder} is not a directory')
+        try:
+            config = parse_config(options['config'])
+            filters = DetectionFilter.from_dict(json.loads(options['filters'])) if options['filters'] else None
+        except InvalidFilter as e:
+            raise CommandError(str(e))
+        except (ValueError, KeyError) as e:
+            raise CommandError(str(e))
+
+        checkpoint_path = Path(options['checkpoint'] or folder / f".detect_folder.{config['spec'].replace(':', '-')}.jsonl")
+        if options['restart'] and checkpoint_path.exists():
+            checkpoint_path.unlink()
+        checkpoint = Checkpoint(checkpoint_path, retry_errors=options['retry_errors'])
+        if checkpoint.done:
+            self.stdout.write(f"Resuming: {len(checkpoint.done)} images already done ({checkpoint_path})")
+
+        started = time.perf_counter()
+
+        def progress(counts, errors):
+            for item in errors:
+                self.stderr.write(f"  {item['rel']}: {item['error']}")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{counts['images']} images ({counts['errors']} errors, {counts['detections']} detections), "
+                f"{counts['images'] / elapsed:.1f} images/s"
+            )
+
+        pipeline = Pipeline(
+            folder, backend=config['backend'], model=config['model'], filters=filters,
+            batch_size=options['batch_size'], workers=options['workers'], queue_size=options['queue_size'],
+            commit_every=options['commit_every'], checkpoint=checkpoint, progress=progress,
+        )
+        try:
+            report = pipeline.run()
+        except PipelineError as e:
+            raise CommandError(f"{e}; images committed so far are in the checkpoint")
+        finally:
+            checkpoint.close()
+
+        if report['busy_seconds']:
+            busy = ', '.join(f'{stage} {seconds:.1f}s' for stage, seconds in report['busy_seconds'].items())
+            self.stdout.write(f"Stage busy time: {busy}")
+        summary = (
+            f"{report['images']} images in {report['seconds']:.1f} s ({report['images_per_second']:.1f} images/s), "
+            f"{report['errors']} errors, {report['skipped']} skipped from the checkpoint"
+        )
+        if report['interrupted']:
+            self.stdout.write(self.style.WARNING(f"Interrupted; progress saved. {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
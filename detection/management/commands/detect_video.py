@@ -0,0 +1,133 @@
+import functools
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.parity import match_detections, parse_config
+from detection.registry import get_registry
+from detection.tracking import KeyframeDetector
+
+
+class Command(BaseCommand):
+    help = 'Detect objects in a video on keyframes only, tracking them in between'
+
+    def add_arguments(self, parser):
+        parser.add_argument('video', help='Input video file')
+        parser.add_argument('--config', default='onnx',
+                            help="Detector configuration as 'backend[:model]' (default: onnx)")
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Initial keyframe interval (adapts to motion afterwards)')
+        parser.add_argument('--fixed-interval', action='store_true',
+                            help='Keep the keyframe interval fixed instead of adapting it')
+        parser.add_argument('--max-frames', type=int, default=None)
+        parser.add_argument('--output', default=None, help='Write an annotated video to this path')
+        parser.add_argument('--json', default=None, help='Write per-frame tracks as JSON lines to this path')
+        parser.add_argument('--compare', action='store_true',
+                            help='Also run per-frame detection and report speedup and agreement')
+
+    def handle(self, *args, **options):
+        import cv2
+
+        try:
+            config = parse_config(options['config'])
+        except (ValueError, KeyError) as e:
+            raise CommandError(str(e))
+        service = get_registry().get(config['model'])
+        run = service.run_pytorch_inference if config['backend'] == 'pytorch' else service.run_onnx_inference
+        # Video frames never repeat exactly, so keep them out of the tensor cache
+        run = functools.partial(run, cache=False)
+
+        detector = KeyframeDetector(run, interval=options['interval'])
+        if options['fixed_interval']:
+            detector.min_interval = detector.max_interval = detector.interval
+
+        frames = self.read_frames(cv2, options['video'], options['max_frames'])
+        first = next(frames, None)
+        frames.close()
+        if first is None:
+            raise CommandError(f"Could not read frames from {options['video']}")
+        # Warm the model up so neither timing includes loading it
+        run(first)
+
+        writer = None
+        json_file = open(options['json'], 'w') if options['json'] else None
+        tracked = []
+        count = 0
+        started = time.perf_counter()
+        for frame in self.read_frames(cv2, options['video'], options['max_frames']):
+            tracks, keyframe = detector.process(frame)
+            count += 1
+            if options['compare']:
+                tracked.append(tracks)
+            if json_file:
+                json_file.write(json.dumps({'frame': count - 1, 'keyframe': keyframe, 'tracks': tracks}) + '\n')
+            if options['output']:
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    # Keep the source's timing so the output is not re-timed
+                    fps = self.source_fps(cv2, options['video'])
+                    writer = cv2.VideoWriter(options['output'], cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+                writer.write(self.annotate(cv2, frame, tracks, keyframe))
+        tracked_seconds = time.perf_counter() - started
+        tracked_fps = count / tracked_seconds
+        if json_file:
+            json_file.close()
+        if writer is not None:
+            writer.release()
+            self.stdout.write(f"Annotated video written to {options['output']}")
+
+        self.stdout.write(
+            f"{count} frames, {detector.keyframes} keyframes "
+            f"({detector.keyframes / count:.0%} detected), final interval {detector.interval}; "
+            f"{tracked_fps:.1f} fps"
+        )
+
+        if options['compare']:
+            started = time.perf_counter()
+            reference = [run(frame) for frame in self.read_frames(cv2, options['video'], options['max_frames'])]
+            per_frame_fps = len(reference) / (time.perf_counter() - started)
+            reports = [match_detections(ref, tracks) for ref, tracks in zip(reference, tracked)]
+            matched = sum(r['matched'] for r in reports)
+            ref_count = sum(r['reference_count'] for r in reports)
+            cand_count = sum(r['candidate_count'] for r in reports)
+            self.stdout.write(self.style.SUCCESS(
+                f"Per-frame detection: {per_frame_fps:.1f} fps; speedup x{tracked_fps / per_frame_fps:.2f}; "
+                f"agreement precision {matched / cand_count if cand_count else 1.0:.3f}, "
+                f"recall {matched / ref_count if ref_count else 1.0:.3f}"
+            ))
+
+    @staticmethod
+    def source_fps(cv2, path):
+        capture = cv2.VideoCapture(path)
+        try:
+            fps = capture.get(cv2.CAP_PROP_FPS)
+        finally:
+            capture.release()
+        # 0 (unknown), -1 (unreadable) and nan all mean the container gave no usable rate
+        return fps if fps > 0 else 30
+
+    @staticmethod
+    def read_frames(cv2, path, max_frames):
+        capture = cv2.VideoCapture(path)
+        try:
+            count = 0
+            while max_frames is None or count < max_frames:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                count += 1
+                yield frame
+        finally:
+            capture.release()
+
+    @staticmethod
+    def annotate(cv2, frame, tracks, keyframe):
+        frame = frame.copy()
+        color = (0, 0, 255) if keyframe else (0, 255, 0)
+        for track in tracks:
+            x1, y1, x2, y2 = (int(v) for v in track['bbox'])
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(frame, f"#{track['track_id']} {track['class_name']}", (x1, max(y1 - 5, 10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        return frame
@@ -0,0 +1,290 @@
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.models import delete_uploads
+from detection.parity import collect_corpus
+
+DETECT_PATH = '/detection/api/detect/'
+READY_PATH = '/detection/api/admission/'
+
+
+class Command(BaseCommand):
+    help = 'Load-test /detection/api/detect/ over HTTP with an open- or closed-loop client'
+
+    def add_arguments(self, parser):
+        parser.add_argument('corpus', nargs='?', default=None,
+                            help='Image file or directory to replay (default: MEDIA_ROOT/uploads)')
+        parser.add_argument('--mode', choices=['closed', 'open'], default='closed',
+                            help='closed: N clients send back to back; open: requests arrive at --rate')
+        parser.add_argument('--concurrency', type=int, default=4, help='Clients in closed-loop mode')
+        parser.add_argument('--rate', type=float, default=5.0, help='Requests per second in open-loop mode')
+        parser.add_argument('--poisson', action='store_true', help='Exponential instead of fixed arrival gaps')
+        parser.add_argument('--max-in-flight', type=int, default=64,
+                            help='Open-loop connection limit; arrivals beyond it still count their wait')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to send requests for')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests before the run')
+        parser.add_argument('--timeout', type=float, default=60.0)
+        parser.add_argument('--params', default='', help='Extra form fields, e.g. "model=yolo11s&format=binary"')
+        parser.add_argument('--url', default=None,
+                            help='Base URL of a running server; without it a local server is started')
+        parser.add_argument('--server-pid', type=int, default=None,
+                            help='PID of the --url server, to report its CPU use')
+        parser.add_argument('--server-cmd', default=None,
+                            help='Command starting the local server, with {port} (default: runserver)')
+        parser.add_argument('--output-dir', default=str(settings.BASE_DIR / 'loadtests'),
+                            help='Directory the JSON report is saved in')
+        parser.add_argument('--baseline', default=None, help='Earlier report to compare against')
+        parser.add_argument('--keep', action='store_true', help='Keep the uploads and results created')
+
+    def handle(self, *args, **options):
+        corpus = [Path(p) for p in collect_corpus(options['corpus'] or Path(settings.MEDIA_ROOT) / 'uploads')]
+        if not corpus:
+            raise CommandError('No images found in the corpus')
+        payloads = [(path.name, path.read_bytes()) for path in corpus]
+        fields = dict(pair.split('=', 1) for pair in options['params'].split('&') if pair)
+
+        server = None
+        base_url = options['url']
+        server_pid = options['server_pid']
+        if base_url is None:
+            server, base_url = self.start_server(options['server_cmd'])
+            server_pid = server.pid
+        image_ids = []
+        try:
+            client = _Client(base_url.rstrip('/') + DETECT_PATH, payloads, fields, options['timeout'], image_ids)
+            for _ in range(options['warmup']):
+                client.send()
+            client.results.clear()
+
+            cpu_before = process_cpu_seconds(server_pid) if server_pid else None
+            started = time.perf_counter()
+            if options['mode'] == 'closed':
+                self.run_closed(client, options['concurrency'], options['duration'])
+            else:
+                self.run_open(client, options['rate'], options['poisson'], options['max_in_flight'],
+                              options['duration'])
+            wall = time.perf_counter() - started
+            cpu = process_cpu_seconds(server_pid) - cpu_before if server_pid else None
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+            if not options['keep']:
+                delete_uploads(image_ids)
+
+        report = summarize(client.results, wall, cpu)
+        report.update({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'mode': options['mode'],
+            'concurrency': options['concurrency'] if options['mode'] == 'closed' else None,
+            'target_rate': options['rate'] if options['mode'] == 'open' else None,
+            'duration': options['duration'],
+            'corpus_images': len(corpus),
+            'params': fields,
+            'server': 'external' if options['url'] else (options['server_cmd'] or 'runserver'),
+        })
+        self.print_report(report)
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        output = Path(options['output_dir']) / f"{datetime.now():%Y%m%d-%H%M%S}-{options['mode']}.json"
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"Report saved to {output}")
+
+        if options['baseline']:
+            self.print_comparison(json.loads(Path(options['baseline']).read_text()), report)
+
+    def start_server(self, server_cmd):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        if server_cmd:
+            command = server_cmd.format(port=port).split()
+        else:
+            command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+        base_url = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Server exited with {server.returncode}: {' '.join(command)}")
+            try:
+                urllib.request.urlopen(base_url + READY_PATH, timeout=1).close()
+                self.stdout.write(f"Started server on {base_url} (pid {server.pid})")
+                return server, base_url
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('Server did not become ready within 30 seconds')
+
+    @staticmethod
+    def run_closed(client, concurrency, duration):
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            while time.perf_counter() < deadline:
+                client.send()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    @staticmethod
+    def run_open(client, rate, poisson, max_in_flight, duration):
+        # Latency counts from the scheduled arrival, so a slow server cannot
+        # hide its queueing by holding the client back (coordinated omission)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            scheduled = started
+            while scheduled < started + duration:
+                time.sleep(max(0.0, scheduled - time.perf_counter()))
+                executor.submit(client.send, scheduled)
+                scheduled += random.expovariate(rate) if poisson else 1.0 / rate
+
+    def print_report(self, report):
+        latency = report['latency_ms']
+        cpu = report['server_cpu_percent']
+        self.stdout.write(
+            f"{report['requests']} requests in {report['seconds']:.1f} s: {report['throughput_rps']:.2f} req/s "
+            f"({report['ok_rps']:.2f} ok/s)"
+        )
+        if latency:
+            self.stdout.write(
+                f"latency p50 {latency['p50']:.0f} ms, p90 {latency['p90']:.0f} ms, p95 {latency['p95']:.0f} ms, "
+                f"p99 {latency['p99']:.0f} ms, max {latency['max']:.0f} ms"
+            )
+        self.stdout.write(
+            f"errors {report['error_rate']:.1%}, 429 {report['rate_429']:.1%}, statuses {report['statuses']}; "
+            f"server CPU {f'{cpu:.0f}%' if cpu is not None else 'n/a'}"
+        )
+
+    def print_comparison(self, baseline, report):
+        self.stdout.write(f"Compared with the run of {baseline.get('timestamp')}:")
+        for label, key in (('throughput', 'throughput_rps'), ('error rate', 'error_rate'), ('429 rate', 'rate_429')):
+            self.stdout.write(f"  {label}: {baseline.get(key, 0):.3f} -> {report[key]:.3f}")
+        for q in ('p50', 'p95', 'p99'):
+            before = (baseline.get('latency_ms') or {}).get(q)
+            after = (report['latency_ms'] or {}).get(q)
+            if before and after:
+                self.stdout.write(f"  latency {q}: {before:.0f} -> {after:.0f} ms ({after / before - 1:+.0%})")
+
+
+class _Client:
+    """Sends corpus images round-robin as multipart POSTs and records the outcome"""
+
+    def __init__(self, url, payloads, fields, timeout, image_ids):
+        self.url = url
+        self.payloads = itertools.cycle(payloads)
+        self.fields = fields
+        self.timeout = timeout
+        self.image_ids = image_ids
+        self.results = []
+        self._lock = threading.Lock()
+
+    def _encode(self, filename, content):
+        boundary = uuid.uuid4().hex
+        parts = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in self.fields.items()
+        ]
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n'
+        )
+        parts.append(f'--{boundary}--\r\n'.encode())
+        return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+    def send(self, scheduled=None):
+        with self._lock:
+            filename, content = next(self.payloads)
+        body, content_type = self._encode(filename, content)
+        # Let the server drop work this client will have stopped waiting for
+        request = urllib.request.Request(self.url, data=body, headers={
+            'Content-Type': content_type, 'X-Request-Timeout': str(self.timeout),
+        })
+        started = scheduled if scheduled is not None else time.perf_counter()
+        image_id = None
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status = response.status
+                payload = response.read()
+            if response.headers.get_content_type().endswith('json'):
+                image_id = json.loads(payload).get('image_id')
+            else:
+                image_id = response.headers.get('X-Detection-Image-Id')
+        except urllib.error.HTTPError as e:
+            status = e.code
+            e.close()
+        except OSError:
+            status = 'error'
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.results.append((status, latency))
+            if image_id is not None:
+                self.image_ids.append(int(image_id))
+
+
+def process_cpu_seconds(pid):
+    """User + system CPU seconds of a process and its direct children (Linux /proc)"""
+    ticks = os.sysconf('SC_CLK_TCK')
+    total = 0
+    for stat_path in Path('/proc').glob('[0-9]*/stat'):
+        try:
+            # Fields after the parenthesised command name: state, ppid, ..., utime (12), stime (13)
+            fields = stat_path.read_text().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(stat_path.parent.name) == pid or int(fields[1]) == pid:
+            total += int(fields[11]) + int(fields[12])
+    return total / ticks
+
+
+def summarize(results, seconds, cpu_seconds):
+    """Throughput, latency percentiles and error/429 rates of a run"""
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = [latency for status, latency in results if status == 200]
+    count = len(results)
+    latency_ms = None
+    if ok:
+        ms = np.array(ok) * 1000
+        latency_ms = {
+            'p50': float(np.percentile(ms, 50)),
+            'p90': float(np.percentile(ms, 90)),
+            'p95': float(np.percentile(ms, 95)),
+            'p99': float(np.percentile(ms, 99)),
+            'mean': float(ms.mean()),
+            'max': float(ms.max()),
+        }
+    return {
+        'requests': count,
+        'seconds': seconds,
+        'throughput_rps': count / seconds if seconds else 0.0,
+        'ok_rps': len(ok) / seconds if seconds else 0.0,
+        'latency_ms': latency_ms,
+        'statuses': statuses,
+        'error_rate': sum(1 for status, _ in results if status != 200) / count if count else 0.0,
+        'rate_429': statuses.get('429', 0) / count if count else 0.0,
+        'server_cpu_seconds': cpu_seconds,
+        'server_cpu_percent': cpu_seconds / seconds * 100 if cpu_seconds is not None and seconds else None,
+    }
@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+HEAVY_MODULES = ['torch', 'ultralytics', 'onnxruntime', 'cv2']
+
+# Run in a fresh interpreter so nothing is already imported
+_APP_STARTUP = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+import detection.views, detection.urls
+elapsed = time.perf_counter() - started
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+"""
+
+_MODULE_IMPORT = """
+import json, time
+started = time.perf_counter()
+try:
+    import %s
+except ImportError as e:
+    print(json.dumps({'error': str(e)}))
+else:
+    print(json.dumps({'seconds': time.perf_counter() - started}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure app startup time and the cost of the lazily imported backend modules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Fresh interpreters per measurement (the best run is reported)')
+        parser.add_argument('--json', action='store_true', help='Print the measurements as JSON')
+
+    def _run(self, code, repeat):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'yolo_detection.settings'))
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env,
+                capture_output=True, text=True, check=True,
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        timed = [run for run in runs if 'seconds' in run]
+        return min(timed, key=lambda run: run['seconds']) if timed else runs[0]
+
+    def handle(self, *args, **options):
+        repeat = max(1, options['repeat'])
+        app = self._run(_APP_STARTUP % (HEAVY_MODULES,), repeat)
+        modules = {name: self._run(_MODULE_IMPORT % name, repeat) for name in HEAVY_MODULES}
+        deferred = sum(m.get('seconds', 0) for name, m in modules.items() if name not in app['loaded'])
+        report = {
+            'app_startup_seconds': app['seconds'],
+            'heavy_modules_loaded_at_startup': app['loaded'],
+            'modules': modules,
+            'deferred_import_seconds': deferred,
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"App startup (django.setup + detection views): {app['seconds'] * 1000:.0f} ms")
+        for name, result in modules.items():
+            if 'seconds' in result:
+                state = 'loaded at startup' if name in app['loaded'] else 'deferred'
+                self.stdout.write(f"  import {name}: {result['seconds'] * 1000:.0f} ms ({state})")
+            else:
+                self.stdout.write(f"  import {name}: not installed")
+        self.stdout.write(self.style.SUCCESS(
+            f"Deferred until first inference: {deferred * 1000:.0f} ms of imports"
+        ))
@@ -0,0 +1,111 @@
+import gc
+import json
+import os
+import time
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from detection.memory import get_memory_monitor, get_rss_bytes, tracemalloc_snapshot
+from detection.models import delete_uploads
+
+
+class Command(BaseCommand):
+    help = 'Send repeated detection requests in-process and check that RSS stays flat'
+
+    def add_arguments(self, parser):
+        parser.add_argument('image', help='Image file to upload on every request')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--warmup', type=int, default=50,
+                            help='Requests before the baseline is taken (model loads, caches fill)')
+        parser.add_argument('--sample-every', type=int, default=25)
+        parser.add_argument('--max-growth-mb', type=float, default=20.0,
+                            help='Fail when RSS grows more than this after the warmup')
+        parser.add_argument('--path', default='/detection/api/detect/')
+        parser.add_argument('--model', default=None)
+        parser.add_argument('--host', default='localhost', help='Host header (must be in ALLOWED_HOSTS)')
+        parser.add_argument('--tracemalloc', action='store_true',
+                            help='Trace allocations after the warmup and print the top growth sites')
+        parser.add_argument('--keep', action='store_true', help='Keep the uploads and results created')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['image'], 'rb') as f:
+                payload = f.read()
+        except OSError as e:
+            raise CommandError(str(e))
+        if options['requests'] <= options['warmup']:
+            raise CommandError('--requests must be larger than --warmup')
+
+        # Measure growth rather than recycling away from it
+        monitor = get_memory_monitor()
+        monitor.max_requests = monitor.max_rss_mb = 0
+        client = Client(HTTP_HOST=options['host'])
+        data = {'model': options['model']} if options['model'] else {}
+        image_ids = []
+        samples = []
+        failures = 0
+        started = time.perf_counter()
+        try:
+            for i in range(1, options['requests'] + 1):
+                upload = SimpleUploadedFile(os.path.basename(options['image']), payload)
+                response = client.post(options['path'], dict(data, image=upload))
+                if response.status_code == 200:
+                    image_ids.append(json.loads(response.content).get('image_id'))
+                else:
+                    failures += 1
+                    if failures == 1:
+                        self.stderr.write(f"Request {i} failed with {response.status_code}: {response.content[:200]!r}")
+                if i == options['warmup'] and options['tracemalloc']:
+                    tracemalloc_snapshot()
+                if i >= options['warmup'] and (i - options['warmup']) % options['sample_every'] == 0:
+                    gc.collect()
+                    samples.append((i, get_rss_bytes()))
+                    self.stdout.write(f"{i:6d} requests: RSS {samples[-1][1] / 1024 / 1024:.1f} MB")
+        finally:
+            if not options['keep']:
+                delete_uploads(image_ids)
+
+        if failures == options['requests']:
+            raise CommandError('Every request failed; nothing was measured')
+        report = self.report(samples, failures, time.perf_counter() - started, options)
+        if options['tracemalloc']:
+            report['tracemalloc_top'] = tracemalloc_snapshot(10, compare=True)['top']
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(
+                f"{report['requests']} requests ({report['failures']} failed) in {report['seconds']:.1f} s; "
+                f"RSS {report['baseline_rss_mb']:.1f} -> {report['final_rss_mb']:.1f} MB after warmup, "
+                f"slope {report['slope_mb_per_1000']:.2f} MB per 1000 requests"
+            )
+            for stat in report.get('tracemalloc_top', []):
+                self.stdout.write(f"  {stat['size_diff_bytes'] / 1024:+.1f} KiB {stat['location']}")
+        if report['growth_mb'] > options['max_growth_mb']:
+            raise CommandError(
+                f"RSS grew {report['growth_mb']:.1f} MB after warmup (limit {options['max_growth_mb']} MB)"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Memory flat: grew {report['growth_mb']:.1f} MB after warmup"))
+
+    @staticmethod
+    def report(samples, failures, seconds, options):
+        requests, rss = (np.array(values, dtype=np.float64) for values in zip(*samples))
+        rss_mb = rss / 1024 / 1024
+        slope = np.polyfit(requests, rss_mb, 1)[0] * 1000 if len(samples) > 1 else 0.0
+        return {
+            'requests': options['requests'],
+            'failures': failures,
+            'seconds': seconds,
+            'baseline_rss_mb': float(rss_mb[0]),
+            'final_rss_mb': float(rss_mb[-1]),
+            'peak_rss_mb': float(rss_mb.max()),
+            'growth_mb': float(rss_mb[-1] - rss_mb[0]),
+            'slope_mb_per_1000': float(slope),
+            'samples': [{'requests': int(n), 'rss_mb': float(mb)} for n, mb in zip(requests, rss_mb)],
+            'views': get_memory_monitor().stats()['views'],
+        }
+
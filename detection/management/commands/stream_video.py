@@ -0,0 +1,107 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Stream a video file to the live detection WebSocket, as a stand-in for a camera'
+
+    def add_arguments(self, parser):
+        parser.add_argument('video', help='Video file path, or a camera index such as 0')
+        parser.add_argument('--url', default='ws://127.0.0.1:8000/ws/detect/',
+                            help='WebSocket URL of the detection stream')
+        parser.add_argument('--backend', default='onnx', choices=['onnx', 'pytorch'])
+        parser.add_argument('--model', default=None, help='Registered model name')
+        parser.add_argument('--fps', type=float, default=None,
+                            help='Frames sent per second (default: the source frame rate)')
+        parser.add_argument('--max-frames', type=int, default=None)
+        parser.add_argument('--quality', type=int, default=80, help='JPEG quality of sent frames')
+
+    def handle(self, *args, **options):
+        try:
+            import websockets
+        except ImportError:
+            raise CommandError('stream_video needs the websockets package (pip install "uvicorn[standard]")')
+        import cv2
+
+        source = int(options['video']) if options['video'].isdigit() else options['video']
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise CommandError(f"Could not open video source {options['video']}")
+        fps = options['fps'] or capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+        query = f"?backend={options['backend']}"
+        if options['model']:
+            query += f"&model={options['model']}"
+        try:
+            summary = asyncio.run(self.stream(websockets, cv2, capture, options['url'] + query, fps, options))
+        finally:
+            capture.release()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {summary['sent']} frames at {fps:.1f} fps; processed {summary['processed']} "
+            f"({summary['processed_fps']:.1f} fps), dropped {summary['dropped']} "
+            f"({summary['drop_rate']:.0%}); latency p50 {summary['latency_p50_ms']:.0f} ms, "
+            f"p95 {summary['latency_p95_ms']:.0f} ms"
+        ))
+
+    async def stream(self, websockets, cv2, capture, url, fps, options):
+        sent_at = {}
+        latencies = []
+        last_stats = {}
+
+        async with websockets.connect(url, max_size=None) as connection:
+            async def receive():
+                async for message in connection:
+                    payload = json.loads(message)
+                    if payload['type'] == 'detections':
+                        latencies.append((time.monotonic() - sent_at.pop(payload['frame'])) * 1000)
+                        last_stats.update(payload['stats'])
+                        self.stdout.write(
+                            f"frame {payload['frame']}: {len(payload['detections'])} detections, "
+                            f"{payload['latency_ms']} ms server, fps {payload['stats']['fps']}, "
+                            f"dropped {payload['stats']['dropped']}"
+                        )
+                    elif payload['type'] == 'stats':
+                        last_stats.update(payload['stats'])
+                        return
+                    elif payload['type'] == 'error':
+                        self.stderr.write(f"frame {payload['frame']}: {payload['error']}")
+
+            receiver = asyncio.create_task(receive())
+            interval = 1.0 / fps
+            sequence = 0
+            next_send = time.monotonic()
+            while options['max_frames'] is None or sequence < options['max_frames']:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, options['quality']])
+                sequence += 1
+                sent_at[sequence] = time.monotonic()
+                await connection.send(encoded.tobytes())
+                # Pace frames like a live camera would
+                next_send += interval
+                await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+
+            # Let the last frame finish, then ask for the final counters
+            await asyncio.sleep(1.0)
+            await connection.send('stats')
+            await asyncio.wait_for(receiver, timeout=10)
+
+        latencies.sort()
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+        return {
+            'sent': sequence,
+            'processed': last_stats.get('processed', 0),
+            'processed_fps': last_stats.get('fps', 0.0),
+            'dropped': last_stats.get('dropped', 0),
+            'drop_rate': last_stats.get('drop_rate', 0.0),
+            'latency_p50_ms': percentile(0.5),
+            'latency_p95_ms': percentile(0.95),
+        }
@@ -0,0 +1,138 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _parse_range(header, size):
+    """Return (start, end) for a single satisfiable byte range, None to send the
+    whole file, or False when the range cannot be satisfied"""
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None  # multiple or malformed ranges: serve the full file
+    start, end = match.groups()
+    if start == '':
+        if end == '':
+            return None
+        length = int(end)  # suffix range: the last N bytes
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class _FileRange:
+    """Read-only view of a byte range of an open file
+
+    Keeps fileno() so servers with a sendfile-backed wsgi.file_wrapper still
+    use it (starting from the current offset, bounded by Content-Length),
+    while plain iteration stops at the end of the range.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve a file from MEDIA_ROOT without streaming it through Python
+
+    MEDIA_SERVE_MODE selects how the bytes are sent:
+    - 'x-accel-redirect': nginx sends the file from an internal location
+    - 'x-sendfile': Apache mod_xsendfile / lighttpd send the file
+    - 'sendfile': a FileResponse the WSGI server can hand to sendfile(2),
+      with single byte-range support done by seeking
+    """
+    if any(part.startswith('.') for part in path.split('/')):
+        # Hidden entries include the upload staging directory
+        raise Http404('Media file not found')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid media path')
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('Media file not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Media file not found')
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    etag = quote_etag(f'{int(stat.st_mtime):x}-{stat.st_size:x}')
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    mode = settings.MEDIA_SERVE_MODE
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        # The front-end server handles ranges and the transfer itself
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(path)
+        else:
+            response['X-Sendfile'] = full_path
+    else:
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if range_header and (if_range is None or if_range.strip() == etag):
+            byte_range = _parse_range(range_header, stat.st_size)
+            if byte_range is False:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+
+        file = open(full_path, 'rb')
+        if byte_range is None:
+            response = FileResponse(file, content_type=content_type)
+        else:
+            start, end = byte_range
+            response = FileResponse(_FileRange(file, start, end - start + 1),
+                                    content_type=content_type, status=206)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -0,0 +1,146 @@
+import os
+import signal
+import threading
+import tracemalloc
+
+from django.conf import settings
+
+
+def get_rss_bytes():
+    """Return the resident set size of the current process in bytes"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if usage > 1 << 32 else usage * 1024
+    except (ImportError, ValueError):
+        return 0
+
+
+class MemoryMonitor:
+    """Per-request RSS deltas and the worker recycling decision
+
+    Deltas are aggregated per view so steady growth in one endpoint stands
+    out. Once the worker has served WORKER_MAX_REQUESTS requests or its RSS
+    exceeds WORKER_MAX_RSS_MB, it is marked for recycling and signals itself
+    after the current response has been sent (see recycle_if_requested).
+    """
+
+    def __init__(self, max_requests=None, max_rss_mb=None):
+        self.max_requests = max_requests if max_requests is not None else settings.WORKER_MAX_REQUESTS
+        self.max_rss_mb = max_rss_mb if max_rss_mb is not None else settings.WORKER_MAX_RSS_MB
+        self.started_rss = get_rss_bytes()
+        self.requests = 0
+        self.recycle_reason = None
+        self.recycling = False
+        self.views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view, rss_before, rss_after):
+        """Account one finished request and decide whether to recycle"""
+        delta = rss_after - rss_before
+        with self._lock:
+            self.requests += 1
+            stats = self.views.setdefault(view, {'requests': 0, 'rss_delta_bytes': 0, 'max_rss_delta_bytes': 0})
+            stats['requests'] += 1
+            stats['rss_delta_bytes'] += delta
+            stats['max_rss_delta_bytes'] = max(stats['max_rss_delta_bytes'], delta)
+            if self.recycle_reason is None and not self.recycling:
+                if self.max_requests and self.requests >= self.max_requests:
+                    self.recycle_reason = f'served {self.requests} requests'
+                elif self.max_rss_mb and rss_after >= self.max_rss_mb * 1024 * 1024:
+                    self.recycle_reason = f'RSS {rss_after / 1024 / 1024:.0f} MB'
+        return delta
+
+    def stats(self):
+        with self._lock:
+            rss = get_rss_bytes()
+            return {
+                'pid': os.getpid(),
+                'rss_bytes': rss,
+                'rss_growth_bytes': rss - self.started_rss,
+                'requests': self.requests,
+                'max_requests': self.max_requests,
+                'max_rss_mb': self.max_rss_mb,
+                'recycle_pending': self.recycle_reason,
+                'recycling': self.recycling,
+                'views': {view: dict(stats) for view, stats in self.views.items()},
+            }
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_memory_monitor():
+    """Return the process-wide MemoryMonitor"""
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = MemoryMonitor()
+    return _monitor
+
+
+def recycle_if_requested(**kwargs):
+    """request_finished receiver: gracefully stop a worker marked for recycling
+
+    Sends WORKER_RECYCLE_SIGNAL (SIGTERM by default) to this process once the
+    response is complete; gunicorn and uWSGI workers finish in-flight requests
+    on it and the master starts a fresh worker.
+    """
+    monitor = _monitor
+    if monitor is None or monitor.recycle_reason is None:
+        return
+    with monitor._lock:
+        reason, monitor.recycle_reason = monitor.recycle_reason, None
+        monitor.recycling = True
+    if reason is None:
+        return
+    print(f"Recycling worker {os.getpid()}: {reason}")
+    os.kill(os.getpid(), getattr(signal, settings.WORKER_RECYCLE_SIGNAL))
+
+
+_baseline = None
+
+
+def _take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+
+
+def tracemalloc_snapshot(limit=20, key_type='lineno', compare=False):
+    """Top allocation sites from tracemalloc, optionally as growth since the baseline
+
+    The first call starts tracing (when it is not already on) and records the
+    baseline; later calls with compare=True report the difference to it.
+    """
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(settings.MEMORY_TRACEMALLOC_FRAMES)
+        _baseline = _take_snapshot()
+        return {'tracing': True, 'started': True, 'top': []}
+
+    snapshot = _take_snapshot()
+    if compare and _baseline is not None:
+        stats = snapshot.compare_to(_baseline, key_type)
+        top = [
+            {'location': str(stat.traceback), 'size_bytes': stat.size, 'size_diff_bytes': stat.size_diff,
+             'count': stat.count, 'count_diff': stat.count_diff}
+            for stat in stats[:limit]
+        ]
+    else:
+        top = [
+            {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+            for stat in snapshot.statistics(key_type)[:limit]
+        ]
+    current, peak = tracemalloc.get_traced_memory()
+    return {'tracing': True, 'started': False, 'traced_bytes': current, 'traced_peak_bytes': peak, 'top': top}
+
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+
+from .memory import get_memory_monitor, get_rss_bytes
+
+
+class MediaCacheControlMiddleware:
+    """Adds long-lived Cache-Control headers to media responses
+
+    Uploads and result images get unique names and are never rewritten, so
+    browsers and CDNs can keep them for as long as they like.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.path.startswith(settings.MEDIA_URL) and response.status_code in (200, 206, 304):
+            patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE, immutable=True)
+        return response
+
+
+class MemoryUsageMiddleware:
+    """Records the RSS delta of every request, aggregated per view
+
+    Listed first so the delta covers the whole middleware stack. Deltas above
+    MEMORY_LOG_DELTA_MB are logged; the totals are on /detection/api/memory/.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.monitor = get_memory_monitor()
+
+    def __call__(self, request):
+        rss_before = get_rss_bytes()
+        response = self.get_response(request)
+        rss_after = get_rss_bytes()
+        view = getattr(request.resolver_match, 'view_name', None) or 'unresolved'
+        delta = self.monitor.record(view, rss_before, rss_after)
+        if delta >= settings.MEMORY_LOG_DELTA_MB * 1024 * 1024:
+            print(f"RSS grew {delta / 1024 / 1024:.1f} MB during {request.method} {request.path} "
+                  f"(now {rss_after / 1024 / 1024:.0f} MB)")
+        return response
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7
+
+import detection.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to=detection.models.upload_to)),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DetectionResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pytorch_result_image', models.ImageField(blank=True, null=True, upload_to='results/pytorch/')),
+                ('onnx_result_image', models.ImageField(blank=True, null=True, upload_to='results/onnx/')),
+                ('pytorch_detections', models.JSONField(default=list)),
+                ('onnx_detections', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('uploaded_image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='detection.uploadedimage')),
+            ],
+        ),
+    ]
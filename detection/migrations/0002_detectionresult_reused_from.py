@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionresult',
+            name='reused_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reuses', to='detection.detectionresult'),
+        ),
+    ]
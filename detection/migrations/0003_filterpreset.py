@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0002_detectionresult_reused_from'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilterPreset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('camera', models.CharField(blank=True, max_length=100)),
+                ('filters', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -27,7 +27,34 @@ class DetectionResult(models.Model):
     onnx_result_image = models.ImageField(upload_to='results/onnx/', null=True, blank=True)
     pytorch_detections = models.JSONField(default=list)  # Store detection data
     onnx_detections = models.JSONField(default=list)     # Store detection data
+    reused_from = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL,
+                                    related_name='reuses')  # near-duplicate whose detections were reused
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Detection result for {self.uploaded_image}" 
\ No newline at end of file
+        return f"Detection result for {self.uploaded_image}" 
+
+
+def delete_uploads(image_ids):
+    """Delete uploaded images, their detection results and all their files"""
+    for uploaded_image in UploadedImage.objects.filter(id__in=image_ids):
+        for result in uploaded_image.detectionresult_set.all():
+            result.pytorch_result_image.delete(save=False)
+            result.onnx_result_image.delete(save=False)
+        uploaded_image.image.delete(save=False)
+        uploaded_image.delete()
+
+
+class FilterPreset(models.Model):
+    """Saved per-camera detection filter, reusable by id from api_detect"""
+    name = models.CharField(max_length=100)
+    camera = models.CharField(max_length=100, blank=True)
+    filters = models.JSONField(default=dict)  # classes, class_thresholds, rois, confidence
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.camera})" if self.camera else self.name
+    
+    def get_filter(self):
+        from .filters import DetectionFilter
+        return DetectionFilter.from_dict(self.filters)
@@ -0,0 +1,162 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .boxes import box_iou, greedy_match
+from .registry import get_registry
+from .services import load_image
+
+BACKENDS = ('pytorch', 'onnx')
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+
+def match_detections(reference, candidate, iou_threshold=0.5, class_aware=True):
+    """Greedily match candidate detections to reference detections by IoU
+
+    Returns agreement metrics treating the reference as ground truth.
+    """
+    n_ref, n_cand = len(reference), len(candidate)
+    if n_ref == 0 or n_cand == 0:
+        agree = n_ref == n_cand
+        return {
+            'reference_count': n_ref,
+            'candidate_count': n_cand,
+            'matched': 0,
+            'precision': 1.0 if agree else 0.0,
+            'recall': 1.0 if agree else 0.0,
+            'mean_iou': None,
+            'mean_box_error': None,
+        }
+
+    ref_boxes = np.array([d['bbox'] for d in reference], dtype=np.float32)
+    cand_boxes = np.array([d['bbox'] for d in candidate], dtype=np.float32)
+    iou = box_iou(ref_boxes, cand_boxes)
+    if class_aware:
+        ref_cls = np.array([d['class_id'] for d in reference])
+        cand_cls = np.array([d['class_id'] for d in candidate])
+        iou = np.where(ref_cls[:, None] == cand_cls[None, :], iou, 0.0)
+
+    # Greedy assignment in order of decreasing IoU over all eligible pairs
+    pairs = greedy_match(iou, iou_threshold)
+
+    matched = len(pairs)
+    if matched:
+        r, c = np.array(pairs).T
+        mean_iou = float(iou[r, c].mean())
+        mean_box_error = float(np.abs(ref_boxes[r] - cand_boxes[c]).mean())
+    else:
+        mean_iou = mean_box_error = None
+
+    return {
+        'reference_count': n_ref,
+        'candidate_count': n_cand,
+        'matched': matched,
+        'precision': matched / n_cand,
+        'recall': matched / n_ref,
+        'mean_iou': mean_iou,
+        'mean_box_error': mean_box_error,
+    }
+
+
+def parse_config(spec):
+    """Parse a 'backend[:model]' spec such as 'onnx:yolo11s'"""
+    backend, _, model = spec.partition(':')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    model = get_registry().resolve(model or None)
+    return {'spec': f'{backend}:{model}', 'backend': backend, 'model': model}
+
+
+def collect_corpus(path):
+    """List the image files under a file or directory path"""
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    return sorted(
+        p for p in path.rglob('*')
+        if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS
+    )
+
+
+def _run_config(config, image):
+    service = get_registry().get(config['model'])
+    started = time.perf_counter()
+    # Uncached, or the candidate would reuse the reference's preprocessed tensor and look faster
+    if config['backend'] == 'pytorch':
+        detections = service.run_pytorch_inference(image, cache=False)
+    else:
+        detections = service.run_onnx_inference(image, cache=False)
+    return detections, time.perf_counter() - started
+
+
+def compare_image(path, reference, candidate, iou_threshold=0.5, class_aware=True):
+    """Run both configurations on one image and compare their detections"""
+    image = load_image(path)
+    ref_detections, ref_seconds = _run_config(reference, image)
+    cand_detections, cand_seconds = _run_config(candidate, image)
+    report = match_detections(ref_detections, cand_detections, iou_threshold, class_aware)
+    report.update({
+        'image': str(path),
+        'reference_seconds': ref_seconds,
+        'candidate_seconds': cand_seconds,
+        'speed_ratio': ref_seconds / cand_seconds if cand_seconds else None,
+    })
+    return report
+
+
+def run_parity(paths, reference, candidate, iou_threshold=0.5, class_aware=True, workers=None):
+    """Compare two backend configurations over a corpus using a thread pool"""
+    # Load both models up front so the first images do not pay for it
+    for config in (reference, candidate):
+        service = get_registry().get(config['model'])
+        if config['backend'] == 'pytorch':
+            service.load_pytorch_model()
+        else:
+            service.load_onnx_model()
+
+    workers = workers or min(4, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        images = list(executor.map(
+            lambda path: compare_image(path, reference, candidate, iou_threshold, class_aware),
+            paths,
+        ))
+
+    return {
+        'reference': reference['spec'],
+        'candidate': candidate['spec'],
+        'iou_threshold': iou_threshold,
+        'class_aware': class_aware,
+        'summary': summarize(images),
+        'images': images,
+    }
+
+
+def summarize(images):
+    """Aggregate per-image parity reports into corpus-level agreement"""
+    if not images:
+        return {'images': 0}
+
+    matched = sum(r['matched'] for r in images)
+    reference_count = sum(r['reference_count'] for r in images)
+    candidate_count = sum(r['candidate_count'] for r in images)
+    box_errors = [r['mean_box_error'] for r in images if r['mean_box_error'] is not None]
+    ious = [r['mean_iou'] for r in images if r['mean_iou'] is not None]
+    ref_seconds = sum(r['reference_seconds'] for r in images)
+    cand_seconds = sum(r['candidate_seconds'] for r in images)
+
+    return {
+        'images': len(images),
+        'reference_detections': reference_count,
+        'candidate_detections': candidate_count,
+        'matched': matched,
+        'precision': matched / candidate_count if candidate_count else 1.0,
+        'recall': matched / reference_count if reference_count else 1.0,
+        'mean_iou': float(np.mean(ious)) if ious else None,
+        'mean_box_error': float(np.mean(box_errors)) if box_errors else None,
+        'reference_seconds': ref_seconds,
+        'candidate_seconds': cand_seconds,
+        'speed_ratio': ref_seconds / cand_seconds if cand_seconds else None,
+    }
@@ -0,0 +1,166 @@
+import gc
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+from .services import YOLOInferenceService
+
+
+class UnknownModelError(KeyError):
+    """Raised when a model name is not configured in settings.YOLO_MODELS"""
+
+
+class ModelRegistry:
+    """Lazily loads named models and unloads the least recently used ones
+    when their combined resident memory exceeds the configured budget
+
+    There is one service object per model name for the life of the process;
+    an evicted service that is used again (through get() or an old reference)
+    reloads and is registered and counted again.
+    """
+
+    def __init__(self, models=None, default_model=None, memory_budget_mb=None):
+        self.models = models if models is not None else settings.YOLO_MODELS
+        self.default_model = default_model or settings.YOLO_DEFAULT_MODEL
+        if memory_budget_mb is None:
+            memory_budget_mb = settings.MODEL_MEMORY_BUDGET_MB
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb else 0
+        self._instances = {}  # name -> service, loaded or not
+        self._services = OrderedDict()  # name -> registered service, least recently used first
+        self._stats = {}
+        self._lock = threading.RLock()
+
+    def _new_stats(self):
+        return {
+            'hits': 0,
+            'loads': 0,
+            'evictions': 0,
+            'load_seconds': 0.0,
+            'memory_bytes': 0,
+            'last_used': None,
+        }
+
+    def resolve(self, name=None):
+        """Map an optional model name to a configured model name"""
+        name = name or self.default_model
+        if name not in self.models:
+            raise UnknownModelError(name)
+        return name
+
+    def get(self, name=None):
+        """Return the inference service for a model, creating it on first use"""
+        name = self.resolve(name)
+        with self._lock:
+            stats = self._stats.setdefault(name, self._new_stats())
+            service = self._instances.get(name)
+            if service is None:
+                config = self.models[name]
+                service = YOLOInferenceService(
+                    model_path=config.get('pytorch'),
+                    onnx_path=config.get('onnx'),
+                    name=name,
+                    on_load=self._on_load,
+                )
+                self._instances[name] = service
+            elif name in self._services:
+                stats['hits'] += 1
+            self._services[name] = service
+            self._services.move_to_end(name)
+            stats['last_used'] = time.time()
+            return service
+
+    def _on_load(self, service, backend, memory_bytes, seconds):
+        """Account for a backend load and enforce the memory budget
+
+        Services call this after releasing their own load lock, so unloading
+        other models here cannot deadlock with a concurrent load.
+        """
+        with self._lock:
+            stats = self._stats.setdefault(service.name, self._new_stats())
+            stats['loads'] += 1
+            stats['load_seconds'] += seconds
+            stats['memory_bytes'] = service.memory_bytes()
+            # (Re-)register it, e.g. when an evicted service is reloaded through an old reference
+            self._services[service.name] = service
+            self._services.move_to_end(service.name)
+            print(f"Loaded {backend} backend for {service.name}: "
+                  f"{memory_bytes / 1e6:.1f} MB in {seconds:.2f}s")
+        self._enforce_budget(keep=service.name)
+
+    def _enforce_budget(self, keep=None):
+        if not self.memory_budget:
+            return
+        with self._lock:
+            if keep is not None and keep not in self._services:
+                # Evicted by a concurrent load in the meantime: nothing to make room for
+                return
+            victims = []
+            resident = self.resident_bytes()
+            for name in list(self._services):
+                if resident <= self.memory_budget:
+                    break
+                if name == keep:
+                    continue
+                resident -= self._services[name].memory_bytes()
+                victims.append(self._deregister(name))
+        for name, service in victims:
+            self._unload(name, service)
+
+    def resident_bytes(self):
+        """Total tracked memory of all loaded models"""
+        with self._lock:
+            return sum(service.memory_bytes() for service in self._services.values())
+
+    def evict(self, name):
+        """Unload a model and release its memory"""
+        with self._lock:
+            if name not in self._services:
+                return False
+            service = self._deregister(name)[1]
+        self._unload(name, service)
+        return True
+
+    def _deregister(self, name):
+        service = self._services.pop(name)
+        stats = self._stats.setdefault(name, self._new_stats())
+        stats['evictions'] += 1
+        stats['memory_bytes'] = 0
+        return name, service
+
+    @staticmethod
+    def _unload(name, service):
+        # Outside the registry lock: unload waits for the service's own load lock
+        service.unload()
+        print(f"Evicted model {name} from registry")
+        gc.collect()
+
+    def stats(self):
+        """Per-model load, hit and memory statistics"""
+        with self._lock:
+            models = {}
+            for name in self.models:
+                entry = dict(self._stats.get(name) or self._new_stats())
+                entry['loaded'] = name in self._services
+                models[name] = entry
+            return {
+                'default_model': self.default_model,
+                'memory_budget_bytes': self.memory_budget,
+                'resident_bytes': self.resident_bytes(),
+                'lru_order': list(self._services),
+                'models': models,
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide model registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
@@ -1,145 +1,511 @@
-import cv2
+import ast
+import importlib
 import numpy as np
-import torch
-import onnxruntime as ort
-from ultralytics import YOLO
-from PIL import Image, ImageDraw, ImageFont
 import os
+import sys
 from django.conf import settings
 import json
+import threading
+import time
 from pathlib import Path
 
+from .boxes import batched_nms, cxcywh_to_xyxy
+from .memory import get_rss_bytes
+from .tensorcache import get_tensor_cache, image_digest
+
+# torch, ultralytics, onnxruntime and cv2 are imported on first use, so manage.py
+# commands start quickly and ONNX-only deployments need no PyTorch at all
+
+
+class BackendUnavailable(RuntimeError):
+    """Raised when a backend is disabled or its packages are not installed"""
+
+
+def require_backend(backend):
+    """Fail early if a backend is not enabled in settings.INFERENCE_BACKENDS"""
+    if backend not in settings.INFERENCE_BACKENDS:
+        raise BackendUnavailable(
+            f"The {backend} backend is disabled (INFERENCE_BACKENDS={','.join(settings.INFERENCE_BACKENDS)})"
+        )
+
+
+def import_backend(backend, module_name):
+    """Import a backend's module, turning a missing package into BackendUnavailable"""
+    require_backend(backend)
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        raise BackendUnavailable(f"The {backend} backend needs {module_name}: {e}") from e
+
+
+def load_image(image):
+    """Return a BGR array for a path or an already decoded array"""
+    if isinstance(image, np.ndarray):
+        return image
+    import cv2
+    decoded = cv2.imread(str(image))
+    if decoded is None:
+        raise ValueError(f"Could not decode image: {image}")
+    return decoded
+
+
+def letterbox_params(width, height, input_size):
+    """Scale and (left, top) padding that letterbox() applies to a width x height image"""
+    gain = min(input_size[0] / width, input_size[1] / height)
+    new_width, new_height = round(width * gain), round(height * gain)
+    left = round((input_size[0] - new_width) / 2 - 0.1)
+    top = round((input_size[1] - new_height) / 2 - 0.1)
+    return gain, (new_width, new_height), (left, top)
+
+
+def letterbox(image, input_size):
+    """Resize keeping the aspect ratio and pad with gray to input_size, like ultralytics' LetterBox"""
+    import cv2
+    height, width = image.shape[:2]
+    _, (new_width, new_height), (left, top) = letterbox_params(width, height, input_size)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    right = input_size[0] - new_width - left
+    bottom = input_size[1] - new_height - top
+    return cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+
+def unletterbox_boxes(boxes, width, height, input_size, clip=True):
+    """Map xyxy boxes from letterboxed input pixels back to the original image (and clip to it)"""
+    gain, _, (left, top) = letterbox_params(width, height, input_size)
+    boxes = ((boxes - np.array([left, top, left, top], dtype=np.float32)) / gain).astype(np.float32)
+    return clip_boxes(boxes, width, height) if clip else boxes
+
+
+def clip_boxes(boxes, width, height):
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return boxes
+
+
+def detections_from_arrays(boxes, scores, class_ids, names):
+    """Build detection dicts from parallel box, score and class id arrays"""
+    class_ids = np.asarray(class_ids).astype(np.int64).tolist()
+    return [
+        {
+            'bbox': bbox,  # [x1, y1, x2, y2]
+            'confidence': confidence,
+            'class_id': class_id,
+            'class_name': names.get(class_id, f'class_{class_id}'),
+        }
+        for bbox, confidence, class_id in zip(np.asarray(boxes).tolist(), np.asarray(scores).tolist(), class_ids)
+    ]
+
 
 class YOLOInferenceService:
     """Service for running YOLO inference with PyTorch and ONNX"""
     
-    def __init__(self):
+    onnx_input_size = (640, 640)  # YOLOv8/11 export size
+    pytorch_input_size = 640  # ultralytics predict imgsz
+    
+    def __init__(self, model_path=None, onnx_path=None, name=None, on_load=None):
         self.pytorch_model = None
         self.onnx_model = None
         self.onnx_session = None
-        self.model_path = settings.YOLO_MODEL_PATH
-        self.onnx_path = settings.ONNX_MODEL_PATH
-        
+        self._onnx_names = None
+        if model_path is None:
+            model_path = settings.YOLO_MODEL_PATH
+            onnx_path = onnx_path or settings.ONNX_MODEL_PATH
+        self.model_path = Path(model_path)
+        self.onnx_path = Path(onnx_path or self.model_path.with_suffix('.onnx'))
+        self.name = name or self.model_path.stem
+        self.on_load = on_load
+        self._memory = {}  # backend -> resident bytes attributed to it
+        self._loads = []  # (backend, bytes, seconds) not yet reported to on_load
+        self._load_lock = threading.Lock()
+        # Ultralytics predictors keep per-call state and are not thread-safe
+        self._predict_lock = threading.Lock()
+    
+    def _track_load(self, backend, loader):
+        """Run a loader, attributing the RSS growth (or at least the weights size) to the backend"""
+        rss_before = get_rss_bytes()
+        started = time.perf_counter()
+        loaded = loader()
+        seconds = time.perf_counter() - started
+        weights_path = self.model_path if backend == 'pytorch' else self.onnx_path
+        weights_size = weights_path.stat().st_size if weights_path.exists() else 0
+        self._memory[backend] = max(get_rss_bytes() - rss_before, weights_size)
+        self._loads.append((backend, self._memory[backend], seconds))
+        return loaded
+    
+    def _report_loads(self):
+        """Pass finished loads to on_load outside _load_lock, since it may unload other models"""
+        if not self._loads:
+            return
+        with self._load_lock:
+            loads, self._loads = self._loads, []
+        if self.on_load is not None:
+            for backend, memory_bytes, seconds in loads:
+                self.on_load(self, backend, memory_bytes, seconds)
+    
+    def memory_bytes(self):
+        """Resident memory attributed to the loaded backends of this model"""
+        return sum(self._memory.values())
+    
+    def unload(self):
+        """Drop the loaded models so their memory can be reclaimed"""
+        with self._load_lock:
+            self.pytorch_model = None
+            self.onnx_model = None
+            self.onnx_session = None
+            self._onnx_names = None
+            self._memory.clear()
+        # Only touch torch if something already imported it
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    
     def load_pytorch_model(self):
         """Load PyTorch YOLO model"""
-        if self.pytorch_model is None:
-            self.pytorch_model = YOLO(self.model_path)
-        return self.pytorch_model
+        model = self.pytorch_model
+        if model is None:
+            with self._load_lock:
+                if self.pytorch_model is None:
+                    self.pytorch_model = self._track_load('pytorch', self._create_pytorch_model)
+                model = self.pytorch_model
+            self._report_loads()
+        # The local stays valid even if the registry unloads this model meanwhile
+        return model
+    
+    def _create_pytorch_model(self):
+        torch = import_backend('pytorch', 'torch')
+        YOLO = import_backend('pytorch', 'ultralytics').YOLO
+        if settings.TORCH_NUM_THREADS:
+            torch.set_num_threads(settings.TORCH_NUM_THREADS)
+        else:
+            from .autotune import get_profile
+            profile = get_profile(self.name, 'pytorch')
+            if profile is not None:
+                torch.set_num_threads(profile['num_threads'])
+        model = YOLO(str(self.model_path))
+        if settings.TORCH_FUSE:
+            # Fold Conv+BatchNorm pairs once instead of on the first predict call
+            model.fuse()
+        return model
     
-    def convert_to_onnx(self):
-        """Convert PyTorch model to ONNX format"""
+    def convert_to_onnx(self, embed_nms=None):
+        """Convert PyTorch model to ONNX format
+        
+        With embed_nms (default settings.ONNX_EMBED_NMS), decoding and NMS are
+        appended to the graph; an existing plain export is upgraded in place.
+        """
+        if embed_nms is None:
+            embed_nms = settings.ONNX_EMBED_NMS
         if not os.path.exists(self.onnx_path):
+            require_backend('pytorch')
             model = self.load_pytorch_model()
-            # Export to ONNX
-            model.export(format='onnx', dynamic=True, simplify=True)
+            # Export to ONNX (ultralytics writes it next to the .pt file)
+            exported = model.export(format='onnx', dynamic=True, simplify=True)
+            if exported and Path(exported) != self.onnx_path:
+                os.replace(exported, self.onnx_path)
             print(f"Model converted to ONNX and saved at {self.onnx_path}")
+        if embed_nms:
+            from .export import embed_nms as append_nms
+            append_nms(self.onnx_path)
+            print(f"Decoding and NMS embedded in {self.onnx_path}")
+            # Reopen the upgraded graph on next use
+            with self._load_lock:
+                self.onnx_session = None
         return self.onnx_path
     
     def load_onnx_model(self):
         """Load ONNX model"""
-        if self.onnx_session is None:
+        session = self.onnx_session
+        if session is None:
+            ort = import_backend('onnx', 'onnxruntime')
             if not os.path.exists(self.onnx_path):
                 self.convert_to_onnx()
             
-            # Create ONNX Runtime session
-            providers = ['CPUExecutionProvider']
-            if 'CUDAExecutionProvider' in ort.get_available_providers():
-                providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+            # Providers, threading and execution mode from this host's autotuned profile
+            from .autotune import onnx_profile_for, onnx_session_config
+            providers, options = onnx_session_config(ort, onnx_profile_for(self))
             
-            self.onnx_session = ort.InferenceSession(self.onnx_path, providers=providers)
-        return self.onnx_session
+            with self._load_lock:
+                if self.onnx_session is None:
+                    # Create ONNX Runtime session
+                    self.onnx_session = self._track_load(
+                        'onnx', lambda: ort.InferenceSession(str(self.onnx_path), options, providers=providers)
+                    )
+                session = self.onnx_session
+            self._report_loads()
+        return session
     
-    def run_pytorch_inference(self, image_path):
-        """Run inference using PyTorch model"""
+    def run_pytorch_inference(self, images, filters=None, cache=True):
+        """Run inference using PyTorch model
+        
+        Accepts a path or a decoded BGR array, or a list of them for a batched
+        call; returns a list of detections, or one list per image for a batch.
+        With cache, each image's boxes are kept in the tensor cache with the
+        confidence they were predicted at, and reused for any threshold, class
+        or ROI filter at or above it. Cached boxes are predicted for all
+        classes, so the class whitelist is applied after NMS instead of inside
+        it (same result, without the smaller NMS input); cache=False keeps it
+        in ultralytics' NMS.
+        """
         model = self.load_pytorch_model()
-        results = model(image_path)
-        
-        # Extract detection results
-        detections = []
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    detection = {
-                        'bbox': box.xyxy[0].cpu().numpy().tolist(),  # [x1, y1, x2, y2]
-                        'confidence': float(box.conf[0]),
-                        'class_id': int(box.cls[0]),
-                        'class_name': model.names[int(box.cls[0])]
-                    }
-                    detections.append(detection)
-        
-        return detections, results
-    
-    def run_onnx_inference(self, image_path):
-        """Run inference using ONNX model"""
-        session = self.load_onnx_model()
+        torch = sys.modules['torch']
+        batch = images if isinstance(images, (list, tuple)) else [images]
+        conf = filters.min_confidence if filters is not None else settings.DETECTION_CONFIDENCE_THRESHOLD
+        
+        tensor_cache = get_tensor_cache()
+        keys = [None] * len(batch)
+        boxes = [None] * len(batch)
+        if cache and tensor_cache.enabled:
+            batch = [load_image(image) for image in batch]
+            weights = self._weights_id(self.model_path)
+            keys = [('pytorch', image_digest(image), weights, self.pytorch_input_size) for image in batch]
+            for i, key in enumerate(keys):
+                cached = tensor_cache.get(key)
+                if cached is not None and cached[0] <= conf:
+                    boxes[i] = (cached[1], batch[i].shape[:2])
+        
+        missing = [i for i, entry in enumerate(boxes) if entry is None]
+        if missing:
+            # The lowest threshold (and, when nothing is cached, the class whitelist)
+            # go into ultralytics' own NMS; the rest is applied to the extracted arrays
+            predict_args = {'verbose': False, 'conf': conf, 'imgsz': self.pytorch_input_size}
+            if filters is not None and keys[0] is None:
+                predict_args['classes'] = filters.classes
+            inputs = [str(batch[i]) if isinstance(batch[i], Path) else batch[i] for i in missing]
+            
+            with self._predict_lock:
+                if settings.TORCH_INFERENCE_MODE:
+                    with torch.inference_mode():
+                        results = model.predict(inputs, **predict_args)
+                else:
+                    results = model.predict(inputs, **predict_args)
+            
+            for i, result in zip(missing, results):
+                boxes[i] = (self._pytorch_boxes(result), result.orig_shape)
+                if keys[i] is not None:
+                    tensor_cache.put(keys[i], (conf, boxes[i][0]))
+            # Drop the results (and the tensors they hold) as soon as they are extracted
+            del results
+        
+        detections = [self._filter_pytorch_boxes(data, shape, conf, model.names, filters) for data, shape in boxes]
+        return detections if isinstance(images, (list, tuple)) else detections[0]
+    
+    @staticmethod
+    def _pytorch_boxes(result):
+        """[N, 6] array of x1, y1, x2, y2, conf, cls with a single device-to-host copy"""
+        if result.boxes is None or len(result.boxes) == 0:
+            return np.zeros((0, 6), dtype=np.float32)
+        return result.boxes.data.cpu().numpy()
+    
+    @staticmethod
+    def _filter_pytorch_boxes(data, shape, conf, names, filters=None):
+        """Apply the confidence cut and filters to a box array and convert it to detections"""
+        if filters is not None:
+            height, width = shape
+            keep = filters.keep_mask(data[:, :4], data[:, 4], data[:, 5].astype(np.int64),
+                                     width, height, len(names))
+        else:
+            keep = data[:, 4] >= conf
+        data = data[keep]
+        
+        # Slice NumPy views of the kept rows
+        return detections_from_arrays(data[:, :4], data[:, 4], data[:, 5], names)
+    
+    def run_onnx_inference(self, image, filters=None, deadline=None, cache=True):
+        """Run inference using ONNX model on a path or decoded BGR array
+        
+        With a Deadline, the session run is terminated once it passes and
+        DeadlineExceeded is raised. With cache, the preprocessed tensor and raw
+        output are kept in the tensor cache, so repeated runs on the same image
+        with other filters only repeat postprocessing (graphs with embedded
+        NMS apply the filters themselves, so only their input is cached).
+        """
+        image = load_image(image)
+        original_height, original_width = image.shape[:2]
+        tensor_cache = get_tensor_cache()
+        digest = image_digest(image) if cache and tensor_cache.enabled else None
+        
+        outputs = output_key = None
+        if digest is not None and not self.onnx_embedded_nms:
+            output_key = ('onnx', digest, self._weights_id(self.onnx_path), self.onnx_input_size)
+            outputs = tensor_cache.get(output_key)
+        
+        if outputs is None:
+            input_data = self._preprocessed(image, digest)
+            
+            # Run inference
+            outputs = self.run_onnx_batch([input_data], filters=filters, deadline=deadline)[0]
+            if output_key is not None:
+                tensor_cache.put(output_key, outputs)
+        
+        detections = self._process_onnx_outputs(outputs, original_width, original_height,
+                                                input_size=self.onnx_input_size, filters=filters)
+        
+        return detections
+    
+    def preprocess_onnx(self, image):
+        """Turn a path or BGR array into a letterboxed RGB [1, 3, H, W] input tensor and its original (w, h)"""
+        import cv2
         
         # Load and preprocess image
-        image = cv2.imread(image_path)
+        image = load_image(image)
         original_height, original_width = image.shape[:2]
         
-        # Resize to model input size (640x640 for YOLOv8)
-        input_size = (640, 640)
-        resized_image = cv2.resize(image, input_size)
+        # Letterbox to the model input size and convert BGR to RGB, as ultralytics
+        # does for the PyTorch backend, so both backends see the same pixels
+        resized_image = cv2.cvtColor(letterbox(image, self.onnx_input_size), cv2.COLOR_BGR2RGB)
         
         # Normalize and transpose
         input_data = resized_image.astype(np.float32) / 255.0
         input_data = np.transpose(input_data, (2, 0, 1))  # HWC to CHW
         input_data = np.expand_dims(input_data, axis=0)  # Add batch dimension
+        return input_data, (original_width, original_height)
+    
+    @staticmethod
+    def _weights_id(path):
+        """Identity of a weights file for cache keys: a replaced or re-exported file gets a new one"""
+        try:
+            stat = path.stat()
+        except OSError:
+            return str(path), None, None
+        return str(path.resolve()), stat.st_mtime_ns, stat.st_size
+    
+    def _preprocessed(self, image, digest=None):
+        """preprocess_onnx's tensor for a decoded image, shared across models through the tensor cache"""
+        if digest is None:
+            return self.preprocess_onnx(image)[0]
+        tensor_cache = get_tensor_cache()
+        key = ('tensor', digest, self.onnx_input_size)
+        tensor = tensor_cache.get(key)
+        if tensor is None:
+            tensor = tensor_cache.put(key, self.preprocess_onnx(image)[0])
+        return tensor
+    
+    @property
+    def onnx_embedded_nms(self):
+        """Whether the loaded ONNX graph returns final detections (see export.embed_nms)"""
+        from .export import has_embedded_nms
+        return has_embedded_nms(self.load_onnx_model())
+    
+    def run_onnx_batch(self, tensors, filters=None, deadline=None):
+        """Run preprocessed tensors through the session, one raw output per tensor
         
-        # Run inference
-        input_name = session.get_inputs()[0].name
-        outputs = session.run(None, {input_name: input_data})
+        Tensors are stacked into one call when the model's batch axis is
+        dynamic (the default export), otherwise they run one at a time. For
+        graphs with embedded NMS each output is a (boxes, scores, class_ids)
+        tuple, and the thresholds are fed as inputs.
+        """
+        session = self.load_onnx_model()
+        model_input = session.get_inputs()[0]
+        feeds = {}
+        if self.onnx_embedded_nms:
+            conf = filters.min_confidence if filters is not None else settings.DETECTION_CONFIDENCE_THRESHOLD
+            num_classes = next(i.shape[0] for i in session.get_inputs() if i.name == 'class_mask')
+            allowed = filters.class_mask(num_classes) if filters is not None else None
+            feeds = {
+                'class_mask': (allowed if allowed is not None else np.ones(num_classes)).astype(np.float32),
+                'conf_threshold': np.array([conf], dtype=np.float32),
+                'iou_threshold': np.array([settings.DETECTION_NMS_IOU_THRESHOLD], dtype=np.float32),
+                'max_detections': np.array([settings.DETECTION_MAX_DETECTIONS], dtype=np.int64),
+            }
         
-        # Process outputs (this is a simplified version - you might need to adjust based on your model)
-        detections = self._process_onnx_outputs(outputs[0], original_width, original_height)
+        batches = tensors if isinstance(model_input.shape[0], int) else [np.concatenate(tensors)]
+        if deadline is None:
+            runs = [session.run(None, dict(feeds, **{model_input.name: batch})) for batch in batches]
+        else:
+            ort = import_backend('onnx', 'onnxruntime')
+            runs = []
+            for batch in batches:
+                with deadline.onnx_run_options(ort) as run_options:
+                    runs.append(session.run(None, dict(feeds, **{model_input.name: batch}), run_options))
         
-        return detections
+        results = []
+        for outputs in runs:
+            if feeds:
+                boxes, scores, class_ids, batch = outputs
+                images = range(len(tensors)) if len(runs) == 1 else [0]
+                results.extend((boxes[batch == i], scores[batch == i], class_ids[batch == i]) for i in images)
+            else:
+                results.extend(outputs[0][i:i + 1] for i in range(len(outputs[0])))
+        return results
     
-    def _process_onnx_outputs(self, outputs, original_width, original_height):
-        """Process ONNX model outputs to extract detections"""
-        detections = []
-        
-        # This is a simplified processing - you'll need to adjust based on your specific model output format
-        # For YOLOv8, the output is typically [batch, num_detections, 85] where 85 = 4 (bbox) + 1 (conf) + 80 (classes)
+    def onnx_class_names(self):
+        """Class names stored in the ONNX metadata by the ultralytics exporter"""
+        if self._onnx_names is None:
+            names = self.load_onnx_model().get_modelmeta().custom_metadata_map.get('names')
+            try:
+                self._onnx_names = {int(k): v for k, v in ast.literal_eval(names).items()}
+            except (ValueError, SyntaxError, AttributeError):
+                self._onnx_names = {}
+        return self._onnx_names
+    
+    def _process_onnx_outputs(self, outputs, original_width, original_height, input_size=(640, 640), filters=None):
+        """Decode YOLOv8/11 ONNX output into detections
         
+        The output is [batch, 4 + num_classes, num_candidates]: a cx, cy, w, h
+        box in input pixels followed by one score per class. Confidence,
+        class and ROI filters run on the candidate arrays before NMS.
+        """
+        if isinstance(outputs, tuple):
+            return self._process_embedded_outputs(outputs, original_width, original_height, input_size, filters)
         if len(outputs.shape) == 3:
             # Remove batch dimension
             outputs = outputs[0]
+        predictions = outputs.T if outputs.shape[0] < outputs.shape[1] else outputs
+        num_classes = predictions.shape[1] - 4
+        class_scores = predictions[:, 4:]
         
-        # Filter by confidence threshold
-        confidence_threshold = 0.25
-        for detection in outputs:
-            confidence = detection[4]  # Assuming confidence is at index 4
-            if confidence > confidence_threshold:
-                # Get class with highest probability
-                class_scores = detection[5:]
-                class_id = np.argmax(class_scores)
-                class_confidence = class_scores[class_id]
-                
-                if class_confidence > confidence_threshold:
-                    # Extract bounding box (normalized coordinates)
-                    x1, y1, x2, y2 = detection[:4]
-                    
-                    # Convert to pixel coordinates
-                    x1 = int(x1 * original_width)
-                    y1 = int(y1 * original_height)
-                    x2 = int(x2 * original_width)
-                    y2 = int(y2 * original_height)
-                    
-                    detection_data = {
-                        'bbox': [x1, y1, x2, y2],
-                        'confidence': float(confidence),
-                        'class_id': int(class_id),
-                        'class_name': f'class_{class_id}'  # You might want to load class names
-                    }
-                    detections.append(detection_data)
+        # Best class per candidate; like ultralytics' classes=, the whitelist then drops
+        # candidates whose best class is not allowed instead of relabeling them
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_scores)), class_ids]
         
-        return detections
+        # Cheapest cut first: drop everything below the lowest threshold or outside the whitelist
+        min_confidence = filters.min_confidence if filters is not None else settings.DETECTION_CONFIDENCE_THRESHOLD
+        candidates = scores >= min_confidence
+        allowed = filters.class_mask(num_classes) if filters is not None else None
+        if allowed is not None:
+            candidates &= allowed[class_ids]
+        predictions, scores, class_ids = predictions[candidates], scores[candidates], class_ids[candidates]
+        
+        # cx, cy, w, h in letterboxed input pixels to x1, y1, x2, y2 in original pixels;
+        # the scale is uniform, so IoUs are unchanged and boxes are clipped only after NMS
+        boxes = unletterbox_boxes(cxcywh_to_xyxy(predictions[:, :4]), original_width, original_height, input_size,
+                                  clip=False)
+        
+        if filters is not None:
+            keep = filters.keep_mask(boxes, scores, class_ids, original_width, original_height, num_classes)
+            boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+        
+        keep = batched_nms(boxes, scores, class_ids, settings.DETECTION_NMS_IOU_THRESHOLD)
+        keep = keep[:settings.DETECTION_MAX_DETECTIONS]
+        
+        boxes = clip_boxes(boxes[keep], original_width, original_height)
+        return detections_from_arrays(boxes, scores[keep], class_ids[keep], self.onnx_class_names())
+    
+    def _process_embedded_outputs(self, outputs, original_width, original_height, input_size, filters=None):
+        """Scale and filter the final boxes of a graph with embedded NMS
+        
+        The graph has already applied the class whitelist, the lowest
+        threshold and NMS; per-class thresholds and ROIs remain to apply.
+        """
+        boxes, scores, class_ids = outputs
+        # ROIs see the same unclipped boxes as in _process_onnx_outputs
+        boxes = unletterbox_boxes(boxes, original_width, original_height, input_size, clip=False)
+        if filters is not None:
+            num_classes = max(len(self.onnx_class_names()), int(class_ids.max()) + 1 if len(class_ids) else 0)
+            keep = filters.keep_mask(boxes, scores, class_ids, original_width, original_height, num_classes)
+            boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+        order = np.argsort(-scores, kind='stable')[:settings.DETECTION_MAX_DETECTIONS]
+        boxes = clip_boxes(boxes[order], original_width, original_height)
+        return detections_from_arrays(boxes, scores[order], class_ids[order], self.onnx_class_names())
     
-    def draw_detections(self, image_path, detections, output_path):
+    def draw_detections(self, image, detections, output_path):
         """Draw bounding boxes on image"""
-        image = cv2.imread(image_path)
+        import cv2
+        # Draw on a copy so a decoded array can be shared between backends
+        image = load_image(image).copy()
         
         for detection in detections:
             bbox = detection['bbox']
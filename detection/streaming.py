@@ -0,0 +1,195 @@
+import asyncio
+import json
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from django.conf import settings
+from django.http.request import split_domain_port, validate_host
+
+from .admission import get_admission_controller, Overloaded
+from .registry import get_registry, UnknownModelError
+
+
+class StreamStats:
+    """Per-connection frame counters with a sliding-window processing rate"""
+
+    def __init__(self, window_seconds=5.0):
+        self.started = time.monotonic()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.shed = 0
+        self.window_seconds = window_seconds
+        self._processed_at = deque()
+
+    def mark_processed(self):
+        now = time.monotonic()
+        self.processed += 1
+        self._processed_at.append(now)
+        while self._processed_at and now - self._processed_at[0] > self.window_seconds:
+            self._processed_at.popleft()
+
+    def fps(self):
+        if len(self._processed_at) < 2:
+            return 0.0
+        span = self._processed_at[-1] - self._processed_at[0]
+        return (len(self._processed_at) - 1) / span if span > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'received': self.received,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'shed': self.shed,
+            'drop_rate': self.dropped / self.received if self.received else 0.0,
+            'fps': round(self.fps(), 2),
+            'uptime_seconds': round(time.monotonic() - self.started, 1),
+        }
+
+
+class DetectionStream:
+    """One WebSocket connection: clients push encoded frames (binary messages)
+    and get detections back as JSON text messages.
+
+    Only the newest frame waiting for inference is kept. When inference falls
+    behind, older pending frames are dropped instead of queued, so latency
+    stays bounded by roughly one inference time. Each frame takes a 'stream'
+    admission slot, the lowest priority; frames shed by admission control are
+    answered with a 'busy' message.
+    """
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        query = parse_qs(scope.get('query_string', b'').decode())
+        self.backend = query.get('backend', ['onnx'])[0]
+        self.model_name = query.get('model', [None])[0]
+        self.stats = StreamStats()
+        self.pending = None  # (sequence, frame bytes, received_at)
+        self.frame_ready = asyncio.Event()
+        self.closed = False
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if self.backend not in ('pytorch', 'onnx'):
+            await self.send({'type': 'websocket.close', 'code': 4400})
+            return
+        try:
+            self.service = get_registry().get(self.model_name)
+        except UnknownModelError:
+            await self.send({'type': 'websocket.close', 'code': 4404})
+            return
+        await self.send({'type': 'websocket.accept'})
+
+        worker = asyncio.create_task(self.process_frames())
+        try:
+            await self.receive_frames()
+        finally:
+            self.closed = True
+            self.frame_ready.set()
+            await worker
+
+    async def receive_frames(self):
+        while True:
+            message = await self.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            frame = message.get('bytes')
+            if frame is None:
+                # Text messages are control requests; only stats are supported
+                await self.send_json({'type': 'stats', 'stats': self.stats.as_dict()})
+                continue
+            if len(frame) > settings.DETECTION_STREAM_MAX_FRAME_BYTES:
+                await self.send({'type': 'websocket.close', 'code': 1009})
+                return
+            self.stats.received += 1
+            if self.pending is not None:
+                self.stats.dropped += 1  # superseded before inference got to it
+            self.pending = (self.stats.received, frame, time.monotonic())
+            self.frame_ready.set()
+
+    async def process_frames(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.frame_ready.wait()
+            self.frame_ready.clear()
+            if self.closed:
+                return
+            if self.pending is None:
+                continue
+            sequence, frame, received_at = self.pending
+            self.pending = None
+            try:
+                detections = await loop.run_in_executor(None, self.detect, frame)
+            except Overloaded as e:
+                self.stats.shed += 1
+                if self.closed:
+                    return
+                await self.send_json({'type': 'busy', 'frame': sequence, 'retry_after': e.retry_after})
+                continue
+            except Exception as e:
+                if self.closed:
+                    return
+                await self.send_json({'type': 'error', 'frame': sequence, 'error': str(e)})
+                continue
+            self.stats.mark_processed()
+            if self.closed:
+                return
+            await self.send_json({
+                'type': 'detections',
+                'frame': sequence,
+                'detections': detections,
+                'latency_ms': round((time.monotonic() - received_at) * 1000, 1),
+                'stats': self.stats.as_dict(),
+            })
+
+    def detect(self, frame):
+        import cv2
+        image = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError('Could not decode frame')
+        # Live frames rarely repeat exactly, so they would only churn the tensor cache
+        with get_admission_controller().admit('stream'):
+            if self.backend == 'pytorch':
+                return self.service.run_pytorch_inference(image, cache=False)
+            return self.service.run_onnx_inference(image, cache=False)
+
+    async def send_json(self, payload):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(payload)})
+
+
+def origin_allowed(scope):
+    """Whether a handshake's Origin host is in ALLOWED_HOSTS (like Django's Host check)
+
+    Browsers always send Origin, so this stops other sites' pages from
+    opening streams (cross-site WebSocket hijacking). Non-browser clients
+    that send no Origin are let through.
+    """
+    headers = dict(scope.get('headers', []))
+    origin = headers.get(b'origin')
+    if origin is None:
+        return True
+    host = urlparse(origin.decode('latin-1')).netloc
+    domain, _ = split_domain_port(host)
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    return bool(domain) and validate_host(domain, allowed_hosts)
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI entry point for WebSocket connections"""
+    if scope['path'] != settings.DETECTION_STREAM_PATH:
+        await receive()  # websocket.connect
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    if not origin_allowed(scope):
+        await receive()  # websocket.connect
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    await DetectionStream(scope, receive, send).run()
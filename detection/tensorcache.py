@@ -0,0 +1,118 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+
+def image_digest(image):
+    """Content hash of a decoded image (pixels and shape), as a short hex string"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(image.shape).encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+def _freeze(value):
+    """Mark cached arrays read-only, so a caller cannot alter what later hits see"""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            _freeze(item)
+    return value
+
+
+class TensorCache:
+    """LRU cache of preprocessed input tensors and raw model outputs, bounded in bytes
+
+    Keys start with a kind ('tensor', 'onnx', 'pytorch') followed by the image
+    digest, model and resolution, so re-running the same image with other
+    thresholds, classes or ROIs only repeats postprocessing, and other models
+    at the same resolution share the preprocessed tensor.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes if max_bytes is not None else settings.TENSOR_CACHE_MAX_MB * 1024 * 1024
+        self.entries = OrderedDict()  # key -> (value, nbytes)
+        self.bytes = 0
+        self.evictions = 0
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _count(self, kind, outcome):
+        counters = self._counters.setdefault(kind, {'hits': 0, 'misses': 0})
+        counters[outcome] += 1
+
+    def get(self, key):
+        """Return the cached value for a key, or None"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self._count(key[0], 'misses')
+                return None
+            self.entries.move_to_end(key)
+            self._count(key[0], 'hits')
+            return entry[0]
+
+    def put(self, key, value):
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            return value
+        with self._lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self.entries[key] = (_freeze(value), nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            kinds = {}
+            for kind, counters in self._counters.items():
+                lookups = counters['hits'] + counters['misses']
+                kinds[kind] = dict(counters, hit_rate=counters['hits'] / lookups if lookups else 0.0)
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'kinds': kinds,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tensor_cache():
+    """Return the process-wide TensorCache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TensorCache()
+    return _cache
@@ -0,0 +1,76 @@
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+
+def encoded_image(width, height, name='frame.png'):
+    """A PNG upload of a fixed pattern, scaled to width x height"""
+    import cv2
+    pattern = np.kron(np.indices((6, 8)).sum(axis=0) % 2 * 200 + 20, np.ones((80, 80))).astype(np.uint8)
+    image = cv2.resize(cv2.cvtColor(pattern, cv2.COLOR_GRAY2BGR), (width, height), interpolation=cv2.INTER_NEAREST)
+    return SimpleUploadedFile(name, cv2.imencode('.png', image)[1].tobytes(), content_type='image/png')
+
+
+class FakeService:
+    """Stands in for YOLOInferenceService: one box covering the image's top-left quarter"""
+
+    name = 'fake'
+
+    def __init__(self):
+        self.runs = 0
+        self.cached_runs = 0
+
+    def run_onnx_inference(self, image, filters=None, deadline=None, cache=True):
+        self.runs += 1
+        self.cached_runs += cache
+        height, width = image.shape[:2]
+        return [{'bbox': [0.0, 0.0, width / 2, height / 2], 'confidence': 0.9, 'class_id': 0, 'class_name': 'person'}]
+
+    def run_pytorch_inference(self, images, filters=None, cache=True):
+        if isinstance(images, list):
+            return [self.run_onnx_inference(image, cache=cache) for image in images]
+        return self.run_onnx_inference(images, cache=cache)
+
+    def load_pytorch_model(self):
+        pass
+
+    def draw_detections(self, image, detections, output_path):
+        pass
+
+
+class FakeRegistry:
+    models = {'fake': {}}
+    default_model = 'fake'
+
+    def __init__(self, service):
+        self.service = service
+
+    def resolve(self, name=None):
+        return name or self.default_model
+
+    def get(self, name=None):
+        return self.service
+
+
+@override_settings(INFERENCE_BACKENDS=['onnx'])
+class DetectApiTestCase(TestCase):
+    """api_detect against FakeService, with uploads in a temporary MEDIA_ROOT"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.service = FakeService()
+        patcher = mock.patch('detection.views.get_registry', return_value=FakeRegistry(self.service))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def detect(self, upload, **params):
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.client.post(f'/detection/api/detect/?{query}', {'image': upload})
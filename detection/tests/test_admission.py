@@ -0,0 +1,83 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..admission import AdmissionController, Overloaded
+from .helpers import DetectApiTestCase, encoded_image
+
+LIMITS = {'interactive': 2, 'bulk': 1, 'stream': 0}
+TIMEOUTS = {'interactive': 5, 'bulk': 5, 'stream': 5}
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def setUp(self):
+        self.controller = AdmissionController(max_concurrent=1, queue_limits=LIMITS, queue_timeouts=TIMEOUTS)
+
+    def wait_for_queued(self, priority, count):
+        deadline = time.monotonic() + 5
+        while self.controller.stats()['queued'][priority] < count:
+            self.assertLess(time.monotonic(), deadline, f'{priority} never queued')
+            time.sleep(0.005)
+
+    def test_admit_and_release(self):
+        with self.controller.admit('bulk'):
+            self.assertEqual(self.controller.stats()['in_flight'], 1)
+        stats = self.controller.stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['classes']['bulk']['admitted'], 1)
+        self.assertIsNotNone(stats['service_seconds'])
+
+    def test_full_queue_shed(self):
+        self.controller.acquire('interactive')
+        with self.assertRaises(Overloaded) as caught:
+            self.controller.acquire('stream')
+        self.assertEqual(caught.exception.reason, 'queue full')
+        self.assertGreaterEqual(caught.exception.retry_after, 1)
+        self.assertEqual(self.controller.stats()['classes']['stream']['shed'], 1)
+
+    def test_queue_timeout_shed(self):
+        self.controller.acquire('interactive')
+        with self.assertRaises(Overloaded) as caught:
+            self.controller.acquire('bulk', timeout=0.01)
+        self.assertEqual(caught.exception.reason, 'queue timeout')
+        self.assertEqual(self.controller.stats()['queued']['bulk'], 0)
+
+    def test_freed_slot_goes_to_highest_priority(self):
+        self.controller.acquire('interactive')
+        order = []
+
+        def wait(priority):
+            self.controller.acquire(priority)
+            order.append(priority)
+            self.controller.release()
+
+        threads = [threading.Thread(target=wait, args=('bulk',))]
+        threads[0].start()
+        self.wait_for_queued('bulk', 1)
+        threads.append(threading.Thread(target=wait, args=('interactive',)))
+        threads[1].start()
+        self.wait_for_queued('interactive', 1)
+        self.controller.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, ['interactive', 'bulk'])
+        self.assertEqual(self.controller.stats()['in_flight'], 0)
+
+    def test_unknown_priority(self):
+        with self.assertRaises(ValueError):
+            self.controller.acquire('batch')
+
+
+class AdmissionApiTests(DetectApiTestCase):
+    def test_overloaded_detect_returns_429(self):
+        controller = AdmissionController(max_concurrent=1, queue_limits=dict(LIMITS, bulk=0),
+                                         queue_timeouts=TIMEOUTS)
+        controller.acquire('interactive')
+        with mock.patch('detection.views.get_admission_controller', return_value=controller):
+            response = self.detect(encoded_image(64, 48))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(response.json()['retry_after']))
+        # Shed before anything was stored or run
+        self.assertEqual(self.service.runs, 0)
@@ -0,0 +1,89 @@
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..cascade import ModelCascade
+from .helpers import DetectApiTestCase, encoded_image
+
+
+class StageService:
+    """A cascade stage returning fixed detections"""
+
+    def __init__(self, name, confidences):
+        self.name = name
+        self.confidences = confidences
+        self.runs = 0
+
+    def run_onnx_inference(self, image, filters=None, deadline=None):
+        self.runs += 1
+        return [{'bbox': [10.0 * i, 0.0, 10.0 * i + 8, 8.0], 'confidence': confidence, 'class_id': 0,
+                 'class_name': 'person'} for i, confidence in enumerate(self.confidences)]
+
+
+class StageRegistry:
+    def __init__(self, *services):
+        self.services = {service.name: service for service in services}
+
+    def resolve(self, name=None):
+        return name
+
+    def get(self, name=None):
+        return self.services[name]
+
+
+class CascadeTests(SimpleTestCase):
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+
+    def cascade(self, small_confidences, audit_rate=0.0):
+        self.small = StageService('small', small_confidences)
+        self.large = StageService('large', [0.9])
+        patcher = mock.patch('detection.cascade.get_registry', return_value=StageRegistry(self.small, self.large))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return ModelCascade(stages=['small', 'large'], uncertain_band=(0.3, 0.6), min_uncertain=1, dense_count=3,
+                            audit_rate=audit_rate)
+
+    def test_confident_answer_accepted(self):
+        cascade = self.cascade([0.9])
+        detections, report = cascade.run(self.image)
+        self.assertEqual((report['model'], report['escalated']), ('small', False))
+        self.assertEqual(self.large.runs, 0)
+
+    def test_uncertain_and_dense_escalate(self):
+        for confidences, reason in (([0.5], 'uncertain'), ([0.9, 0.9, 0.9], 'dense')):
+            with self.subTest(reason=reason):
+                cascade = self.cascade(confidences)
+                detections, report = cascade.run(self.image)
+                self.assertEqual(report['model'], 'large')
+                self.assertEqual(report['stages'][0]['escalation_reason'], reason)
+                self.assertEqual(cascade.stats()['reasons'], {reason: 1})
+
+    def test_last_stage_mean_counts_accepted_requests(self):
+        # Escalated requests alone would overstate the savings, so the estimate
+        # waits for an audited accepted request and weights it by the accepted count
+        cascade = self.cascade([0.9])
+        escalated = {'seconds': 2.5, 'model': 'large', 'escalated': True, 'stages': [{'escalation_reason': 'dense'}]}
+        accepted = {'seconds': 0.5, 'model': 'small', 'escalated': False, 'stages': [{'escalation_reason': None}]}
+        cascade._record(escalated, 2.0, None)
+        cascade._record(accepted, None, None)
+        self.assertIsNone(cascade.stats()['last_stage_mean_seconds'])
+        cascade._record(accepted, None, 1.0)
+        cascade._record(accepted, None, None)
+        stats = cascade.stats()
+        self.assertAlmostEqual(stats['last_stage_mean_seconds'], (2.0 + 3 * 1.0) / 4)
+        self.assertAlmostEqual(stats['estimated_speedup'], 1.25 / stats['mean_seconds'])
+
+    def test_audit_runs_last_stage(self):
+        cascade = self.cascade([0.9], audit_rate=1.0)
+        detections, report = cascade.run(self.image)
+        self.assertFalse(report['escalated'])
+        self.assertEqual(self.large.runs, 1)
+        self.assertEqual(cascade.stats()['audits'], 1)
+
+
+class CascadeApiTests(DetectApiTestCase):
+    def test_model_and_cascade_rejected(self):
+        response = self.detect(encoded_image(64, 48), cascade=1, model='fake')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.service.runs, 0)
@@ -0,0 +1,56 @@
+import math
+import time
+
+from django.test import RequestFactory, SimpleTestCase
+
+from .. import deadlines
+from ..deadlines import Deadline, DeadlineExceeded, DeadlineStats, deadline_from_request
+
+
+class DeadlineTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self._stats, deadlines._stats = deadlines._stats, DeadlineStats()
+
+    def tearDown(self):
+        deadlines._stats = self._stats
+
+    def test_expiry(self):
+        deadline = Deadline(0.01)
+        deadline.check('preprocess')
+        time.sleep(0.02)
+        self.assertTrue(deadline.expired)
+        self.assertEqual(deadline.remaining(), 0.0)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.check('preprocess')
+
+    def test_no_deadline(self):
+        deadline = Deadline(None)
+        self.assertFalse(deadline.expired)
+        self.assertIsNone(deadline.remaining())
+
+    def test_stage_cancellation_stats(self):
+        stats = deadlines.get_deadline_stats()
+        stats.observe('preprocess', 0.5)
+        stats.observe('onnx', 2.0)
+        deadline = Deadline(0.001, plan=['preprocess', 'onnx'])
+        time.sleep(0.01)
+        with self.assertRaises(DeadlineExceeded):
+            with deadline.stage('preprocess'):
+                self.fail('stage ran past the deadline')
+        result = stats.stats()
+        self.assertEqual(result['cancelled'], 1)
+        self.assertEqual(result['cancelled_at'], {'preprocess': 1})
+        self.assertAlmostEqual(result['seconds_saved'], 2.5, places=2)
+
+    def test_timeout_from_request(self):
+        deadline = deadline_from_request(self.factory.get('/', {'timeout': '5'}))
+        self.assertEqual(deadline.seconds, 5.0)
+        deadline = deadline_from_request(self.factory.get('/', HTTP_X_REQUEST_TIMEOUT='1000'))
+        self.assertEqual(deadline.seconds, 120)
+
+    def test_invalid_timeouts_rejected(self):
+        for value in ('nan', 'inf', '-inf', '-1', 'soon'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                deadline_from_request(self.factory.get('/', {'timeout': value}))
+        self.assertTrue(math.isfinite(deadline_from_request(self.factory.get('/')).seconds))
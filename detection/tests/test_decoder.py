@@ -0,0 +1,80 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..filters import DetectionFilter
+from ..services import YOLOInferenceService, letterbox_params, unletterbox_boxes
+
+
+def onnx_output(candidates, num_classes):
+    """[1, 4 + num_classes, N] raw output from (cx, cy, w, h, {class_id: score}) tuples
+
+    Padded with zero-score candidates, since real outputs (8400 candidates)
+    always have more columns than rows and the decoder relies on that.
+    """
+    output = np.zeros((1, 4 + num_classes, max(len(candidates), 100)), dtype=np.float32)
+    for i, (cx, cy, w, h, scores) in enumerate(candidates):
+        output[0, :4, i] = (cx, cy, w, h)
+        for class_id, score in scores.items():
+            output[0, 4 + class_id, i] = score
+    return output
+
+
+class DecoderTests(SimpleTestCase):
+    def setUp(self):
+        self.service = YOLOInferenceService(model_path='test.pt', name='test')
+        # Preset names so decoding never loads a session
+        self.service._onnx_names = {0: 'person', 1: 'car'}
+
+    def decode(self, candidates, width=640, height=640, filters=None):
+        return self.service._process_onnx_outputs(onnx_output(candidates, 2), width, height, (640, 640), filters)
+
+    def test_nms_keeps_best_overlapping_box(self):
+        detections = self.decode([
+            (100, 100, 50, 50, {0: 0.9}),
+            (102, 101, 50, 50, {0: 0.8}),
+            (400, 400, 50, 50, {1: 0.7}),
+        ])
+        self.assertEqual([d['class_name'] for d in detections], ['person', 'car'])
+        self.assertAlmostEqual(detections[0]['confidence'], 0.9, places=5)
+        np.testing.assert_allclose(detections[0]['bbox'], [75, 75, 125, 125])
+
+    def test_below_threshold_dropped(self):
+        self.assertEqual(self.decode([(100, 100, 50, 50, {0: 0.1})]), [])
+
+    def test_whitelist_applies_after_argmax(self):
+        # The best class is not allowed: the candidate is dropped, not relabeled as car
+        filters = DetectionFilter(classes=[1])
+        self.assertEqual(self.decode([(100, 100, 50, 50, {0: 0.9, 1: 0.6})], filters=filters), [])
+
+    def test_letterbox_is_undone(self):
+        # 320x160 scales by 2 to 640x320 and is padded by 160 rows on top
+        self.assertEqual(letterbox_params(320, 160, (640, 640)), (2.0, (640, 320), (0, 160)))
+        detections = self.decode([(320, 320, 64, 64, {0: 0.9})], width=320, height=160)
+        np.testing.assert_allclose(detections[0]['bbox'], [144, 64, 176, 96])
+
+    def test_boxes_clipped_after_nms(self):
+        detections = self.decode([(10, 10, 40, 40, {0: 0.9})], width=640, height=640)
+        np.testing.assert_allclose(detections[0]['bbox'], [0, 0, 30, 30])
+        unclipped = unletterbox_boxes(np.array([[-10, -10, 30, 30]], dtype=np.float32), 640, 640, (640, 640),
+                                      clip=False)
+        np.testing.assert_allclose(unclipped, [[-10, -10, 30, 30]])
+
+    def test_per_class_threshold_and_roi(self):
+        filters = DetectionFilter(class_thresholds={'1': 0.8}, rois=[[[0, 0], [0.5, 0], [0.5, 0.5], [0, 0.5]]])
+        detections = self.decode([
+            (100, 100, 50, 50, {0: 0.5}),
+            (150, 150, 50, 50, {1: 0.7}),
+            (500, 500, 50, 50, {0: 0.9}),
+        ], filters=filters)
+        self.assertEqual([d['class_id'] for d in detections], [0])
+
+    def test_embedded_outputs_scaled_filtered_and_sorted(self):
+        outputs = (
+            np.array([[0, 160, 64, 224], [320, 320, 384, 384]], dtype=np.float32),
+            np.array([0.5, 0.9], dtype=np.float32),
+            np.array([0, 1], dtype=np.int64),
+        )
+        detections = self.service._process_onnx_outputs(outputs, 320, 160, (640, 640),
+                                                         DetectionFilter(class_thresholds={0: 0.6}))
+        self.assertEqual(len(detections), 1)
+        np.testing.assert_allclose(detections[0]['bbox'], [160, 80, 192, 112])
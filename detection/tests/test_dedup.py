@@ -0,0 +1,32 @@
+from unittest import mock
+
+from .. import dedup
+from .helpers import DetectApiTestCase, encoded_image
+
+
+class DedupTests(DetectApiTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(dedup, '_index', dedup.NearDuplicateIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reuse_is_opt_in(self):
+        self.detect(encoded_image(640, 480))
+        response = self.detect(encoded_image(640, 480)).json()
+        self.assertFalse(response['dedup']['reused'])
+        self.assertEqual(self.service.runs, 2)
+
+    def test_near_duplicate_reused(self):
+        first = self.detect(encoded_image(640, 480), dedup=1).json()
+        second = self.detect(encoded_image(640, 480), dedup=1).json()
+        self.assertTrue(second['dedup']['reused'])
+        self.assertEqual(self.service.runs, 1)
+        self.assertEqual(second['onnx_detections'], first['onnx_detections'])
+
+    def test_other_size_not_reused(self):
+        # Same content at twice the size: the hashes match but the boxes would be half size
+        self.detect(encoded_image(640, 480), dedup=1)
+        response = self.detect(encoded_image(1280, 960), dedup=1).json()
+        self.assertFalse(response['dedup']['reused'])
+        self.assertEqual(response['onnx_detections'][0]['bbox'], [0.0, 0.0, 640.0, 480.0])
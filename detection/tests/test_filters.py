@@ -0,0 +1,61 @@
+import numpy as np
+from django.test import RequestFactory, SimpleTestCase
+
+from ..boxes import batched_nms
+from ..filters import DetectionFilter, InvalidFilter, filter_from_request
+
+
+class BatchedNmsTests(SimpleTestCase):
+    def test_classes_do_not_suppress_each_other(self):
+        # The unclipped negative box must not land on the other class after offsetting
+        boxes = np.array([[560, 560, 645, 645], [-80, -80, 10, 10]], dtype=np.float32)
+        keep = batched_nms(boxes, np.array([0.9, 0.8], dtype=np.float32), np.array([0, 1]), 0.45)
+        self.assertEqual(sorted(keep.tolist()), [0, 1])
+
+    def test_same_class_suppressed(self):
+        boxes = np.array([[-20, -20, 40, 40], [-18, -19, 41, 40], [100, 100, 150, 150]], dtype=np.float32)
+        keep = batched_nms(boxes, np.array([0.8, 0.9, 0.5], dtype=np.float32), np.array([2, 2, 2]), 0.45)
+        self.assertEqual(keep.tolist(), [1, 2])
+
+
+class FilterTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_parse_request(self):
+        request = self.factory.get('/', {'classes': '2,0', 'conf': '0.4', 'class_conf': '{"2": 0.1}'})
+        filters = filter_from_request(request)
+        self.assertEqual(filters.classes, [0, 2])
+        self.assertEqual(filters.confidence, 0.4)
+        self.assertEqual(filters.class_thresholds, {2: 0.1})
+        self.assertEqual(filters.min_confidence, 0.1)
+
+    def test_post_falls_back_to_query_string(self):
+        request = self.factory.post('/?classes=0&conf=0.3', {'conf': '0.6'})
+        filters = filter_from_request(request)
+        self.assertEqual(filters.classes, [0])
+        self.assertEqual(filters.confidence, 0.6)
+
+    def test_no_parameters(self):
+        self.assertIsNone(filter_from_request(self.factory.get('/')))
+
+    def test_invalid_parameters(self):
+        for params in ({'class_conf': '[0.5]'}, {'class_conf': '{'}, {'conf': 'high'}, {'roi': '[[[0, 0], [1, 1]]]'},
+                       {'classes': '-1'}, {'classes': '0,-2'}, {'class_conf': '{"-1": 0.9}'}):
+            with self.subTest(params=params), self.assertRaises(InvalidFilter):
+                filter_from_request(self.factory.get('/', params))
+        with self.assertRaises(InvalidFilter):
+            DetectionFilter(class_thresholds=[0.5])
+
+    def test_keep_mask(self):
+        filters = DetectionFilter(classes=[0, 1], class_thresholds={1: 0.6}, confidence=0.3,
+                                  rois=[[[0, 0], [0.5, 0], [0.5, 1], [0, 1]]])
+        boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 10], [0, 0, 10, 10], [80, 0, 90, 10]], dtype=np.float32)
+        scores = np.array([0.4, 0.5, 0.9, 0.9], dtype=np.float32)
+        class_ids = np.array([0, 1, 2, 0])
+        keep = filters.keep_mask(boxes, scores, class_ids, 100, 100, 3)
+        self.assertEqual(keep.tolist(), [True, False, False, False])
+
+    def test_round_trip(self):
+        filters = DetectionFilter(classes=[1], class_thresholds={1: 0.5}, rois=[[[0, 0], [1, 0], [1, 1]]])
+        self.assertEqual(DetectionFilter.from_dict(filters.to_dict()).to_dict(), filters.to_dict())
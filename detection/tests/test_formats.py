@@ -0,0 +1,32 @@
+import json
+
+import numpy as np
+
+from ..formats import from_columnar, to_columnar, unpack_binary
+from .helpers import DetectApiTestCase, FakeService, encoded_image
+
+
+class FormatTests(DetectApiTestCase):
+    def test_columnar_round_trip(self):
+        detections = FakeService().run_onnx_inference(np.zeros((480, 640, 3), dtype=np.uint8))
+        self.assertEqual(from_columnar(to_columnar(detections, precision=2)), detections)
+
+    def test_binary_body_and_json_headers(self):
+        response = self.detect(encoded_image(640, 480), format='binary')
+        self.assertEqual(response['Content-Type'], 'application/vnd.yolo.detections')
+        blocks = unpack_binary(response.content)
+        np.testing.assert_allclose(blocks['onnx_detections']['boxes'], [[0, 0, 320, 240]])
+        self.assertEqual(len(blocks['pytorch_detections']['scores']), 0)
+        self.assertEqual(json.loads(response['X-Detection-Dedup'])['reused'], False)
+        self.assertEqual(json.loads(response['X-Detection-Success']), True)
+
+    def test_filters_header(self):
+        response = self.detect(encoded_image(64, 48), format='binary', classes='0')
+        self.assertEqual(json.loads(response['X-Detection-Filters'])['classes'], [0])
+        self.assertEqual(response['X-Detection-Model'], 'fake')
+
+    def test_accept_header_and_unknown_format(self):
+        response = self.client.post('/detection/api/detect/', {'image': encoded_image(64, 48)},
+                                    HTTP_ACCEPT='application/vnd.yolo.columnar+json')
+        self.assertEqual(response.json()['onnx_detections']['boxes'], [0, 0, 32, 24])
+        self.assertEqual(self.detect(encoded_image(64, 48), format='xml').status_code, 406)
@@ -0,0 +1,63 @@
+import io
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.test import TransactionTestCase, override_settings
+
+from ..ingest import Checkpoint, Pipeline, PipelineError
+from ..models import DetectionResult
+from .helpers import FakeRegistry, FakeService, encoded_image
+
+
+class IngestTests(TransactionTestCase):
+    """Pipeline runs on a small folder; the writer thread needs real transactions"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.folder = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        patcher = mock.patch('detection.ingest.get_registry', return_value=FakeRegistry(FakeService()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for i in range(12):
+            (self.folder / f'{i:02d}.png').write_bytes(encoded_image(64, 48).read())
+
+    def pipeline(self, checkpoint=None, **options):
+        return Pipeline(self.folder, backend='pytorch', batch_size=2, workers=2, queue_size=1, commit_every=4,
+                        checkpoint=checkpoint, **options)
+
+    def test_resume_from_checkpoint(self):
+        path = self.folder / 'checkpoint.jsonl'
+        checkpoint = Checkpoint(path)
+        report = self.pipeline(checkpoint).run()
+        checkpoint.close()
+        self.assertEqual((report['images'], report['errors'], report['skipped']), (12, 0, 0))
+
+        checkpoint = Checkpoint(path)
+        report = self.pipeline(checkpoint).run()
+        checkpoint.close()
+        self.assertEqual((report['images'], report['skipped']), (0, 12))
+        self.assertEqual(DetectionResult.objects.count(), 12)
+
+    def test_writer_failure_raised(self):
+        with mock.patch.object(Pipeline, '_commit', side_effect=DatabaseError('disk I/O error')):
+            started = time.monotonic()
+            with self.assertRaisesRegex(PipelineError, 'write stage failed: disk I/O error'):
+                self.pipeline().run()
+        # Upstream stages blocked on the full queues must not hang the run
+        self.assertLess(time.monotonic() - started, 10)
+
+    def test_stage_failure_fails_command(self):
+        with mock.patch.object(Pipeline, '_infer', side_effect=RuntimeError('worker crashed')):
+            with self.assertRaisesRegex(CommandError, 'inference stage failed: worker crashed'):
+                call_command('detect_folder', str(self.folder), '--config', 'pytorch', '--batch-size', '2',
+                             '--queue-size', '1', stdout=io.StringIO())
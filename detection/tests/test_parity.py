@@ -0,0 +1,18 @@
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..parity import compare_image
+from .helpers import FakeRegistry, FakeService
+
+
+class ParityTests(SimpleTestCase):
+    def test_compare_image_bypasses_cache(self):
+        # A cached run would hand the candidate the reference's preprocessed tensor
+        service = FakeService()
+        image = np.zeros((48, 64, 3), dtype=np.uint8)
+        with mock.patch('detection.parity.get_registry', return_value=FakeRegistry(service)):
+            report = compare_image(image, {'backend': 'pytorch', 'model': 'fake'}, {'backend': 'onnx', 'model': 'fake'})
+        self.assertEqual((service.runs, service.cached_runs), (2, 0))
+        self.assertEqual(report['recall'], 1.0)
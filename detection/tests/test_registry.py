@@ -0,0 +1,48 @@
+from django.test import SimpleTestCase
+
+from ..registry import ModelRegistry
+
+
+class RegistryTests(SimpleTestCase):
+    def setUp(self):
+        models = {name: {'pytorch': f'{name}.pt'} for name in ('a', 'b', 'c')}
+        self.registry = ModelRegistry(models=models, default_model='a', memory_budget_mb=1)
+
+    def load(self, name, megabytes=0.6):
+        """Pretend the model's PyTorch backend loaded and report it like the service does"""
+        service = self.registry.get(name)
+        service._memory['pytorch'] = int(megabytes * 1024 * 1024)
+        service.pytorch_model = object()
+        self.registry._on_load(service, 'pytorch', service.memory_bytes(), 0.0)
+        return service
+
+    def test_least_recently_used_evicted_over_budget(self):
+        a = self.load('a')
+        self.load('b')
+        stats = self.registry.stats()
+        self.assertEqual(stats['lru_order'], ['b'])
+        self.assertEqual(stats['models']['a']['evictions'], 1)
+        self.assertIsNone(a.pytorch_model)
+        self.assertEqual(a.memory_bytes(), 0)
+
+    def test_use_refreshes_recency(self):
+        self.load('a', 0.4)
+        self.load('b', 0.4)
+        self.registry.get('a')
+        self.load('c', 0.4)
+        self.assertEqual(self.registry.stats()['lru_order'], ['a', 'c'])
+
+    def test_reload_through_old_reference_registers_again(self):
+        a = self.load('a')
+        self.load('b')
+        self.assertIs(self.registry.get('a'), a)
+        a._memory['pytorch'] = int(0.6 * 1024 * 1024)
+        self.registry._on_load(a, 'pytorch', a.memory_bytes(), 0.0)
+        self.assertEqual(self.registry.stats()['lru_order'], ['a'])
+        self.assertLessEqual(self.registry.resident_bytes(), self.registry.memory_budget)
+
+    def test_evict(self):
+        self.load('a')
+        self.assertTrue(self.registry.evict('a'))
+        self.assertFalse(self.registry.evict('a'))
+        self.assertEqual(self.registry.resident_bytes(), 0)
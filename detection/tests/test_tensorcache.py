@@ -0,0 +1,28 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..tensorcache import TensorCache
+
+
+class TensorCacheTests(SimpleTestCase):
+    def test_lru_eviction_by_bytes(self):
+        cache = TensorCache(max_bytes=3 * 400)
+        for name in 'abc':
+            cache.put(('tensor', name), np.zeros(100, dtype=np.float32))
+        cache.get(('tensor', 'a'))
+        cache.put(('tensor', 'd'), np.zeros(100, dtype=np.float32))
+        self.assertIsNone(cache.get(('tensor', 'b')))
+        self.assertIsNotNone(cache.get(('tensor', 'a')))
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['evictions']), (3, 1200, 1))
+
+    def test_cached_arrays_are_read_only(self):
+        cache = TensorCache(max_bytes=1024)
+        cache.put(('onnx', 'a'), np.zeros(4, dtype=np.float32))
+        with self.assertRaises(ValueError):
+            cache.get(('onnx', 'a'))[0] = 1
+
+    def test_oversized_value_not_cached(self):
+        cache = TensorCache(max_bytes=10)
+        cache.put(('tensor', 'a'), np.zeros(100, dtype=np.float32))
+        self.assertEqual(cache.stats()['entries'], 0)
@@ -0,0 +1,85 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..management.commands.detect_video import Command as DetectVideoCommand
+from ..tracking import KeyframeDetector, Tracker
+
+
+def detection(x, y, size=40, class_id=0):
+    return {'bbox': [x, y, x + size, y + size], 'confidence': 0.9, 'class_id': class_id,
+            'class_name': f'class_{class_id}'}
+
+
+class TrackerTests(SimpleTestCase):
+    def test_moving_object_keeps_its_id(self):
+        tracker = Tracker(iou_threshold=0.3, max_misses=2)
+        for step in range(6):
+            tracker.predict()
+            tracker.update([detection(100 + 5 * step, 100)])
+        track_id = tracker.tracks()[0]['track_id']
+        # Between keyframes the learned velocity keeps the box moving right
+        x_before = tracker.tracks()[0]['bbox'][0]
+        tracker.predict()
+        self.assertGreater(tracker.tracks()[0]['bbox'][0], x_before + 2)
+        self.assertEqual([t['track_id'] for t in tracker.tracks()], [track_id])
+
+    def test_other_class_starts_a_new_track(self):
+        tracker = Tracker(iou_threshold=0.3, max_misses=2)
+        tracker.update([detection(100, 100, class_id=0)])
+        motion = tracker.update([detection(100, 100, class_id=1)])
+        self.assertEqual((motion['matched'], motion['started']), (0, 1))
+        self.assertEqual([t['class_id'] for t in tracker.tracks()], [1])
+
+    def test_track_dropped_after_max_misses(self):
+        tracker = Tracker(iou_threshold=0.3, max_misses=2)
+        tracker.update([detection(100, 100)])
+        self.assertEqual([tracker.update([])['lost'] for _ in range(3)], [0, 0, 1])
+        self.assertEqual(len(tracker), 0)
+
+
+class KeyframeDetectorTests(SimpleTestCase):
+    def make(self, **options):
+        self.calls = 0
+
+        def detect(frame):
+            self.calls += 1
+            return [detection(100, 100)]
+
+        defaults = dict(interval=4, min_interval=1, max_interval=8, motion_threshold=0.02, scene_change_threshold=0.08)
+        return KeyframeDetector(detect, **dict(defaults, **options))
+
+    def test_static_scene_detects_on_keyframes_only(self):
+        detector = self.make()
+        frame = np.full((72, 128, 3), 80, dtype=np.uint8)
+        keyframes = [detector.process(frame)[1] for _ in range(20)]
+        self.assertTrue(keyframes[0])
+        self.assertEqual(self.calls, sum(keyframes))
+        self.assertLess(self.calls, 10)
+        # A calm scene stretches the interval
+        self.assertGreater(detector.interval, 4)
+        self.assertEqual(len(detector.process(frame)[0]), 1)
+
+    def test_scene_change_forces_keyframe(self):
+        detector = self.make(interval=8)
+        detector.process(np.zeros((72, 128, 3), dtype=np.uint8))
+        self.assertFalse(detector.process(np.zeros((72, 128, 3), dtype=np.uint8))[1])
+        self.assertTrue(detector.process(np.full((72, 128, 3), 255, dtype=np.uint8))[1])
+
+
+class DetectVideoTests(SimpleTestCase):
+    def test_output_fps_follows_source(self):
+        import cv2
+        folder = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        path = str(folder / 'source.mp4')
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 12, (64, 48))
+        for _ in range(3):
+            writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+        writer.release()
+        self.assertEqual(DetectVideoCommand.source_fps(cv2, path), 12)
+        # An unreadable source reports no rate and falls back to 30
+        self.assertEqual(DetectVideoCommand.source_fps(cv2, str(folder / 'missing.mp4')), 30)
@@ -0,0 +1,187 @@
+import itertools
+
+import numpy as np
+from django.conf import settings
+
+from .boxes import box_iou, cxcywh_to_xyxy, greedy_match, xyxy_to_cxcywh
+
+# Constant-velocity model over [cx, cy, w, h, vx, vy, vw, vh], one step per frame
+_F = np.eye(8)
+_F[:4, 4:] = np.eye(4)
+_H = np.eye(4, 8)
+
+
+class Tracker:
+    """IoU-associated Kalman box tracker, vectorized over all tracks
+
+    Detections feed update() on keyframes; predict() advances every track one
+    frame so boxes keep moving between keyframes.
+    """
+
+    def __init__(self, iou_threshold=None, max_misses=None):
+        self.iou_threshold = iou_threshold if iou_threshold is not None else settings.TRACKER_IOU_THRESHOLD
+        self.max_misses = max_misses if max_misses is not None else settings.TRACKER_MAX_MISSES
+        self.mean = np.zeros((0, 8))
+        self.cov = np.zeros((0, 8, 8))
+        self.track_ids = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+        self.meta = []  # per track: confidence, class_id, class_name
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def _noise(self, heights, position_scale, velocity_scale):
+        """Diagonal noise matrices scaled by each box's height"""
+        heights = np.maximum(heights, 1.0)
+        std = np.concatenate([
+            np.repeat((position_scale * heights)[:, None], 4, axis=1),
+            np.repeat((velocity_scale * heights)[:, None], 4, axis=1),
+        ], axis=1)
+        return np.einsum('ni,ij->nij', std ** 2, np.eye(8))
+
+    def predict(self):
+        """Advance all tracks by one frame"""
+        if not len(self):
+            return
+        q = self._noise(self.mean[:, 3], 1 / 20, 1 / 160)
+        self.mean = self.mean @ _F.T
+        self.cov = _F @ self.cov @ _F.T + q
+        # Boxes cannot shrink below a pixel
+        self.mean[:, 2:4] = np.maximum(self.mean[:, 2:4], 1.0)
+
+    def update(self, detections):
+        """Correct tracks with keyframe detections
+
+        Returns the mean normalized innovation of matched tracks (how far the
+        prediction was from the detection, relative to box size) and the
+        number of tracks started and lost, as a measure of scene motion.
+        """
+        boxes = np.array([d['bbox'] for d in detections], dtype=np.float64).reshape(-1, 4)
+        classes = np.array([d['class_id'] for d in detections], dtype=np.int64)
+
+        predicted = cxcywh_to_xyxy(self.mean[:, :4])
+        iou = box_iou(predicted, boxes).astype(np.float64)
+        if len(self):
+            track_classes = np.array([m['class_id'] for m in self.meta])
+            iou = np.where(track_classes[:, None] == classes[None, :], iou, 0.0)
+        pairs = greedy_match(iou, self.iou_threshold)
+
+        innovation = 0.0
+        if pairs:
+            track_idx, det_idx = (np.array(index) for index in zip(*pairs))
+            z = xyxy_to_cxcywh(boxes[det_idx])
+            mean = self.mean[track_idx]
+            cov = self.cov[track_idx]
+            r = self._noise(mean[:, 3], 1 / 20, 0)[:, :4, :4]
+            residual = z - mean @ _H.T
+            s = _H @ cov @ _H.T + r
+            gain = cov @ _H.T @ np.linalg.inv(s)
+            self.mean[track_idx] = mean + np.einsum('nij,nj->ni', gain, residual)
+            self.cov[track_idx] = (np.eye(8) - gain @ _H) @ cov
+            self.misses[track_idx] = 0
+            for t, d in zip(track_idx, det_idx):
+                self.meta[t] = self._meta(detections[d])
+            innovation = float(np.mean(np.abs(residual[:, :2]) / np.maximum(z[:, 3:4], 1.0)))
+
+        matched_tracks = {t for t, _ in pairs}
+        matched_dets = {d for _, d in pairs}
+        unmatched_tracks = [t for t in range(len(self)) if t not in matched_tracks]
+        self.misses[unmatched_tracks] += 1
+
+        new = [d for d in range(len(detections)) if d not in matched_dets]
+        if new:
+            self._start(boxes[new], [detections[d] for d in new])
+
+        keep = self.misses <= self.max_misses
+        lost = int((~keep).sum())
+        self.mean, self.cov = self.mean[keep], self.cov[keep]
+        self.track_ids, self.misses = self.track_ids[keep], self.misses[keep]
+        self.meta = [m for m, k in zip(self.meta, keep) if k]
+        return {'innovation': innovation, 'started': len(new), 'lost': lost, 'matched': len(pairs)}
+
+    def _start(self, boxes, detections):
+        z = xyxy_to_cxcywh(boxes)
+        mean = np.concatenate([z, np.zeros_like(z)], axis=1)
+        cov = self._noise(z[:, 3], 2 / 20, 10 / 160)
+        self.mean = np.concatenate([self.mean, mean])
+        self.cov = np.concatenate([self.cov, cov])
+        ids = np.array([next(self._ids) for _ in range(len(z))], dtype=np.int64)
+        self.track_ids = np.concatenate([self.track_ids, ids])
+        self.misses = np.concatenate([self.misses, np.zeros(len(z), dtype=np.int64)])
+        self.meta.extend(self._meta(d) for d in detections)
+
+    @staticmethod
+    def _meta(detection):
+        return {
+            'confidence': detection['confidence'],
+            'class_id': detection['class_id'],
+            'class_name': detection['class_name'],
+        }
+
+    def tracks(self):
+        """Currently confirmed tracks as detection dicts with a track_id"""
+        boxes = cxcywh_to_xyxy(self.mean[:, :4]).tolist()
+        return [
+            dict(meta, track_id=int(track_id), bbox=bbox)
+            for track_id, bbox, meta, misses in zip(self.track_ids, boxes, self.meta, self.misses)
+            if misses == 0
+        ]
+
+
+class KeyframeDetector:
+    """Runs the detector on keyframes only and tracks objects in between
+
+    The keyframe interval adapts to scene motion: it halves when tracks drift
+    from their predictions or objects appear/disappear, and grows by one
+    frame while the scene is calm. A large change in a downscaled frame
+    difference forces an immediate keyframe.
+    """
+
+    def __init__(self, detect, interval=None, min_interval=None, max_interval=None,
+                 motion_threshold=None, scene_change_threshold=None, tracker=None):
+        self.detect = detect
+        self.interval = interval or settings.VIDEO_KEYFRAME_INTERVAL
+        self.min_interval = min_interval or settings.VIDEO_MIN_KEYFRAME_INTERVAL
+        self.max_interval = max_interval or settings.VIDEO_MAX_KEYFRAME_INTERVAL
+        self.motion_threshold = motion_threshold or settings.VIDEO_MOTION_THRESHOLD
+        self.scene_change_threshold = scene_change_threshold or settings.VIDEO_SCENE_CHANGE_THRESHOLD
+        self.tracker = tracker or Tracker()
+        self.frames_since_keyframe = None
+        self.keyframe_thumbnail = None
+        self.frames = 0
+        self.keyframes = 0
+
+    def _thumbnail(self, frame):
+        import cv2
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+    def _adapt(self, motion, frames_elapsed):
+        per_frame = motion['innovation'] / max(frames_elapsed, 1)
+        if per_frame > self.motion_threshold or motion['started'] or motion['lost']:
+            self.interval = max(self.min_interval, self.interval // 2)
+        elif per_frame < self.motion_threshold / 4:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+    def process(self, frame):
+        """Return (tracks, is_keyframe) for the next video frame"""
+        self.frames += 1
+        self.tracker.predict()
+        thumbnail = self._thumbnail(frame)
+
+        keyframe = self.frames_since_keyframe is None or self.frames_since_keyframe + 1 >= self.interval
+        if not keyframe and self.keyframe_thumbnail is not None:
+            change = float(np.abs(thumbnail - self.keyframe_thumbnail).mean())
+            keyframe = change > self.scene_change_threshold
+
+        if keyframe:
+            frames_elapsed = (self.frames_since_keyframe or 0) + 1
+            motion = self.tracker.update(self.detect(frame))
+            self._adapt(motion, frames_elapsed)
+            self.keyframes += 1
+            self.frames_since_keyframe = 0
+            self.keyframe_thumbnail = thumbnail
+        else:
+            self.frames_since_keyframe += 1
+        return self.tracker.tracks(), keyframe
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import struct
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+# Bytes kept in memory while looking for the image dimensions
+SNIFF_LIMIT = 512 * 1024
+
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class UploadRejected(SkipFile):
+    """An uploaded file refused before it was fully received"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _sniff_jpeg(header):
+    """Walk JPEG segments up to the first start-of-frame marker"""
+    offset = 2
+    while offset + 4 <= len(header):
+        if header[offset] != 0xFF:
+            raise UploadRejected('Corrupt JPEG header.', status=415)
+        marker = header[offset + 1]
+        if marker == 0xFF:  # fill byte
+            offset += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # markers without a length
+            offset += 2
+            continue
+        length = struct.unpack('>H', header[offset + 2:offset + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(header):
+                return None
+            height, width = struct.unpack('>HH', header[offset + 5:offset + 9])
+            return 'jpeg', width, height
+        offset += 2 + length
+    return None
+
+
+def sniff_image(header):
+    """Return (format, width, height) from the leading bytes of an image
+
+    Returns None when more bytes are needed and raises UploadRejected for
+    data that is not a supported image.
+    """
+    if len(header) < 26:
+        return None
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        width, height = struct.unpack('>II', header[16:24])
+        return 'png', width, height
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        width, height = struct.unpack('<HH', header[6:10])
+        return 'gif', width, height
+    if header.startswith(b'\xff\xd8'):
+        return _sniff_jpeg(header)
+    raise UploadRejected('Please upload a valid image file (JPEG, PNG, GIF).', status=415)
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """Upload streamed into a temporary file inside MEDIA_ROOT
+
+    FileSystemStorage moves files that have a temporary path, so saving the
+    model renames this file into place instead of copying it.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        staging_dir = settings.UPLOAD_STAGING_DIR
+        os.makedirs(staging_dir, exist_ok=True)
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=staging_dir)
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = None
+        self.image_format = None
+        self.width = None
+        self.height = None
+
+
+class ImageAdmissionUploadHandler(FileUploadHandler):
+    """Streams uploads to disk while hashing them and checking the real image
+    format and pixel count from the header, before the body is buffered"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.staged = None
+        self.request_too_large = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # The multipart envelope adds a little overhead on top of the file itself
+        self.request_too_large = content_length > settings.UPLOAD_MAX_BYTES + 64 * 1024
+
+    def _record_rejection(self, message, status):
+        if self.staged is not None:
+            self.staged.close()
+            self.staged = None
+        rejection = UploadRejected(message, status)
+        if self.request is not None:
+            if not hasattr(self.request, 'upload_errors'):
+                self.request.upload_errors = {}
+            self.request.upload_errors[self.field_name] = rejection
+        return rejection
+
+    def _size_message(self):
+        return f'Image file size must be under {settings.UPLOAD_MAX_BYTES // (1024 * 1024)}MB.'
+
+    def _reject(self, message, status):
+        raise self._record_rejection(message, status)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.staged = None
+        if self.request_too_large:
+            self._reject(self._size_message(), 413)
+        self.staged = StagedUploadedFile(self.file_name, self.content_type, 0, self.charset,
+                                       self.content_type_extra)
+        self.hasher = hashlib.sha256()
+        self.header = b''
+        self.sniffed = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.staged is None:
+            return None
+        if start + len(raw_data) > settings.UPLOAD_MAX_BYTES:
+            self._reject(self._size_message(), 413)
+
+        if self.sniffed is None:
+            self.header += raw_data
+            try:
+                self.sniffed = sniff_image(self.header)
+            except UploadRejected as e:
+                self._reject(e.message, e.status)
+            if self.sniffed is not None:
+                image_format, width, height = self.sniffed
+                if image_format not in settings.UPLOAD_ALLOWED_FORMATS:
+                    self._reject('Please upload a valid image file (JPEG, PNG, GIF).', 415)
+                if width * height > settings.UPLOAD_MAX_PIXELS:
+                    self._reject(f'Image dimensions {width}x{height} exceed the '
+                                 f'{settings.UPLOAD_MAX_PIXELS} pixel limit.', 413)
+                self.header = b''
+            elif len(self.header) > SNIFF_LIMIT:
+                self._reject('Could not determine the image dimensions.', 415)
+
+        self.hasher.update(raw_data)
+        self.staged.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.staged is None:
+            return None
+        if self.sniffed is None:
+            # Too late to skip the file here; returning None leaves it out of request.FILES
+            self._record_rejection('Please upload a valid image file (JPEG, PNG, GIF).', 415)
+            return None
+        self.staged.seek(0)
+        self.staged.size = file_size
+        self.staged.sha256 = self.hasher.hexdigest()
+        self.staged.image_format, self.staged.width, self.staged.height = self.sniffed
+        return self.staged
+
+    def upload_interrupted(self):
+        if self.staged is not None:
+            self.staged.close()
@@ -8,4 +8,12 @@ urlpatterns = [
     path('result/<int:image_id>/', views.detection_result, name='detection_result'),
     path('api/detect/', views.api_detect, name='api_detect'),
     path('api/convert-model/', views.convert_model, name='convert_model'),
+    path('api/models/', views.model_stats, name='model_stats'),
+    path('api/presets/', views.filter_presets, name='filter_presets'),
+    path('api/admission/', views.admission_stats, name='admission_stats'),
+    path('api/cascade/', views.cascade_stats, name='cascade_stats'),
+    path('api/deadlines/', views.deadline_stats, name='deadline_stats'),
+    path('api/dedup/', views.dedup_stats, name='dedup_stats'),
+    path('api/tensor-cache/', views.tensor_cache_stats, name='tensor_cache_stats'),
+    path('api/memory/', views.memory_stats, name='memory_stats'),
 ] 
\ No newline at end of file
@@ -1,12 +1,26 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
+from django.contrib.admin.views.decorators import staff_member_required
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, quote_etag
+import gc
 import os
 import json
-from .models import UploadedImage, DetectionResult
-from .services import YOLOInferenceService
+from .models import UploadedImage, DetectionResult, FilterPreset, delete_uploads
+from .filters import DetectionFilter, InvalidFilter, filter_from_request
+from .formats import FORMATS, UnsupportedFormat, detection_response, negotiate_format
+from .admission import get_admission_controller, Overloaded
+from .registry import get_registry, UnknownModelError
+from .memory import get_memory_monitor, tracemalloc_snapshot
+from .dedup import get_dedup_index
+from .tensorcache import get_tensor_cache
+from .cascade import get_cascade
+from .deadlines import DeadlineExceeded, Deadline, deadline_from_request, get_deadline_stats
+from .services import load_image
 from .forms import ImageUploadForm
 
 
@@ -29,7 +43,8 @@ def index(request):
         else:
             print("No 'image' file found in request.FILES")
         
-        form = ImageUploadForm(request.POST, request.FILES)
+        form = ImageUploadForm(request.POST, request.FILES,
+                               upload_errors=getattr(request, 'upload_errors', None))
         print(f"Form is valid: {form.is_valid()}")
         
         if form.is_valid():
@@ -47,64 +62,201 @@ def index(request):
     return render(request, 'detection/index.html', {'form': form})
 
 
+def _result_stamp(request, image_id):
+    """(id, created_at) of the stored result for an image, fetched once per request"""
+    if not hasattr(request, '_result_stamp'):
+        request._result_stamp = (
+            DetectionResult.objects.filter(uploaded_image_id=image_id)
+            .order_by('id').values_list('id', 'created_at').first()
+        )
+    return request._result_stamp
+
+
+def _result_etag(request, image_id):
+    stamp = _result_stamp(request, image_id)
+    return f"result-{stamp[0]}" if stamp else None
+
+
+def _result_last_modified(request, image_id):
+    stamp = _result_stamp(request, image_id)
+    return stamp[1] if stamp else None
+
+
+def _cache_result_page(response, result_id, created_at):
+    """Mark a rendered result page as immutable for browsers and CDNs"""
+    response['ETag'] = quote_etag(f"result-{result_id}")
+    response['Last-Modified'] = http_date(created_at.timestamp())
+    patch_cache_control(response, public=True, max_age=settings.RESULT_PAGE_MAX_AGE)
+    return response
+
+
+@condition(etag_func=_result_etag, last_modified_func=_result_last_modified)
 def detection_result(request, image_id):
     """Display detection results"""
     try:
+        deadline = deadline_from_request(request, plan=_detection_plan())
+    except ValueError:
+        return render(request, 'detection/error.html', {'error': 'Invalid timeout'}, status=400)
+    try:
+        # Results never change once computed, so serve the rendered page from cache
+        stamp = _result_stamp(request, image_id)
+        if stamp:
+            html = cache.get(f"result-page:{stamp[0]}")
+            if html is not None:
+                return _cache_result_page(HttpResponse(html), *stamp)
+        
         uploaded_image = UploadedImage.objects.get(id=image_id)
-        detection_result = DetectionResult.objects.filter(uploaded_image=uploaded_image).first()
+        detection_result = DetectionResult.objects.filter(uploaded_image=uploaded_image).order_by('id').first()
         
         if not detection_result:
             # Run detection if not already done
-            detection_result = run_detection(uploaded_image)
+            with get_admission_controller().admit('interactive', timeout=deadline.remaining()):
+                detection_result = run_detection(uploaded_image, deadline=deadline)
         
         context = {
             'uploaded_image': uploaded_image,
             'detection_result': detection_result,
         }
-        return render(request, 'detection/result.html', context)
+        response = render(request, 'detection/result.html', context)
+        cache.set(f"result-page:{detection_result.id}", response.content, settings.RESULT_PAGE_CACHE_TIMEOUT)
+        return _cache_result_page(response, detection_result.id, detection_result.created_at)
     
     except UploadedImage.DoesNotExist:
         return render(request, 'detection/error.html', {'error': 'Image not found'})
+    except DeadlineExceeded:
+        return render(request, 'detection/error.html', {
+            'error': 'Detection took too long, please reload to try again'
+        }, status=504)
+    except Overloaded as e:
+        if deadline.expired:
+            deadline.cancel('queue')
+            return render(request, 'detection/error.html', {
+                'error': 'Detection took too long, please reload to try again'
+            }, status=504)
+        response = render(request, 'detection/error.html', {
+            'error': f'The server is busy, please retry in {e.retry_after} seconds'
+        }, status=429)
+        response['Retry-After'] = str(e.retry_after)
+        return response
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def api_detect(request):
-    """API endpoint for running detection"""
+    """API endpoint for running detection
+    
+    The X-Request-Timeout header (or ?timeout=) sets the request's deadline
+    in seconds; work still pending when it passes is cancelled with a 504.
+    """
+    try:
+        deadline = deadline_from_request(request, plan=_detection_plan())
+    except ValueError:
+        return JsonResponse({'error': 'timeout must be a non-negative number of seconds'}, status=400)
     try:
         if 'image' not in request.FILES:
+            rejection = getattr(request, 'upload_errors', {}).get('image')
+            if rejection is not None:
+                return JsonResponse({'error': rejection.message}, status=rejection.status)
             return JsonResponse({'error': 'No image provided'}, status=400)
         
-        # Save uploaded image
-        uploaded_image = UploadedImage.objects.create(
-            image=request.FILES['image']
-        )
+        # Resolve the requested model before storing anything
+        try:
+            model_name = get_registry().resolve(request.POST.get('model') or request.GET.get('model'))
+        except UnknownModelError as e:
+            return JsonResponse({
+                'error': f'Unknown model: {e.args[0]}',
+                'available_models': list(get_registry().models),
+            }, status=400)
         
-        # Run detection
-        detection_result = run_detection(uploaded_image)
+        try:
+            response_format = negotiate_format(request)
+            precision = request.POST.get('precision') or request.GET.get('precision')
+            precision = int(precision) if precision is not None else None
+        except UnsupportedFormat as e:
+            return JsonResponse({'error': str(e), 'formats': list(FORMATS)}, status=406)
+        except ValueError:
+            return JsonResponse({'error': 'precision must be an integer'}, status=400)
+        
+        try:
+            filters = filter_from_request(request)
+        except InvalidFilter as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        dedup = (request.POST.get('dedup') or request.GET.get('dedup') or '0') not in ('0', 'false', 'no')
+        cascade = (request.POST.get('cascade') or request.GET.get('cascade') or '0') not in ('0', 'false', 'no')
+        if cascade and (request.POST.get('model') or request.GET.get('model')):
+            return JsonResponse({'error': 'model and cascade cannot be combined; the cascade runs CASCADE_STAGES'},
+                                status=400)
+        
+        # Wait for an inference slot before storing anything, so shed requests cost nothing
+        with get_admission_controller().admit('bulk', timeout=deadline.remaining()):
+            # Save uploaded image
+            uploaded_image = UploadedImage.objects.create(
+                image=request.FILES['image']
+            )
+            
+            # Run detection
+            try:
+                detection_result = run_detection(uploaded_image, model_name=model_name, filters=filters,
+                                                 dedup=dedup, cascade=cascade, deadline=deadline)
+            except DeadlineExceeded:
+                # The client gets no image id, so keep nothing of the request
+                delete_uploads([uploaded_image.id])
+                raise
         
         # Return results
         response_data = {
             'success': True,
             'image_id': uploaded_image.id,
+            'model': 'cascade' if cascade else model_name,
+            'cascade': detection_result.cascade if cascade else None,
+            'filters': filters.to_dict() if filters is not None else None,
+            'dedup': dict(detection_result.dedup, saved_inferences=get_dedup_index().stats()['saved_inferences']),
             'pytorch_detections': detection_result.pytorch_detections,
             'onnx_detections': detection_result.onnx_detections,
             'pytorch_result_url': detection_result.pytorch_result_image.url if detection_result.pytorch_result_image else None,
             'onnx_result_url': detection_result.onnx_result_image.url if detection_result.onnx_result_image else None,
         }
         
-        return JsonResponse(response_data)
+        return detection_response(response_data, ('pytorch_detections', 'onnx_detections'),
+                                  response_format, precision)
     
+    except DeadlineExceeded as e:
+        return JsonResponse({'error': str(e), 'stage': e.stage}, status=504)
+    except Overloaded as e:
+        if deadline.expired:
+            # The deadline ran out while queued for a slot
+            e = deadline.cancel('queue')
+            return JsonResponse({'error': str(e), 'stage': e.stage}, status=504)
+        response = JsonResponse({'error': str(e), 'retry_after': e.retry_after}, status=429)
+        response['Retry-After'] = str(e.retry_after)
+        return response
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
-def run_detection(uploaded_image):
-    """Run detection on uploaded image"""
+def _detection_plan():
+    """Stage names run_detection goes through, for deadline accounting"""
+    plan = ['decode']
+    if 'pytorch' in settings.INFERENCE_BACKENDS:
+        plan += ['pytorch', 'pytorch_draw']
+    return plan + ['onnx', 'onnx_draw', 'save']
+
+
+def run_detection(uploaded_image, model_name=None, filters=None, dedup=False, cascade=False, deadline=None):
+    """Run detection on uploaded image, optionally with a DetectionFilter
+    
+    With dedup, a near-identical recent frame's detections are reused; with
+    cascade, each backend runs the CASCADE_STAGES models instead of one.
+    With a Deadline, stages are skipped (and ONNX runs terminated) once it
+    passes, raising DeadlineExceeded with nothing saved.
+    """
     print(f"Starting detection for image: {uploaded_image.id}")
+    deadline = deadline or Deadline(plan=_detection_plan())
+    written = []
     
     try:
-        service = YOLOInferenceService()
+        service = get_registry().get(model_name)
+        print(f"Using model: {service.name}")
         
         # Get image path
         image_path = uploaded_image.image.path
@@ -126,67 +278,141 @@ def run_detection(uploaded_image):
         
         # Generate output filenames
         base_filename = os.path.splitext(uploaded_image.get_filename())[0]
+        if cascade:
+            base_filename = f"{base_filename}_cascade"
+        elif service.name != get_registry().default_model:
+            # Keep result files of other models apart: result media is served as immutable
+            base_filename = f"{base_filename}_{service.name}"
         pytorch_output = os.path.join(pytorch_dir, f"{base_filename}_pytorch_result.jpg")
         onnx_output = os.path.join(onnx_dir, f"{base_filename}_onnx_result.jpg")
         
         print(f"Will save results to: {pytorch_output}, {onnx_output}")
         
+        # Decode once and share the array between both backends and drawing
+        with deadline.stage('decode'):
+            image = load_image(image_path)
+        
+        # Reuse the detections of a recent near-identical frame (fixed cameras)
+        reused = fingerprint = None
+        if dedup and settings.DEDUP_ENABLED:
+            # The hashes are scale-invariant, but the reused boxes are in the source's pixels
+            dedup_key = ('cascade' if cascade else service.name, tuple(settings.INFERENCE_BACKENDS),
+                         json.dumps(filters.to_dict(), sort_keys=True) if filters is not None else None,
+                         image.shape[:2])
+            inferences = 1 + ('pytorch' in settings.INFERENCE_BACKENDS)
+            reused, fingerprint = get_dedup_index().lookup(dedup_key, image, inferences=inferences)
+            if reused:
+                print(f"Near-duplicate of result {reused[0]['result_id']} (distance {reused[1]}), reusing detections")
+                deadline.plan = [stage for stage in deadline.plan if stage not in ('pytorch', 'onnx')]
+        
+        cascade_reports = {}
+        
+        def infer(backend):
+            with deadline.stage(backend):
+                if cascade:
+                    detections, cascade_reports[backend] = get_cascade().run(image, backend, filters=filters,
+                                                                             deadline=deadline)
+                    return detections
+                if backend == 'pytorch':
+                    return service.run_pytorch_inference(image, filters=filters)
+                return service.run_onnx_inference(image, filters=filters, deadline=deadline)
+        
         # Run PyTorch inference
-        print("Running PyTorch inference...")
-        pytorch_detections, pytorch_results = service.run_pytorch_inference(image_path)
-        print(f"PyTorch detections: {len(pytorch_detections)} objects found")
-        
-        # Draw PyTorch results
-        if pytorch_detections:
-            service.draw_detections(image_path, pytorch_detections, pytorch_output)
-            pytorch_result_image = f"results/pytorch/{base_filename}_pytorch_result.jpg"
-            print(f"PyTorch result saved to: {pytorch_result_image}")
+        pytorch_detections = []
+        pytorch_result_image = None
+        if 'pytorch' in settings.INFERENCE_BACKENDS:
+            if reused:
+                pytorch_detections = reused[0]['pytorch_detections']
+            else:
+                print("Running PyTorch inference...")
+                pytorch_detections = infer('pytorch')
+            print(f"PyTorch detections: {len(pytorch_detections)} objects found")
+            
+            # Draw PyTorch results
+            if pytorch_detections:
+                with deadline.stage('pytorch_draw'):
+                    written.append(pytorch_output)
+                    service.draw_detections(image, pytorch_detections, pytorch_output)
+                pytorch_result_image = f"results/pytorch/{base_filename}_pytorch_result.jpg"
+                print(f"PyTorch result saved to: {pytorch_result_image}")
+            else:
+                print("No PyTorch detections to save")
         else:
-            pytorch_result_image = None
-            print("No PyTorch detections to save")
+            print("PyTorch backend disabled, skipping")
         
         # Run ONNX inference
         onnx_detections = []
         onnx_result_image = None
+        onnx_failed = False
         try:
-            print("Running ONNX inference...")
-            onnx_detections = service.run_onnx_inference(image_path)
+            if reused:
+                onnx_detections = reused[0]['onnx_detections']
+            else:
+                print("Running ONNX inference...")
+                onnx_detections = infer('onnx')
             print(f"ONNX detections: {len(onnx_detections)} objects found")
             
             # Draw ONNX results
             if onnx_detections:
-                service.draw_detections(image_path, onnx_detections, onnx_output)
+                with deadline.stage('onnx_draw'):
+                    written.append(onnx_output)
+                    service.draw_detections(image, onnx_detections, onnx_output)
                 onnx_result_image = f"results/onnx/{base_filename}_onnx_result.jpg"
                 print(f"ONNX result saved to: {onnx_result_image}")
             else:
                 print("No ONNX detections to save")
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"ONNX inference failed: {e}")
+            onnx_failed = True
             onnx_detections = []
             onnx_result_image = None
         
         # Save results to database
         print("Saving results to database...")
-        detection_result = DetectionResult.objects.create(
-            uploaded_image=uploaded_image,
-            pytorch_detections=pytorch_detections,
-            onnx_detections=onnx_detections
-        )
-        
-        # Save result images if they exist
-        if pytorch_result_image and os.path.exists(pytorch_output):
-            # Save the relative path from MEDIA_ROOT
-            detection_result.pytorch_result_image = pytorch_result_image
-        
-        if onnx_result_image and os.path.exists(onnx_output):
-            # Save the relative path from MEDIA_ROOT  
-            detection_result.onnx_result_image = onnx_result_image
-        
-        detection_result.save()
+        with deadline.stage('save'):
+            detection_result = DetectionResult.objects.create(
+                uploaded_image=uploaded_image,
+                pytorch_detections=pytorch_detections,
+                onnx_detections=onnx_detections,
+                reused_from_id=reused[0]['result_id'] if reused else None,
+            )
+            
+            # Save result images if they exist
+            if pytorch_result_image and os.path.exists(pytorch_output):
+                # Save the relative path from MEDIA_ROOT
+                detection_result.pytorch_result_image = pytorch_result_image
+            
+            if onnx_result_image and os.path.exists(onnx_output):
+                # Save the relative path from MEDIA_ROOT  
+                detection_result.onnx_result_image = onnx_result_image
+            
+            detection_result.save()
         print(f"Detection result saved with ID: {detection_result.id}")
         
+        if fingerprint is not None and not reused and not onnx_failed:
+            get_dedup_index().add(dedup_key, fingerprint, {
+                'result_id': detection_result.id,
+                'pytorch_detections': pytorch_detections,
+                'onnx_detections': onnx_detections,
+            })
+        detection_result.cascade = cascade_reports
+        detection_result.dedup = {
+            'reused': bool(reused),
+            'source_result_id': reused[0]['result_id'] if reused else None,
+            'distance': reused[1] if reused else None,
+        }
+        
         return detection_result
         
+    except DeadlineExceeded as e:
+        print(f"Cancelled detection for image {uploaded_image.id}: {e}")
+        # Drop result images drawn for a response nobody will get
+        for path in written:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
     except Exception as e:
         print(f"ERROR in run_detection: {str(e)}")
         import traceback
@@ -194,15 +420,100 @@ def run_detection(uploaded_image):
         raise
 
 
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def filter_presets(request):
+    """List saved filter presets, or create one from a JSON body"""
+    if request.method == 'GET':
+        presets = FilterPreset.objects.order_by('id')
+        return JsonResponse({'presets': [
+            {'id': p.id, 'name': p.name, 'camera': p.camera, 'filters': p.filters} for p in presets
+        ]})
+    
+    try:
+        data = json.loads(request.body)
+        name = data['name']
+        # Validate and normalize before storing
+        detection_filter = DetectionFilter.from_dict(data.get('filters') or {})
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return JsonResponse({'error': f'Invalid preset: {e}'}, status=400)
+    
+    preset = FilterPreset.objects.create(
+        name=name,
+        camera=data.get('camera', ''),
+        filters=detection_filter.to_dict(),
+    )
+    return JsonResponse({'id': preset.id, 'name': preset.name, 'camera': preset.camera,
+                         'filters': preset.filters}, status=201)
+
+
+def admission_stats(request):
+    """Inference admission control: in-flight, queued, shed and queue-wait counters"""
+    return JsonResponse(get_admission_controller().stats())
+
+
+@staff_member_required
+def memory_stats(request):
+    """Worker memory: RSS, per-view RSS deltas and, with ?top=N, tracemalloc top allocations
+    
+    The first ?top= call starts tracemalloc; add compare=1 for growth since then,
+    key=lineno|filename|traceback to group differently and gc=1 to collect first.
+    """
+    if request.GET.get('gc'):
+        gc.collect()
+    data = get_memory_monitor().stats()
+    if request.GET.get('top'):
+        key_type = request.GET.get('key', 'lineno')
+        if key_type not in ('lineno', 'filename', 'traceback'):
+            return JsonResponse({'error': 'key must be lineno, filename or traceback'}, status=400)
+        try:
+            limit = int(request.GET['top'])
+        except ValueError:
+            return JsonResponse({'error': 'top must be an integer'}, status=400)
+        data['tracemalloc'] = tracemalloc_snapshot(limit, key_type, compare=bool(request.GET.get('compare')))
+    return JsonResponse(data)
+
+
+def deadline_stats(request):
+    """Request deadlines: cancellations per stage, terminated ONNX runs and time saved"""
+    return JsonResponse(get_deadline_stats().stats())
+
+
+def cascade_stats(request):
+    """Model cascade: escalation rate and reasons, latency against the largest model, agreement"""
+    return JsonResponse(get_cascade().stats())
+
+
+def tensor_cache_stats(request):
+    """Tensor cache: entries, bytes, evictions and hit rates per kind (tensors, raw outputs)"""
+    return JsonResponse(get_tensor_cache().stats())
+
+
+def dedup_stats(request):
+    """Near-duplicate reuse: index size, lookups, hits and saved inferences"""
+    return JsonResponse(get_dedup_index().stats())
+
+
+def model_stats(request):
+    """Registry statistics: loaded models, memory use, loads and hits"""
+    return JsonResponse(get_registry().stats())
+
+
 def convert_model(request):
-    """Convert PyTorch model to ONNX"""
+    """Convert PyTorch model to ONNX (embed_nms=1 appends decoding and NMS to the graph)"""
     try:
-        service = YOLOInferenceService()
-        onnx_path = service.convert_to_onnx()
+        service = get_registry().get(request.GET.get('model'))
+        embed_nms = request.GET.get('embed_nms')
+        onnx_path = service.convert_to_onnx(embed_nms=embed_nms not in ('0', 'false', 'no') if embed_nms else None)
         return JsonResponse({
             'success': True,
             'message': f'Model converted successfully to {onnx_path}'
         })
+    except UnknownModelError as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Unknown model: {e.args[0]}'
+        }, status=400)
     except Exception as e:
         return JsonResponse({
             'success': False,
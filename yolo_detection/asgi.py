@@ -2,6 +2,8 @@
 ASGI config for yolo_detection project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; WebSocket connections go to the live detection stream
+(served with e.g. ``uvicorn yolo_detection.asgi:application``).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +15,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yolo_detection.settings')
 
-application = get_asgi_application() 
\ No newline at end of file
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from detection.streaming import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send) 
\ No newline at end of file
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'detection.middleware.MemoryUsageMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -35,6 +36,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'detection.middleware.MediaCacheControlMiddleware',
 ]
 
 ROOT_URLCONF = 'yolo_detection.urls'
@@ -101,15 +103,148 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# File upload settings
+# File upload settings: uploads stream to a staging file inside MEDIA_ROOT while
+# their real format and dimensions are checked, then get renamed into place
 FILE_UPLOAD_HANDLERS = [
-    'django.core.files.uploadhandler.MemoryFileUploadHandler',
-    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+    'detection.uploadhandlers.ImageAdmissionUploadHandler',
 ]
+UPLOAD_STAGING_DIR = MEDIA_ROOT / 'uploads' / '.incoming'
+UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+UPLOAD_MAX_PIXELS = 40_000_000
+UPLOAD_ALLOWED_FORMATS = ['jpeg', 'png', 'gif']
 
 # Maximum file upload size (10MB)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
 
 # Model paths
 YOLO_MODEL_PATH = BASE_DIR / 'yolo11n.pt'
-ONNX_MODEL_PATH = BASE_DIR / 'yolo11n.onnx' 
\ No newline at end of file
+ONNX_MODEL_PATH = BASE_DIR / 'yolo11n.onnx' 
+# Model registry: name -> weights. Models are loaded lazily on first use and the
+# least recently used ones are unloaded once MODEL_MEMORY_BUDGET_MB is exceeded.
+# Custom-trained weights can be added here; the ONNX path defaults to the .pt
+# path with an .onnx suffix when omitted.
+YOLO_MODELS = {
+    'yolo11n': {'pytorch': YOLO_MODEL_PATH, 'onnx': ONNX_MODEL_PATH},
+    'yolo11s': {'pytorch': BASE_DIR / 'yolo11s.pt', 'onnx': BASE_DIR / 'yolo11s.onnx'},
+    'yolo11m': {'pytorch': BASE_DIR / 'yolo11m.pt', 'onnx': BASE_DIR / 'yolo11m.onnx'},
+}
+YOLO_DEFAULT_MODEL = 'yolo11n'
+
+# Memory budget for all loaded models together (0 disables LRU unloading)
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('MODEL_MEMORY_BUDGET_MB', 2048))
+
+# PyTorch inference tuning (TORCH_NUM_THREADS=0 keeps the torch default)
+TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', 0))
+TORCH_INFERENCE_MODE = os.environ.get('TORCH_INFERENCE_MODE', 'true').lower() in ('1', 'true', 'yes')
+TORCH_FUSE = os.environ.get('TORCH_FUSE', 'true').lower() in ('1', 'true', 'yes')
+
+# Inference admission control: concurrent inference slots, plus per-priority
+# wait-queue lengths and wait timeouts (seconds) before a request is shed with 429
+INFERENCE_MAX_CONCURRENCY = int(os.environ.get('INFERENCE_MAX_CONCURRENCY', 2))
+INFERENCE_QUEUE_LIMITS = {'interactive': 16, 'bulk': 8, 'stream': 4}
+# A live frame that waited longer than a second is stale anyway
+INFERENCE_QUEUE_TIMEOUTS = {'interactive': 30, 'bulk': 10, 'stream': 1}
+
+# Decimal places kept by the columnar/msgpack detection formats (overridable
+# per request with precision=)
+COLUMNAR_BOX_PRECISION = 1
+COLUMNAR_SCORE_PRECISION = 3
+
+# HTTP caching: detection results never change once computed, so result pages
+# are cached server-side and, like media files, marked cacheable for clients/CDNs
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yolo-detection',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    }
+}
+RESULT_PAGE_CACHE_TIMEOUT = 24 * 60 * 60
+RESULT_PAGE_MAX_AGE = 24 * 60 * 60
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+# Media serving: 'sendfile' (FileResponse, sendfile-capable WSGI servers),
+# 'x-accel-redirect' (nginx, see deploy/nginx.conf), 'x-sendfile' (Apache/lighttpd)
+# or 'off' when the front-end server serves MEDIA_URL directly
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'sendfile')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Enabled inference backends ('full' = both). An ONNX-only deployment (INFERENCE_BACKENDS=onnx,
+# requirements-onnx.txt) runs without torch or ultralytics installed, provided
+# the .onnx files already exist.
+INFERENCE_BACKENDS = os.environ.get('INFERENCE_BACKENDS', 'full')
+INFERENCE_BACKENDS = ['pytorch', 'onnx'] if INFERENCE_BACKENDS == 'full' else INFERENCE_BACKENDS.split(',')
+
+# Live detection stream (WebSocket, ASGI only)
+DETECTION_STREAM_PATH = '/ws/detect/'
+DETECTION_STREAM_MAX_FRAME_BYTES = 4 * 1024 * 1024
+
+# Video pipeline: detect on keyframes, track in between. The keyframe interval
+# adapts between the min and max to scene motion (normalized box drift per frame)
+VIDEO_KEYFRAME_INTERVAL = 5
+VIDEO_MIN_KEYFRAME_INTERVAL = 1
+VIDEO_MAX_KEYFRAME_INTERVAL = 15
+VIDEO_MOTION_THRESHOLD = 0.02
+VIDEO_SCENE_CHANGE_THRESHOLD = 0.08
+TRACKER_IOU_THRESHOLD = 0.3
+TRACKER_MAX_MISSES = 2
+
+# Detection decoding defaults (filters from api_detect or presets can tighten them)
+DETECTION_CONFIDENCE_THRESHOLD = 0.25
+DETECTION_NMS_IOU_THRESHOLD = 0.45
+DETECTION_MAX_DETECTIONS = 300
+
+# Memory instrumentation and worker recycling. A worker that has served
+# WORKER_MAX_REQUESTS requests or grown past WORKER_MAX_RSS_MB sends itself
+# WORKER_RECYCLE_SIGNAL after its response (0 disables a limit). Only enable
+# these under a process manager that restarts workers (gunicorn, uWSGI).
+WORKER_MAX_REQUESTS = int(os.environ.get('WORKER_MAX_REQUESTS', 0))
+WORKER_MAX_RSS_MB = int(os.environ.get('WORKER_MAX_RSS_MB', 0))
+WORKER_RECYCLE_SIGNAL = 'SIGTERM'
+MEMORY_LOG_DELTA_MB = 50
+MEMORY_TRACEMALLOC_FRAMES = 10
+
+# Near-duplicate reuse: a frame whose dHash is within DEDUP_MAX_DISTANCE bits of a
+# recent one (and whose 32x32 thumbnail differs by at most DEDUP_RECHECK_THRESHOLD
+# mean absolute intensity, 0 disables the recheck) and has the same size reuses that
+# frame's detections. Requests opt in with dedup=1; DEDUP_ENABLED=false turns it off for all
+DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+DEDUP_MAX_DISTANCE = 4
+DEDUP_RECHECK_THRESHOLD = 0.02
+DEDUP_MAX_ENTRIES = 4096
+DEDUP_TTL_SECONDS = 60
+
+# Inference autotuning: profiles of the fastest ORT/torch configuration are stored
+# per host fingerprint and model. 'apply' uses a saved profile (manage.py autotune),
+# 'auto' also tunes on the first ONNX load when there is none, 'off' ignores them.
+AUTOTUNE = os.environ.get('AUTOTUNE', 'apply')
+AUTOTUNE_PROFILE_PATH = BASE_DIR / 'autotune_profiles.json'
+AUTOTUNE_CALIBRATION_IMAGE = os.environ.get('AUTOTUNE_CALIBRATION_IMAGE') or None
+AUTOTUNE_RUNS = 5
+AUTOTUNE_BATCH_SIZES = [1, 2, 4, 8]
+
+# Model cascade (api_detect cascade=1): run the first model and escalate to the next
+# when CASCADE_MIN_UNCERTAIN detections fall in the uncertain confidence band or
+# the scene has CASCADE_DENSE_COUNT detections. CASCADE_AUDIT_RATE of accepted
+# images also run the last model to measure the accuracy given up.
+CASCADE_STAGES = ['yolo11n', 'yolo11m']
+CASCADE_UNCERTAIN_BAND = (0.25, 0.5)
+CASCADE_MIN_UNCERTAIN = 1
+CASCADE_DENSE_COUNT = 20
+CASCADE_AUDIT_RATE = 0.05
+
+# Export ONNX models with decoding and NMS in the graph, so session.run returns
+# final boxes (thresholds are fed at run time). Existing exports are upgraded by
+# /detection/api/convert-model/?embed_nms=1 without needing PyTorch.
+ONNX_EMBED_NMS = os.environ.get('ONNX_EMBED_NMS', 'false').lower() in ('1', 'true', 'yes')
+
+# Request deadlines: detection work still pending when a request's deadline passes
+# is skipped and in-flight ONNX runs are terminated (504). Clients set it with the
+# X-Request-Timeout header or ?timeout= (seconds), capped at DETECTION_MAX_TIMEOUT.
+DETECTION_DEFAULT_TIMEOUT = float(os.environ.get('DETECTION_DEFAULT_TIMEOUT', 30))
+DETECTION_MAX_TIMEOUT = 120
+
+# Tensor cache: preprocessed inputs and raw model outputs by image hash, model and
+# resolution, so re-running an image with other filters only repeats postprocessing.
+# An ONNX input tensor is ~4.9 MB and a raw output ~2.8 MB (0 disables the cache).
+TENSOR_CACHE_MAX_MB = int(os.environ.get('TENSOR_CACHE_MAX_MB', 256))
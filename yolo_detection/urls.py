@@ -2,10 +2,11 @@
 URL configuration for yolo_detection project.
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import redirect
+from detection.media import serve_media
 
 def root_redirect(request):
     return redirect('detection:index')
@@ -16,7 +17,13 @@ urlpatterns = [
     path('detection/', include('detection.urls')),
 ]
 
-# Serve media files during development
+# Serve media files; MEDIA_SERVE_MODE decides whether the bytes go through
+# sendfile or are handed off to the front-end server
+if settings.MEDIA_SERVE_MODE != 'off':
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+    ]
+
+# Serve static files during development
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) 
\ No newline at end of file